@@ -0,0 +1,360 @@
+# -*- coding: utf-8 -*-
+"""
+Module to optimise the GridCon system on typical days instead of the full year.
+
+The days of the profile are clustered into representative days which are
+weighted by the number of days they stand for. The days on which the machine
+load, the PV generation or the net load reach their extremes are kept as
+periods of their own, because they set the size of the grid connection. The
+state of charge of the storage is linked across the original sequence of days
+so that energy can still be shifted from one day to another.
+"""
+
+##################################################################################
+# IMPORTS
+##################################################################################
+
+import logging
+
+import numpy as np
+import pandas as pd
+from pyomo import environ
+
+import GridCon_storage_171221d as gridcon
+
+##################################################################################
+# CLUSTERING OF DAYS
+##################################################################################
+
+def _kmeans_medoid_days(features, n_clusters, seed=0, max_iterations=100):
+
+    # k-means clustering (k-means++ initialisation, Lloyd iterations) of the
+    # rows of "features"; each cluster is represented by the real day closest
+    # to its centroid instead of the centroid, so that no peak is smoothed
+    # away (the centroids are means, not medoids);
+    # returns the row indices of the representative days and the cluster of
+    # each row;
+
+    rng = np.random.RandomState(seed)
+    n_rows = len(features)
+    centroids = [features[rng.randint(n_rows)]]
+    for _ in range(1, n_clusters):
+        distance = np.min([((features - c) ** 2).sum(axis=1)
+                           for c in centroids], axis=0)
+        if distance.sum() == 0:
+            centroids.append(features[rng.randint(n_rows)])
+        else:
+            centroids.append(
+                features[rng.choice(n_rows, p=distance / distance.sum())])
+    centroids = np.array(centroids)
+
+    labels = None
+    for _ in range(max_iterations):
+        distance = ((features[:, None, :] - centroids[None, :, :]) ** 2).sum(
+            axis=2)
+        new_labels = distance.argmin(axis=1)
+        if labels is not None and np.array_equal(labels, new_labels):
+            break
+        labels = new_labels
+        for k in range(n_clusters):
+            if np.any(labels == k):
+                centroids[k] = features[labels == k].mean(axis=0)
+
+    closest = np.empty(n_clusters, dtype=int)
+    for k in range(n_clusters):
+        members = np.flatnonzero(labels == k)
+        if len(members) == 0:
+            members = np.arange(n_rows)
+        closest[k] = members[((features[members] - centroids[k]) ** 2).sum(
+            axis=1).argmin()]
+    return closest, labels
+
+
+def extreme_periods(data, period_length=96):
+
+    """
+    periods containing the extremes that size the grid connection
+
+    parameters
+    ----------
+    data : pandas.DataFrame
+        profile with the columns "demand_el", "machine_load" and "pv"
+    period_length : int
+        number of timesteps per period (96 for days of 15 minutes timesteps)
+
+    returns
+    -------
+    list of int
+        sorted indices of the periods with the maximum machine load, the
+        maximum PV generation, the maximum net load and the maximum net
+        feed-in
+
+    """
+
+    n_periods = len(data) // period_length
+    net_load = (data['demand_el'] + data['machine_load'] - data['pv']).values
+    candidates = [data['machine_load'].values, data['pv'].values,
+                  net_load, -net_load]
+    return sorted(set(int(np.argmax(c[:n_periods * period_length]))
+                      // period_length for c in candidates))
+
+
+def typical_periods(data, n_periods=12, period_length=96, seed=0):
+
+    """
+    clusters the periods (days) of a profile into representative periods
+
+    parameters
+    ----------
+    data : pandas.DataFrame
+        profile with the columns "demand_el", "machine_load" and "pv"; its
+        length must be a multiple of period_length
+    n_periods : int
+        number of representative periods including the extreme periods
+    period_length : int
+        number of timesteps per period
+    seed : int
+        seed of the random initialisation of the clustering
+
+    returns
+    -------
+    aggregated : pandas.DataFrame
+        the representative periods one after another
+    weights : numpy.ndarray
+        number of original periods represented by each representative period
+    sequence : numpy.ndarray
+        index of the representative period of each original period
+
+    """
+
+    if len(data) % period_length:
+        raise ValueError('Number of timesteps ({0}) is not a multiple of the '
+                         'period length ({1})'.format(len(data), period_length))
+    columns = ['demand_el', 'machine_load', 'pv']
+    n_original = len(data) // period_length
+
+    extremes = extreme_periods(data, period_length)
+    if n_periods <= len(extremes) or n_periods >= n_original:
+        raise ValueError('n_periods must be between {0} and {1}'.format(
+            len(extremes) + 1, n_original - 1))
+
+    # every column is scaled to its maximum so that all of them contribute to
+    # the distance between days;
+
+    values = data[columns].values.astype(float)
+    scale = np.abs(values).max(axis=0)
+    scale[scale == 0] = 1
+    features = np.concatenate(
+        [(values[:, j] / scale[j]).reshape(n_original, period_length)
+         for j in range(len(columns))], axis=1)
+
+    ordinary = np.setdiff1d(np.arange(n_original), extremes)
+    closest, labels = _kmeans_medoid_days(
+        features[ordinary], n_periods - len(extremes), seed=seed)
+
+    representatives = list(ordinary[closest]) + list(extremes)
+    sequence = np.empty(n_original, dtype=int)
+    sequence[ordinary] = labels
+    sequence[extremes] = np.arange(len(closest), len(representatives))
+    weights = np.bincount(sequence, minlength=len(representatives)).astype(
+        float)
+
+    index = np.concatenate([np.arange(d * period_length, (d + 1) * period_length)
+                            for d in representatives])
+    aggregated = data.iloc[index].reset_index(drop=True)
+    return aggregated, weights, sequence
+
+##################################################################################
+# LINKING OF THE STATE OF CHARGE BETWEEN PERIODS
+##################################################################################
+
+def link_storage_periods(om, energysystem, parameters, weights, sequence,
+                         period_length=96):
+
+    # replaces the storage balance across the boundaries of the representative
+    # periods by a balance over the original sequence of periods;
+    # the state of charge of original period d is soc_inter[d] plus the
+    # intra-period trajectory of its representative period k relative to the
+    # start of k; the bounds of the state of charge are enforced via the
+    # highest and lowest point of each intra-period trajectory;
+
+    storage = energysystem.groups['el_lv_1_storage']
+    b_el_lv = energysystem.groups['b_el_lv']
+    invest = om.InvestmentStorage.invest[storage]
+    capacity = om.InvestmentStorage.capacity
+    time_step = energysystem.timeindex.freq.nanos / 3.6e12
+    loss = parameters['capacity_loss']
+
+    n_representative = len(weights)
+    n_original = len(sequence)
+    starts = [k * period_length for k in range(n_representative)]
+    ends = [s + period_length - 1 for s in starts]
+
+    block = environ.Block()
+    block.PERIODS = environ.RangeSet(0, n_representative - 1)
+    block.DAYS = environ.RangeSet(0, n_original - 1)
+    block.start = environ.Var(block.PERIODS, within=environ.NonNegativeReals)
+    block.highest = environ.Var(block.PERIODS)
+    block.lowest = environ.Var(block.PERIODS)
+    block.soc_inter = environ.Var(block.DAYS, within=environ.NonNegativeReals)
+
+    # the first timestep of each representative period starts from its own
+    # start value instead of the last timestep of the preceding period;
+
+    for t in starts:
+        om.InvestmentStorage.balance[storage, t].deactivate()
+
+    def first_balance_rule(b, k):
+        t = starts[k]
+        return (capacity[storage, t] == b.start[k] * (1 - loss)
+                + om.flow[b_el_lv, storage, t] * parameters['icf'] * time_step
+                - om.flow[storage, b_el_lv, t] / parameters['ocf'] * time_step)
+    block.first_balance = environ.Constraint(block.PERIODS,
+                                             rule=first_balance_rule)
+
+    def highest_rule(b, k, i):
+        return b.highest[k] >= capacity[storage, starts[k] + i] - b.start[k]
+
+    def lowest_rule(b, k, i):
+        return b.lowest[k] <= capacity[storage, starts[k] + i] - b.start[k]
+
+    block.STEPS = environ.RangeSet(0, period_length - 1)
+    block.highest_constr = environ.Constraint(block.PERIODS, block.STEPS,
+                                              rule=highest_rule)
+    block.lowest_constr = environ.Constraint(block.PERIODS, block.STEPS,
+                                             rule=lowest_rule)
+
+    # soc_inter[d] is the state of charge at the start of original period d;
+    # the last period is linked cyclically to the first one;
+
+    decay = (1 - loss) ** period_length
+
+    def inter_rule(b, d):
+        k = int(sequence[d])
+        following = (d + 1) % n_original
+        return (b.soc_inter[following] == b.soc_inter[d] * decay
+                + capacity[storage, ends[k]] - b.start[k])
+    block.inter_balance = environ.Constraint(block.DAYS, rule=inter_rule)
+
+    def upper_rule(b, d):
+        return (b.soc_inter[d] + b.highest[int(sequence[d])]
+                <= invest * parameters['capacity_max'])
+
+    def lower_rule(b, d):
+        return (b.soc_inter[d] + b.lowest[int(sequence[d])]
+                >= invest * parameters['capacity_min'])
+
+    block.upper = environ.Constraint(block.DAYS, rule=upper_rule)
+    block.lower = environ.Constraint(block.DAYS, rule=lower_rule)
+
+    om.add_component('LinkStoragePeriods', block)
+    return block
+
+##################################################################################
+# OPTIMISATION ON TYPICAL PERIODS
+##################################################################################
+
+def optimise_aggregated(data, parameters=None, n_periods=12, period_length=96,
+                        solver='cbc', tee_switch=False, solver_threads=None,
+                        seed=0):
+
+    """
+    sizes grid connection and storage on representative periods
+
+    parameters
+    ----------
+    data : pandas.DataFrame
+        full profile with the columns "demand_el", "machine_load" and "pv"
+    parameters : dict
+        parameter overrides (see GridCon_storage.DEFAULT_PARAMETERS)
+    n_periods, period_length, seed :
+        see typical_periods
+    solver, tee_switch, solver_threads :
+        see GridCon_storage.solve_model
+
+    returns
+    -------
+    dict
+        summary of the results as returned by summarise_results plus the
+        number of timesteps of the aggregated model
+
+    """
+
+    p = gridcon.merge_parameters(parameters)
+    aggregated, weights, sequence = typical_periods(
+        data, n_periods, period_length, seed)
+    weighting = np.repeat(weights, period_length)
+
+    logging.info('Aggregated {0} periods into {1} representative periods'
+                 .format(len(sequence), len(weights)))
+
+    energysystem = gridcon.create_energysystem(aggregated, p, len(aggregated),
+                                               weighting=weighting)
+    om = gridcon.create_model(energysystem)
+    link_storage_periods(om, energysystem, p, weights, sequence, period_length)
+    gridcon.solve_model(om, solver=solver, debug=False, tee_switch=tee_switch,
+                        solver_threads=solver_threads)
+
+    summary = gridcon.summarise_results(energysystem, p,
+                                        weighting=weighting)
+    summary['number_timesteps'] = len(aggregated)
+    return summary
+
+
+def compare_with_full_run(aggregated_summary, full_summary):
+
+    """
+    error of an aggregated run with respect to the full-resolution run
+
+    parameters
+    ----------
+    aggregated_summary, full_summary : dict
+        summaries as returned by optimise_aggregated and summarise_results
+
+    returns
+    -------
+    pandas.DataFrame
+        aggregated and full values of the objective, the sized capacities and
+        the cost breakdown together with their absolute and relative error
+
+    """
+
+    keys = ['objective', 'grid_supply_capacity', 'grid_collection_capacity',
+            'storage_capacity', 'total_fixed_costs', 'total_variable_costs']
+    comparison = pd.DataFrame(
+        {'aggregated': [aggregated_summary[k] for k in keys],
+         'full': [full_summary[k] for k in keys]}, index=keys)
+    comparison['absolute_error'] = comparison['aggregated'] - comparison['full']
+    comparison['relative_error'] = (comparison['absolute_error']
+                                    / comparison['full'].abs().replace(0, np.nan))
+    return comparison
+
+
+def run_aggregated_example(filename="GridCon1_Profile.csv", n_periods=12,
+                           number_timesteps=(96*366), solver='cbc',
+                           compare=True, **parameters):
+
+    # solves the aggregated model and, if compare is true, the full model for
+    # the same parameters and prints both results next to each other;
+
+    data = gridcon.read_profile(
+        filename, number_timesteps, list(gridcon.PROFILE_COLUMNS))
+    aggregated_summary = optimise_aggregated(data, parameters, n_periods,
+                                             solver=solver)
+    if not compare:
+        print(pd.Series(aggregated_summary))
+        return aggregated_summary, None
+
+    p = gridcon.merge_parameters(parameters)
+    energysystem = gridcon.create_energysystem(data, p, len(data))
+    om = gridcon.create_model(energysystem)
+    gridcon.solve_model(om, solver=solver, debug=False, tee_switch=False)
+    full_summary = gridcon.summarise_results(energysystem, p)
+
+    comparison = compare_with_full_run(aggregated_summary, full_summary)
+    print(' ')
+    print('AGGREGATED ({0} timesteps) VERSUS FULL RESOLUTION ({1} timesteps)'
+          .format(aggregated_summary['number_timesteps'], len(data)))
+    print('####################################################')
+    print(comparison)
+    return aggregated_summary, comparison
@@ -0,0 +1,233 @@
+# -*- coding: utf-8 -*-
+"""
+Module to size grid connection and storage for many sites in one invocation.
+
+The sites are given either as a directory with one profile csv-file per site
+or as one csv-file with the columns "<site>_demand_el", "<site>_machine_load"
+and "<site>_pv" per site. The sites are solved concurrently by a bounded pool
+of worker processes. Each worker builds one model (the template) with the
+profile as net injection into the low voltage grid (collapse_fixed_flows) and
+only replaces the profile for every further site, so that the model is built
+once per worker instead of once per site. The summary of every site is
+appended to one consolidated csv-file as soon as the site is finished, hence
+a slow site does not hold back the results of the others.
+"""
+
+##################################################################################
+# IMPORTS
+##################################################################################
+
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import glob
+import logging
+from multiprocessing.util import Finalize
+import os
+
+import pandas as pd
+
+import GridCon_storage_171221d as gridcon
+from GridCon_model import ReusableModel
+
+##################################################################################
+# SITES
+##################################################################################
+
+def find_sites(source):
+
+    """
+    sites and the location of their profiles
+
+    parameters
+    ----------
+    source : str
+        directory with one profile csv-file per site (named by the file
+        name) or csv-file with the columns "<site>_demand_el",
+        "<site>_machine_load" and "<site>_pv" per site
+
+    returns
+    -------
+    dict
+        {site: (filename, columns)}, where columns maps the columns of the
+        file to "demand_el", "machine_load" and "pv"
+
+    """
+
+    if os.path.isdir(source):
+        return {os.path.splitext(os.path.basename(f))[0]:
+                (os.path.abspath(f), {c: c for c in gridcon.PROFILE_COLUMNS})
+                for f in sorted(glob.glob(os.path.join(source, '*.csv')))}
+
+    filename = os.path.abspath(source)
+    header = pd.read_csv(filename, nrows=0).columns
+    sites = {}
+    for column in header:
+        for name in gridcon.PROFILE_COLUMNS:
+            if column.endswith('_' + name):
+                site = column[:-len(name) - 1]
+                sites.setdefault(site, (filename, {}))[1][column] = name
+    incomplete = sorted(site for site, (_, columns) in sites.items()
+                        if len(columns) < len(gridcon.PROFILE_COLUMNS))
+    if incomplete:
+        raise ValueError('Site(s) {0} lack one of the columns {1}'.format(
+            ', '.join(incomplete), ', '.join(gridcon.PROFILE_COLUMNS)))
+    return sites
+
+
+def read_site(filename, columns, number_timesteps=None):
+
+    # reads the profile of one site from the binary profile cache and
+    # renames its columns to "demand_el", "machine_load" and "pv";
+
+    data = gridcon.read_profile(filename, number_timesteps, list(columns))
+    return data.rename(columns=columns)
+
+##################################################################################
+# WORKER PROCESSES
+##################################################################################
+
+# columns of the consolidated output; the summary of a site (see
+# extract_results) plus the telemetry of ReusableModel.solve; the sites are
+# solved cold, so "iterations_saved" stays empty;
+
+COLUMNS = ['site', 'grid_collection_capacity', 'grid_supply_capacity',
+           'storage_capacity', 'kN', 'kS', 'prl_income', 'kS_netto',
+           'fixed_grid_costs', 'fixed_storage_costs', 'total_fixed_costs',
+           'grid_loss_costs', 'storage_loss_costs', 'curtailment_costs',
+           'total_variable_costs', 'total_annual_costs', 'objective',
+           'iterations', 'warm_started', 'iterations_saved', 'error']
+
+# model of a worker process, built for its first site and reused for all
+# further sites;
+
+_template = None
+
+
+def _solve_site(task):
+
+    # solves one site on the model of the worker process and returns its
+    # summary; errors are reported in the column "error";
+
+    global _template
+    site, filename, columns, options = task
+    row = {'site': site}
+    try:
+        data = read_site(filename, columns, options['number_timesteps'])
+        if _template is None:
+            _template = ReusableModel(
+                data, options['parameters'], options['number_timesteps'],
+                solver=options['solver'],
+                solver_threads=options['solver_threads'],
+                collapse_fixed_flows=True)
+
+            # the files of the model are removed when the worker exits;
+
+            Finalize(_template, _template.close, exitpriority=10)
+        else:
+            _template.update_profile(data)
+        row.update(_template.solve())
+        if options['results_directory'] is not None:
+            gridcon.extract_results(_template.energysystem).write(
+                os.path.join(options['results_directory'], site),
+                options['file_format'])
+        row['error'] = None
+    except Exception as e:
+        logging.exception('Site {0} failed'.format(site))
+        row['error'] = repr(e)
+    return row
+
+##################################################################################
+# BATCH OPTIMISATION
+##################################################################################
+
+def optimise_sites(source, output='GridCon_sites.csv', number_timesteps=None,
+                   parameters=None, solver='cbc', max_workers=None,
+                   solver_threads=1, results_directory=None,
+                   file_format='npz'):
+
+    """
+    sizes grid connection and storage of many sites concurrently
+
+    parameters
+    ----------
+    source : str
+        directory or multi-site csv-file, see find_sites
+    output : str
+        consolidated csv-file with one row per site, written while the sites
+        finish (in the order they finish); None to skip it
+    number_timesteps : int
+        number of 15 minutes timesteps; defaults to the length of the profile
+        of the first site; all sites must have at least this length
+    parameters : dict
+        parameter overrides for all sites (see DEFAULT_PARAMETERS)
+    solver : str
+        name of the solver
+    max_workers : int
+        maximum number of worker processes; defaults to the number of cores
+        divided by solver_threads
+    solver_threads : int
+        number of threads each solver may use
+    results_directory : str
+        if given, the flows of each site are written to
+        "<results_directory>/<site>.<file_format>" (see GridConResults.write)
+    file_format : str
+        "npz", "parquet" or "csv"
+
+    returns
+    -------
+    pandas.DataFrame
+        one row per site (sorted by site) with the sized capacities, the
+        cost breakdown and the column "error"
+
+    """
+
+    sites = find_sites(source)
+    if not sites:
+        raise ValueError('No sites found in {0}'.format(source))
+    parameters = gridcon.merge_parameters(parameters)
+
+    # the profiles are converted into the binary profile cache before the
+    # workers start; the length of the first profile is the default horizon;
+
+    first = None
+    for filename, columns in sites.values():
+        data = read_site(filename, columns)
+        if first is None:
+            first = len(data)
+    if number_timesteps is None:
+        number_timesteps = first
+
+    if results_directory is not None and not os.path.isdir(results_directory):
+        os.makedirs(results_directory)
+    if max_workers is None:
+        max_workers = max(1, (os.cpu_count() or 1) // solver_threads)
+    max_workers = max(1, min(max_workers, len(sites)))
+
+    options = {'number_timesteps': number_timesteps,
+               'parameters': parameters, 'solver': solver,
+               'solver_threads': solver_threads,
+               'results_directory': results_directory,
+               'file_format': file_format}
+    logging.info('Batch of {0} sites with {1} worker(s)'.format(
+        len(sites), max_workers))
+
+    rows = []
+    stream = open(output, 'w') if output is not None else None
+    try:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            futures = [executor.submit(_solve_site,
+                                       (site, filename, columns, options))
+                       for site, (filename, columns) in sites.items()]
+            for future in as_completed(futures):
+                row = future.result()
+                logging.info('Site {0} finished'.format(row['site']))
+                if stream is not None:
+                    pd.DataFrame([row], columns=COLUMNS).to_csv(
+                        stream, index=False, header=not rows)
+                    stream.flush()
+                rows.append(row)
+    finally:
+        if stream is not None:
+            stream.close()
+
+    return pd.DataFrame(rows, columns=COLUMNS).sort_values(
+        'site').set_index('site')
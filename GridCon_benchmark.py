@@ -0,0 +1,312 @@
+# -*- coding: utf-8 -*-
+"""
+Module to benchmark optimise_storage_size for growing horizons and solvers.
+
+The benchmark runs offline on synthetic profiles shaped like
+GridCon1_Profile.csv (agricultural base load, seasonal machine load, PV
+generation) and varies the number of timesteps, the solver and the debug flag
+(writing of the lp-file). Each case runs in a fresh process, so that the peak
+memory of a case is not inherited from the preceding one. Build time, solve
+time, peak memory and the objective (compared across solvers) are collected in
+a table which can be saved as a baseline and compared with later runs.
+
+Run e.g. "python GridCon_benchmark.py --days 1 28 366 --save-baseline".
+"""
+
+##################################################################################
+# IMPORTS
+##################################################################################
+
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import logging
+import os
+
+import numpy as np
+import pandas as pd
+from pyomo.opt import SolverFactory
+
+import GridCon_storage_171221d as gridcon
+from GridCon_instrumentation import RunReport
+
+##################################################################################
+# SYNTHETIC PROFILES
+##################################################################################
+
+# solvers tried by default; "appsi_highs" is the HiGHS interface of newer pyomo
+# versions;
+
+SOLVERS = ('cbc', 'glpk', 'appsi_highs')
+
+TIMESTEPS_PER_DAY = 96
+
+# columns identifying a case and columns compared with the baseline;
+
+CASE_COLUMNS = ['days', 'solver', 'debug']
+
+TIME_COLUMNS = ['build_time', 'write_lp_time', 'solve_time', 'results_time',
+                'total_time', 'peak_rss']
+
+RESULT_COLUMNS = (CASE_COLUMNS + TIME_COLUMNS
+                  + ['solver_peak_rss', 'variables', 'constraints', 'nonzeros',
+                     'objective', 'error'])
+
+
+def synthetic_profile(days, seed=0):
+
+    """
+    profile shaped like GridCon1_Profile.csv
+
+    parameters
+    ----------
+    days : int
+        length of the profile in days; longer than a year for multi-year runs
+    seed : int
+        seed of the random fluctuations
+
+    returns
+    -------
+    pandas.DataFrame
+        columns "demand_el" (base load with daily and weekly pattern),
+        "machine_load" (blocks of a few hours on working days in spring and
+        summer) and "pv" (daily bell curve scaled by season and cloudiness),
+        all in kW per 15 minutes timestep
+
+    """
+
+    rng = np.random.RandomState(seed)
+    n = days * TIMESTEPS_PER_DAY
+    hour = (np.arange(n) % TIMESTEPS_PER_DAY) / 4.
+    day = np.arange(n) // TIMESTEPS_PER_DAY
+    season = np.cos(2 * np.pi * ((day % 366) - 172) / 366.)
+
+    demand = (40 + 15 * np.sin(np.pi * (hour - 6) / 12.).clip(0)
+              + 10 * (day % 7 < 5) + 3 * rng.rand(n))
+    pv = (np.sin(np.pi * (hour - 5) / 14.).clip(0) * 250
+          * (0.6 + 0.4 * season) * rng.uniform(0.3, 1, days).repeat(
+              TIMESTEPS_PER_DAY))
+    machine = np.zeros(n)
+    working = (day % 7 < 6) & (season > -0.3) & (rng.rand(days)[day] < 0.3)
+    machine[working & (hour >= 9) & (hour < 13)] = 900
+
+    return pd.DataFrame({'demand_el': demand, 'machine_load': machine,
+                         'pv': pv})
+
+
+def write_profile(days, directory, seed=0):
+
+    # writes the synthetic profile as csv-file (unless it exists) and returns
+    # its absolute name;
+
+    filename = os.path.abspath(os.path.join(
+        directory, 'profile_{0}d_{1}.csv'.format(days, seed)))
+    if not os.path.exists(filename):
+        synthetic_profile(days, seed).to_csv(filename, index=False)
+    return filename
+
+##################################################################################
+# BENCHMARK CASES
+##################################################################################
+
+def available_solvers(candidates=SOLVERS):
+
+    # returns the candidates which pyomo can run here;
+
+    solvers = []
+    for name in candidates:
+        try:
+            if SolverFactory(name).available(exception_flag=False):
+                solvers.append(name)
+        except Exception:
+            pass
+    return solvers
+
+
+def _run_case(case):
+
+    # runs one benchmark case in a worker process and returns its row;
+
+    filename, days, solver, debug = case
+    report = RunReport()
+    row = {'days': days, 'solver': solver, 'debug': debug}
+    try:
+        gridcon.optimise_storage_size(
+            filename, solver=solver, debug=debug,
+            number_timesteps=days * TIMESTEPS_PER_DAY, tee_switch=False,
+            report=report)
+    except Exception as e:
+        logging.exception('Benchmark case {0} failed'.format(case))
+        row['error'] = repr(e)
+        return row
+
+    times = {}
+    for p in report.phases:
+        times[p['name']] = times.get(p['name'], 0) + p['wall_time']
+    summary = report.to_dict()
+    row.update({
+        'build_time': (times.get('read_profile', 0)
+                       + times.get('energysystem', 0)
+                       + times.get('operational_model', 0)),
+        'write_lp_time': times.get('write_lp', 0),
+        'solve_time': times.get('solve', 0),
+        'results_time': times.get('results', 0),
+        'total_time': summary['total']['wall_time'],
+        'peak_rss': summary['total']['peak_rss'],
+        'solver_peak_rss': max([p['solver_peak_rss'] or 0
+                                for p in report.phases] or [0]),
+        'variables': report.model.get('variables'),
+        'constraints': report.model.get('constraints'),
+        'nonzeros': report.model.get('nonzeros'),
+        'objective': report.results.get('objective'),
+        'error': None,
+        })
+    return row
+
+
+def run_benchmark(days=(1, 28, 366, 732), solvers=None, debug=(False, True),
+                  directory='benchmark', seed=0):
+
+    """
+    runs optimise_storage_size for all combinations of the given cases
+
+    parameters
+    ----------
+    days : iterable of int
+        horizons in days; 366 is one (leap) year
+    solvers : iterable of str
+        solvers to be compared; defaults to all available ones of SOLVERS
+    debug : iterable of bool
+        values of the debug flag (writing of the lp-file)
+    directory : str
+        directory for the synthetic profiles
+    seed : int
+        seed of the synthetic profiles
+
+    returns
+    -------
+    pandas.DataFrame
+        one row per case with build, lp-writing, solve, results and total
+        time (seconds), peak memory of the process and of the solver (MB),
+        size of the LP, objective and "objective_deviation", the relative
+        deviation from the objective of the first solver for the same horizon
+
+    """
+
+    if solvers is None:
+        solvers = available_solvers()
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+
+    rows = []
+    for d in days:
+        filename = write_profile(d, directory, seed)
+        for solver in solvers:
+            for flag in debug:
+                logging.info('Benchmark: {0} days, {1}, debug={2}'.format(
+                    d, solver, flag))
+                with ProcessPoolExecutor(max_workers=1) as executor:
+                    rows.append(executor.submit(
+                        _run_case, (filename, d, solver, flag)).result())
+
+    results = pd.DataFrame(rows, columns=RESULT_COLUMNS)
+    reference = results.groupby('days')['objective'].transform('first')
+    results['objective_deviation'] = ((results['objective'] - reference)
+                                      / reference.abs())
+    return results
+
+##################################################################################
+# BASELINES
+##################################################################################
+
+def save_baseline(results, filename='benchmark/baseline.csv'):
+
+    # saves the results of run_benchmark as baseline for later comparisons;
+
+    results.to_csv(filename, index=False)
+    return filename
+
+
+def compare_with_baseline(results, filename='benchmark/baseline.csv',
+                          tolerance=0.2, objective_tolerance=1e-6):
+
+    """
+    compares benchmark results with a saved baseline
+
+    parameters
+    ----------
+    results : pandas.DataFrame
+        as returned by run_benchmark
+    filename : str
+        baseline saved by save_baseline
+    tolerance : float
+        relative increase of a time or of the peak memory which is reported
+        as regression
+    objective_tolerance : float
+        relative change of the objective which is reported as regression
+
+    returns
+    -------
+    pandas.DataFrame
+        per case present in both, the ratio current / baseline of each
+        column of TIME_COLUMNS, the relative change of the objective and
+        "regression", a list of the columns exceeding the tolerances
+
+    """
+
+    baseline = pd.read_csv(filename)
+    merged = results.merge(baseline, on=CASE_COLUMNS,
+                           suffixes=('', '_baseline'))
+    comparison = merged[CASE_COLUMNS].copy()
+    for column in TIME_COLUMNS:
+        comparison[column + '_ratio'] = (merged[column]
+                                         / merged[column + '_baseline'])
+    comparison['objective_change'] = (
+        (merged['objective'] - merged['objective_baseline'])
+        / merged['objective_baseline'].abs())
+
+    def regressions(row):
+        found = [c for c in TIME_COLUMNS
+                 if row[c + '_ratio'] > 1 + tolerance]
+        if not abs(row['objective_change']) <= objective_tolerance:
+            found.append('objective')
+        return found
+
+    comparison['regression'] = comparison.apply(regressions, axis=1)
+    return comparison
+
+##################################################################################
+# COMMAND LINE
+##################################################################################
+
+def main(arguments=None):
+
+    parser = argparse.ArgumentParser(
+        description='Benchmark of the GridCon storage sizing')
+    parser.add_argument('--days', type=int, nargs='+',
+                        default=[1, 28, 366, 732])
+    parser.add_argument('--solvers', nargs='+', default=None)
+    parser.add_argument('--debug', choices=['on', 'off', 'both'],
+                        default='both')
+    parser.add_argument('--directory', default='benchmark')
+    parser.add_argument('--baseline', default=None,
+                        help='baseline csv-file (default: '
+                             '<directory>/baseline.csv)')
+    parser.add_argument('--save-baseline', action='store_true')
+    args = parser.parse_args(arguments)
+
+    debug = {'on': [True], 'off': [False], 'both': [False, True]}[args.debug]
+    baseline = args.baseline or os.path.join(args.directory, 'baseline.csv')
+
+    results = run_benchmark(args.days, args.solvers, debug, args.directory)
+    with pd.option_context('display.width', 200,
+                           'display.max_columns', None):
+        print(results)
+        if os.path.exists(baseline) and not args.save_baseline:
+            print(compare_with_baseline(results, baseline))
+    results.to_csv(os.path.join(args.directory, 'latest.csv'), index=False)
+    if args.save_baseline:
+        save_baseline(results, baseline)
+    return results
+
+if __name__ == "__main__":
+    main()
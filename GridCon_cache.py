@@ -0,0 +1,331 @@
+# -*- coding: utf-8 -*-
+"""
+Module to keep the results of solved scenarios in a persistent cache.
+
+The key of a scenario is the SHA-256 hash of the profile values, the number of
+timesteps, the weighting and duration of the timesteps, the complete set of
+parameters and the solver with its version. Each entry is one compressed npz
+file with the flows, the storage level, the investments and the cost
+breakdown, so that a repeated scenario is loaded in milliseconds instead of
+being solved again.
+
+The cache is shared by concurrent worker processes without locks: entries are
+written to a temporary file and renamed at once, so that a reader never sees
+a partly written entry; a hit touches the modification time of the entry,
+which serves as time of the last use for the least-recently-used eviction
+once the cache exceeds its size limit.
+"""
+
+##################################################################################
+# IMPORTS
+##################################################################################
+
+import glob
+import hashlib
+import json
+import logging
+import os
+import tempfile
+
+import numpy as np
+import pandas as pd
+from pyomo import environ  # registers the solver plugins
+from pyomo.opt import SolverFactory
+
+from oemof.tools import helpers
+
+import GridCon_storage_171221d as gridcon
+
+##################################################################################
+# KEYS OF THE SCENARIOS
+##################################################################################
+
+# version of the formulation of the model; to be increased whenever a change
+# of the model changes its results, which invalidates all cached entries;
+
+MODEL_VERSION = 1
+
+_solver_versions = {}
+
+
+def solver_version(solver):
+
+    # returns the version of a solver as string, "unknown" if the solver does
+    # not report it; the version is determined once per process;
+
+    if solver not in _solver_versions:
+        try:
+            version = SolverFactory(solver).version()
+        except Exception:
+            version = None
+        _solver_versions[solver] = ('unknown' if version is None else
+                                    '.'.join(str(v) for v in version))
+    return _solver_versions[solver]
+
+
+def scenario_key(data, parameters, number_timesteps, solver='cbc',
+                 weighting=None, time_step=0.25):
+
+    """
+    key of a scenario in the result cache
+
+    parameters
+    ----------
+    data : pandas.DataFrame
+        profile with the columns "demand_el", "machine_load" and "pv"
+    parameters : dict
+        parameter overrides (see GridCon_storage.DEFAULT_PARAMETERS)
+    number_timesteps : int
+        number of timesteps of the model
+    solver : str
+        name of the solver; None for a key independent of the solver
+    weighting : array_like
+        optional weighting of the timesteps (see create_energysystem)
+    time_step : float
+        duration of a timestep in hours
+
+    returns
+    -------
+    str
+        SHA-256 hash of the inputs
+
+    """
+
+    sha = hashlib.sha256()
+    values = np.ascontiguousarray(
+        np.asarray(data[list(gridcon.PROFILE_COLUMNS)],
+                   dtype=np.float64)[:number_timesteps])
+    sha.update(values.tobytes())
+    if weighting is not None:
+        sha.update(np.ascontiguousarray(weighting, dtype=np.float64)
+                   .tobytes())
+    description = {
+        'model_version': MODEL_VERSION,
+        'number_timesteps': int(number_timesteps),
+        'time_step': float(time_step),
+        'weighting': weighting is not None,
+        'parameters': gridcon.merge_parameters(parameters),
+        'solver': solver,
+        'solver_version': None if solver is None else solver_version(solver),
+        }
+    sha.update(json.dumps(description, sort_keys=True).encode('utf-8'))
+    return sha.hexdigest()
+
+##################################################################################
+# RESULT CACHE
+##################################################################################
+
+class ResultCache(object):
+
+    """
+    persistent cache of solved scenarios with least-recently-used eviction
+
+    parameters
+    ----------
+    directory : str
+        directory of the cache; defaults to ~/.oemof/result_cache
+    max_bytes : int
+        size limit of the cache; the least recently used entries are removed
+        when it is exceeded
+
+    """
+
+    def __init__(self, directory=None, max_bytes=(1 << 30)):
+
+        if directory is None:
+            directory = helpers.extend_basic_path('result_cache')
+        if not os.path.isdir(directory):
+            os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.max_bytes = max_bytes
+
+    def _filename(self, key):
+        return os.path.join(self.directory, key + '.npz')
+
+    def get(self, key):
+
+        """
+        loads a cached scenario
+
+        parameters
+        ----------
+        key : str
+            see scenario_key
+
+        returns
+        -------
+        GridCon_storage.GridConResults
+            flows, storage level, investments and cost breakdown of the
+            scenario; None if it is not in the cache
+
+        """
+
+        filename = self._filename(key)
+        try:
+            with np.load(filename) as archive:
+                meta = json.loads(str(archive['meta']))
+                flows = {tuple(k.split('|')): archive[k]
+                         for k in archive.files if '|' in k}
+                storage_level = archive['storage_level']
+                timeindex = pd.DatetimeIndex(archive['timeindex'])
+        except (IOError, OSError, KeyError, ValueError):
+
+            # missing, just evicted or unreadable entries are misses;
+
+            return None
+
+        try:
+            os.utime(filename)
+        except OSError:
+            pass
+        timeindex = pd.date_range(timeindex[0], periods=len(timeindex),
+                                  freq=pd.Timedelta(hours=meta['time_step']))
+        return gridcon.GridConResults(
+            timeindex, flows, storage_level, meta['investments'],
+            meta['objective'], meta['summary'])
+
+    def put(self, key, results):
+
+        """
+        stores a solved scenario
+
+        parameters
+        ----------
+        key : str
+            see scenario_key
+        results : GridCon_storage.GridConResults
+            as returned by extract_results
+
+        """
+
+        def number(value):
+            return None if value is None else float(value)
+
+        meta = {
+            'time_step': results.timeindex.freq.nanos / 3.6e12,
+            'investments': {k: number(v)
+                            for k, v in results.investments.items()},
+            'objective': number(results.objective),
+            'summary': None if results.summary is None else {
+                k: number(v) for k, v in results.summary.items()},
+            }
+        arrays = {'|'.join(key): np.asarray(values, dtype=float)
+                  for key, values in results.flows.items()}
+        arrays['storage_level'] = np.asarray(results.storage_level,
+                                             dtype=float)
+        arrays['timeindex'] = results.timeindex.asi8
+        arrays['meta'] = np.array(json.dumps(meta))
+
+        # the entry is written to a temporary file and renamed at once; if
+        # another process has stored the same scenario meanwhile, its entry
+        # is replaced by an identical one;
+
+        handle, temporary = tempfile.mkstemp(dir=self.directory,
+                                             prefix='.writing_',
+                                             suffix='.npz')
+        try:
+            with os.fdopen(handle, 'wb') as f:
+                np.savez_compressed(f, **arrays)
+            os.replace(temporary, self._filename(key))
+        except OSError:
+            logging.warning('Scenario {0} could not be cached'.format(key))
+        finally:
+            if os.path.exists(temporary):
+                os.remove(temporary)
+        self.evict()
+
+    def entries(self):
+
+        # returns (time of last use, size, filename) of all entries, least
+        # recently used first;
+
+        found = []
+        for filename in glob.glob(os.path.join(self.directory, '*.npz')):
+            try:
+                stat = os.stat(filename)
+            except OSError:
+                continue
+            found.append((stat.st_mtime, stat.st_size, filename))
+        return sorted(found)
+
+    def evict(self):
+
+        # removes the least recently used entries until the cache fits into
+        # max_bytes; entries removed concurrently by another process are
+        # skipped;
+
+        entries = self.entries()
+        size = sum(entry[1] for entry in entries)
+        for _, entry_size, filename in entries:
+            if size <= self.max_bytes:
+                break
+            try:
+                os.remove(filename)
+            except OSError:
+                pass
+            size -= entry_size
+
+    def clear(self):
+
+        # removes all entries;
+
+        for _, _, filename in self.entries():
+            try:
+                os.remove(filename)
+            except OSError:
+                pass
+
+##################################################################################
+# CACHED OPTIMISATION
+##################################################################################
+
+def optimise_cached(data, parameters=None, number_timesteps=None,
+                    solver='cbc', solver_threads=None, weighting=None,
+                    cache=None):
+
+    """
+    sizes grid connection and storage unless the scenario is in the cache
+
+    parameters
+    ----------
+    data : pandas.DataFrame
+        profile with the columns "demand_el", "machine_load" and "pv"
+    parameters : dict
+        parameter overrides (see GridCon_storage.DEFAULT_PARAMETERS)
+    number_timesteps : int
+        number of 15 minutes timesteps; defaults to the length of the profile
+    solver, solver_threads :
+        see GridCon_storage.solve_model
+    weighting : array_like
+        optional weighting of the timesteps (see create_energysystem)
+    cache : ResultCache
+        defaults to a ResultCache in ~/.oemof/result_cache
+
+    returns
+    -------
+    GridCon_storage.GridConResults
+        flows, storage level, investments and cost breakdown ("summary")
+
+    """
+
+    if number_timesteps is None:
+        number_timesteps = len(data)
+    if cache is None:
+        cache = ResultCache()
+    p = gridcon.merge_parameters(parameters)
+    key = scenario_key(data, p, number_timesteps, solver, weighting)
+
+    results = cache.get(key)
+    if results is not None:
+        logging.info('Scenario {0} loaded from the result cache'.format(key))
+        return results
+
+    energysystem = gridcon.create_energysystem(
+        data, p, number_timesteps, weighting=weighting,
+        collapse_fixed_flows=True)
+    om = gridcon.create_model(energysystem)
+    gridcon.solve_model(om, solver=solver, debug=False, tee_switch=False,
+                        solver_threads=solver_threads)
+    results = gridcon.extract_results(energysystem, p, weighting)
+    cache.put(key, results)
+    return results
@@ -0,0 +1,202 @@
+# -*- coding: utf-8 -*-
+"""
+Module to record where the time and the memory of a GridCon run are spent.
+
+A RunReport records, per phase of a run (reading the profile, building the
+energy system, building the operational model, writing the lp-file, solving,
+processing the results), the wall time, the CPU time of the process and of
+its child processes (e.g. cbc, which pyomo runs as a separate program) and
+the peak resident set size (RSS). Together with the size of the model it is
+written as a JSON report.
+"""
+
+##################################################################################
+# IMPORTS
+##################################################################################
+
+from contextlib import contextmanager
+import datetime
+import json
+import logging
+import sys
+import time
+
+from pyomo.environ import Constraint, Var
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+##################################################################################
+# MEMORY USAGE
+##################################################################################
+
+def peak_rss():
+
+    # returns the peak resident set size of this process and of its (waited
+    # for) child processes in MB since their start; None if it cannot be
+    # determined;
+    # ru_maxrss is given in kB on Linux and in bytes on macOS; on Windows, the
+    # peak working set from psutil is used if available;
+
+    if resource is not None:
+        scale = 1024. ** 2 if sys.platform == 'darwin' else 1024.
+        return (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale,
+                resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / scale)
+    if psutil is not None:
+        memory = psutil.Process().memory_info()
+        peak = getattr(memory, 'peak_wset', None)
+        if peak is not None:
+            return peak / 1024. ** 2, None
+    return None, None
+
+
+def children_cpu_time():
+
+    # returns the CPU time in seconds used by the terminated child processes;
+
+    if resource is None:
+        return None
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+##################################################################################
+# REPORT OF A RUN
+##################################################################################
+
+class RunReport(object):
+
+    """
+    wall time, CPU time and peak memory per phase of a run
+
+    parameters
+    ----------
+    **info :
+        information on the run written to the report, e.g. the solver and the
+        number of timesteps
+
+    attributes
+    ----------
+    phases : list of dict
+        one entry per phase with "name", "wall_time" and "cpu_time" (seconds),
+        "solver_cpu_time" (CPU time of child processes, seconds), and
+        "peak_rss" and "solver_peak_rss" (MB); the peak RSS is the high-water
+        mark of the process up to the end of the phase, so a phase raising it
+        is the one setting the peak
+    model : dict
+        size of the model, see model_statistics
+    results : dict
+        e.g. the objective and the sized capacities
+
+    """
+
+    def __init__(self, **info):
+
+        self.info = dict(info)
+        self.info['started'] = datetime.datetime.now().isoformat()
+        self.phases = []
+        self.model = {}
+        self.results = {}
+
+    @contextmanager
+    def phase(self, name):
+
+        # measures the enclosed code as phase "name";
+
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        children = children_cpu_time()
+        try:
+            yield
+        finally:
+            entry = {'name': name,
+                     'wall_time': time.perf_counter() - wall,
+                     'cpu_time': time.process_time() - cpu,
+                     'solver_cpu_time': None}
+            if children is not None:
+                entry['solver_cpu_time'] = children_cpu_time() - children
+            entry['peak_rss'], entry['solver_peak_rss'] = peak_rss()
+            self.phases.append(entry)
+            logging.info('Phase {0}: {1:.3f} s'.format(name,
+                                                       entry['wall_time']))
+
+    def model_statistics(self, om, solver_results=None):
+
+        """
+        records the size of the model
+
+        parameters
+        ----------
+        om : pyomo.ConcreteModel
+            the operational model; all its variables (including fixed ones)
+            and active constraints are counted
+        solver_results : pyomo.opt.SolverResults
+            results of the solve; the solver reports the size of the problem
+            it has received, in which fixed variables (e.g. the fixed flows)
+            are already substituted, including the number of nonzeros
+
+        """
+
+        self.model['pyomo_variables'] = sum(
+            1 for _ in om.component_data_objects(Var))
+        self.model['pyomo_constraints'] = sum(
+            1 for _ in om.component_data_objects(Constraint, active=True))
+        if solver_results is None:
+            return
+        problem = solver_results.problem
+        if isinstance(problem, list):
+            problem = problem[0]
+        for name in ('number_of_variables', 'number_of_constraints',
+                     'number_of_nonzeros'):
+            value = getattr(problem, name, None)
+            value = getattr(value, 'value', value)
+            try:
+                self.model[name.replace('number_of_', '')] = int(value)
+            except (TypeError, ValueError):
+                self.model[name.replace('number_of_', '')] = None
+
+    def to_dict(self):
+
+        # the report as dictionary, including the totals over all phases;
+
+        return {
+            'info': self.info,
+            'phases': self.phases,
+            'total': {
+                'wall_time': sum(p['wall_time'] for p in self.phases),
+                'cpu_time': sum(p['cpu_time'] for p in self.phases),
+                'solver_cpu_time': sum(p['solver_cpu_time'] or 0
+                                       for p in self.phases),
+                'peak_rss': max([p['peak_rss'] for p in self.phases
+                                 if p['peak_rss'] is not None] or [None]),
+                },
+            'model': self.model,
+            'results': self.results,
+            }
+
+    def write(self, filename):
+
+        # writes the report as JSON file;
+
+        with open(filename, 'w') as f:
+            json.dump(self.to_dict(), f, indent=2, default=str)
+        return filename
+
+
+@contextmanager
+def phase(report, name):
+
+    # measures the enclosed code as phase "name" of "report" (see
+    # RunReport.phase); does nothing if report is None;
+
+    if report is None:
+        yield
+    else:
+        with report.phase(name):
+            yield
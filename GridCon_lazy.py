@@ -0,0 +1,224 @@
+# -*- coding: utf-8 -*-
+"""
+Module to solve the GridCon model with lazily added grid capacity constraints.
+
+The capacity of the grid connection is bounded by the flow through the
+transformers in every timestep (InvestmentFlow.max), but only few timesteps
+bind it: the peaks of the machine load and the midday surplus of PV
+generation. solve_lazy starts with these constraints on candidate timesteps
+only (the highest and the lowest net load), solves, adds the constraints of
+all timesteps whose flow exceeds the capacity and solves again until no
+constraint is violated. The result is the optimum of the full model, each
+solve having far fewer rows.
+
+This pays off as long as the grid connection is sized by its peaks, i.e. the
+storage is expensive compared to the grid. A cheap storage flattens the grid
+flow, so that the capacity binds in most timesteps; then several solves are
+needed, each of them written to the solver anew by pyomo, and solving the
+full model at once is faster.
+"""
+
+##################################################################################
+# IMPORTS
+##################################################################################
+
+import logging
+import time
+
+import numpy as np
+
+import GridCon_storage_171221d as gridcon
+
+##################################################################################
+# CANDIDATE TIMESTEPS
+##################################################################################
+
+# flows through the transformers of the grid connection, bounded by its
+# capacity; the first one carries imports, the second one exports;
+
+GRID_FLOWS = (('transformer_mv_to_lv', 'b_el_lv'),
+              ('b_el_lv', 'transformer_lv_to_mv'))
+
+
+def net_load(om):
+
+    """
+    net load of the low voltage grid
+
+    parameters
+    ----------
+    om : solph.OperationalModel
+
+    returns
+    -------
+    numpy.ndarray
+        base load plus machine load minus PV generation in kW per timestep;
+        taken from energysystem.fixed_flows if the fixed flows are collapsed,
+        else from the fixed flow variables
+
+    """
+
+    energysystem = om.es
+    groups = energysystem.groups
+    load = np.zeros(len(om.TIMESTEPS))
+    for key in gridcon.FIXED_FLOWS:
+        values = energysystem.fixed_flows.get(key)
+        if values is None:
+            i, o = groups[key[0]], groups[key[1]]
+            values = np.array([om.flow[i, o, t].value for t in om.TIMESTEPS],
+                              dtype=float)
+        load += values if key[0] == 'b_el_lv' else -values
+    return load
+
+
+def candidate_timesteps(load, candidates):
+
+    # returns the timesteps with the highest net load (candidates of the
+    # import capacity) and with the lowest net load (candidates of the export
+    # capacity);
+
+    candidates = min(candidates, len(load))
+    order = np.argsort(load, kind='mergesort')
+    return set(order[-candidates:].tolist()), set(order[:candidates].tolist())
+
+##################################################################################
+# LAZY SOLVE
+##################################################################################
+
+def solve_lazy(om, candidates=None, tolerance=1e-6, max_iterations=50,
+               **solve_options):
+
+    """
+    solves the model adding grid capacity constraints only where violated
+
+    parameters
+    ----------
+    om : solph.OperationalModel
+        model built by create_model; its capacity constraints of the grid
+        flows are deactivated except on the candidate timesteps and activated
+        where violated; all of them are active again after solving
+    candidates : int
+        number of timesteps with the highest and with the lowest net load
+        whose constraints are active from the start; defaults to 1% of the
+        timesteps, at least 24
+    tolerance : float
+        flows exceeding the capacity by more than this (kW) are violations
+    max_iterations : int
+        maximum number of solves
+    **solve_options :
+        passed to solve_model, e.g. solver, solver_threads; debug and
+        tee_switch default to False
+
+    returns
+    -------
+    tuple
+        results of the last solve (see solve_model) and a list with one
+        dict per solve with the number of active capacity constraints
+        ("rows"), of violated ones ("violations") and the wall time
+        ("solve_time")
+
+    """
+
+    solve_options.setdefault('debug', False)
+    solve_options.setdefault('tee_switch', False)
+    groups = om.es.groups
+    timesteps = list(om.TIMESTEPS)
+    if candidates is None:
+        candidates = max(24, len(timesteps) // 100)
+
+    # the constraints of the import flow are kept on the highest, those of
+    # the export flow on the lowest net load;
+
+    load = net_load(om)
+    importing, exporting = candidate_timesteps(load, candidates)
+    flows = [(groups[i], groups[o]) for i, o in GRID_FLOWS]
+    active = {flows[0]: importing, flows[1]: exporting}
+    for flow in flows:
+        for t in timesteps:
+            if t not in active[flow]:
+                om.InvestmentFlow.max[flow[0], flow[1], t].deactivate()
+
+    # with a storage the solver shifts the flow to the timesteps without
+    # constraint, so that adding only the violated ones converges slowly;
+    # since the capacity binds the timesteps with the highest (lowest) net
+    # load first, all timesteps whose net load is at least as extreme as that
+    # of a violated one are added together;
+
+    order = {flows[0]: -load, flows[1]: load}
+    telemetry = []
+    try:
+        for iteration in range(max_iterations):
+            started = time.perf_counter()
+            rows = sum(len(a) for a in active.values())
+            results = gridcon.solve_model(om, **solve_options)
+            violations = 0
+            for flow in flows:
+                capacity = om.InvestmentFlow.invest[flow].value
+                violated = []
+                for t in timesteps:
+                    if t in active[flow]:
+                        continue
+                    value = om.flow[flow[0], flow[1], t].value
+                    limit = om.flows[flow].max[t] * capacity
+                    if value is not None and value > limit + tolerance:
+                        violated.append(t)
+                violations += len(violated)
+                if not violated:
+                    continue
+                threshold = order[flow][violated].max()
+                for t in timesteps:
+                    if t not in active[flow] and order[flow][t] <= threshold:
+                        active[flow].add(t)
+                        om.InvestmentFlow.max[flow[0], flow[1], t].activate()
+            telemetry.append({
+                'rows': rows,
+                'violations': violations,
+                'solve_time': time.perf_counter() - started})
+            logging.info('Lazy solve {0}: {1} capacity constraints, {2} '
+                         'violated'.format(iteration + 1,
+                                           rows, violations))
+            if not violations:
+                return results, telemetry
+        raise RuntimeError('Grid capacity constraints still violated after '
+                           '{0} solves'.format(max_iterations))
+    finally:
+        for flow in flows:
+            for t in timesteps:
+                om.InvestmentFlow.max[flow[0], flow[1], t].activate()
+
+
+def optimise_lazy(data, parameters=None, number_timesteps=None,
+                  candidates=None, solver='cbc', solver_threads=None):
+
+    """
+    sizes grid connection and storage with lazy grid capacity constraints
+
+    parameters
+    ----------
+    data : pandas.DataFrame
+        profile with the columns "demand_el", "machine_load" and "pv"
+    parameters : dict
+        parameter overrides (see GridCon_storage.DEFAULT_PARAMETERS)
+    number_timesteps : int
+        number of 15 minutes timesteps; defaults to the length of the profile
+    candidates :
+        see solve_lazy
+    solver, solver_threads :
+        see GridCon_storage.solve_model
+
+    returns
+    -------
+    tuple
+        GridCon_storage.GridConResults and the telemetry of solve_lazy
+
+    """
+
+    if number_timesteps is None:
+        number_timesteps = len(data)
+    p = gridcon.merge_parameters(parameters)
+    energysystem = gridcon.create_energysystem(
+        data, p, number_timesteps, collapse_fixed_flows=True)
+    om = gridcon.create_model(energysystem)
+    _, telemetry = solve_lazy(om, candidates, solver=solver,
+                              solver_threads=solver_threads)
+    return gridcon.extract_results(energysystem, p), telemetry
@@ -0,0 +1,605 @@
+# -*- coding: utf-8 -*-
+"""
+Module providing a GridCon model which is built once and solved repeatedly.
+
+The coefficients of the objective function (ep_costs of the grid connection and
+of the storage, variable costs of the flows) are mutable pyomo parameters.
+Changing economic parameters therefore only updates these coefficients; the
+energy system and the operational model are not rebuilt. If a persistent
+solver interface is available (e.g. gurobi_persistent, cplex_persistent), the
+model is also passed to the solver only once.
+"""
+
+##################################################################################
+# IMPORTS
+##################################################################################
+
+import logging
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import weakref
+
+import numpy as np
+from pyomo import environ
+from pyomo.opt import SolverFactory
+
+import GridCon_storage_171221d as gridcon
+
+##################################################################################
+# PARAMETERS WHICH CAN BE CHANGED WITHOUT REBUILDING THE MODEL
+##################################################################################
+
+# parameters which only enter the coefficients of the objective function;
+# all other parameters (efficiencies, grid losses, storage limits) enter the
+# constraints and require a new model;
+
+COST_PARAMETERS = frozenset([
+    'n', 'invest_grid', 'invest_el_lv_1_storage', 'wacc', 'u_grid',
+    'cost_decrease_grid', 'oc_rate_grid', 'u_el_lv_1_storage',
+    'cost_decrease_el_lv_1_storage', 'oc_rate_el_lv_1_storage', 'prl_on',
+    'prl_weeks', 'prl_remuneration', 'cost_electricity_losses',
+    'cost_grid_excess',
+    ])
+
+# persistent pyomo interfaces of the solvers which offer one;
+
+PERSISTENT_SOLVERS = {
+    'gurobi': 'gurobi_persistent',
+    'cplex': 'cplex_persistent',
+    'xpress': 'xpress_persistent',
+    }
+
+##################################################################################
+# REUSABLE MODEL
+##################################################################################
+
+class ReusableModel(object):
+
+    """
+    GridCon model with mutable cost coefficients
+
+    parameters
+    ----------
+    data : pandas.DataFrame
+        profile with the columns "demand_el", "machine_load" and "pv"
+    parameters : dict
+        parameter overrides (see GridCon_storage.DEFAULT_PARAMETERS)
+    number_timesteps : int
+        number of 15 minutes timesteps
+    weighting : array_like
+        optional weighting of the timesteps (see create_energysystem)
+    solver : str
+        name of the solver; its persistent interface (PERSISTENT_SOLVERS) is
+        used if available
+    solver_threads : int
+        number of threads the solver may use
+    collapse_fixed_flows : bool
+        build the model with the profile as net injection into the low
+        voltage grid (see create_energysystem); the profile can be changed
+        without rebuilding the model either way (see update_profile)
+
+    attributes
+    ----------
+    energysystem : solph.EnergySystem
+    om : solph.OperationalModel
+    parameters : dict
+        the complete set of parameters of the last update
+    persistent : bool
+        True if a persistent solver interface is used
+    telemetry : list of dict
+        one entry per solve with the number of solver iterations, whether
+        the solve was warm started from the previous one and the iterations
+        saved against a cold solve of the same scenario (None unless solve
+        was called with cold_reference)
+    cbc_files : dict
+        "lp_file", "basis_file" (optimal basis) and "symbol_map" (names of
+        the variables and constraints in both files) of the last solve with
+        cbc and warmstart; None before
+
+    the files of cbc are removed by close, when the model is used as context
+    manager, or at the latest when the model is garbage collected
+
+    """
+
+    def __init__(self, data, parameters=None, number_timesteps=(96*366),
+                 weighting=None, solver='cbc', solver_threads=None,
+                 collapse_fixed_flows=False):
+
+        self.parameters = gridcon.merge_parameters(parameters)
+        self.weighting = weighting
+        self.solver = solver
+        self.solver_threads = solver_threads
+        self.telemetry = []
+        self._directory = None
+        self._remove_directory = None
+        self.cbc_files = None
+        self._symbol_map_id = None
+        self._summary = None
+
+        # the profile of the model, against which changes are detected (see
+        # update_profile);
+
+        self._profile = {
+            key: np.asarray(data[column], dtype=float)[:number_timesteps]
+            for key, column in gridcon.FIXED_FLOWS.items()}
+
+        self.energysystem = gridcon.create_energysystem(
+            data, self.parameters, number_timesteps, weighting=weighting,
+            collapse_fixed_flows=collapse_fixed_flows)
+        self.om = gridcon.create_model(self.energysystem)
+        self._make_costs_mutable()
+
+        self._persistent_solver = None
+        persistent_name = PERSISTENT_SOLVERS.get(solver)
+        if persistent_name is not None:
+            try:
+                opt = SolverFactory(persistent_name)
+                if opt.available(exception_flag=False):
+                    self._persistent_solver = opt
+            except Exception:
+                pass
+        if self._persistent_solver is not None:
+            logging.info('Use persistent solver {0}'.format(persistent_name))
+            if solver_threads is not None:
+                self._persistent_solver.options['threads'] = solver_threads
+            self._persistent_solver.set_instance(self.om)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @property
+    def persistent(self):
+        return self._persistent_solver is not None
+
+    def _make_costs_mutable(self):
+
+        # replaces the cost expressions of oemof, whose coefficients are fixed
+        # numbers, by expressions built on mutable parameters;
+        # the objective is replaced by the sum of these expressions so that
+        # om.InvestmentFlow.investment_costs() etc. stay consistent with it;
+
+        om = self.om
+        groups = self.energysystem.groups
+        ep_costs, variable_costs = gridcon.cost_coefficients(self.parameters)
+
+        self._ep_keys = [k for k in ep_costs if isinstance(k, tuple)]
+        self._vc_keys = list(variable_costs)
+        storage = groups['el_lv_1_storage']
+
+        om.ep_costs_flow = environ.Param(
+            range(len(self._ep_keys)), mutable=True,
+            initialize=dict(enumerate(ep_costs[k] for k in self._ep_keys)))
+        om.ep_costs_storage = environ.Param(
+            mutable=True, initialize=ep_costs['el_lv_1_storage'])
+        om.variable_costs = environ.Param(
+            range(len(self._vc_keys)), mutable=True,
+            initialize=dict(enumerate(variable_costs[k]
+                                      for k in self._vc_keys)))
+
+        # per timestep, the variable costs are multiplied by the duration of
+        # the timestep and the weighting of the timestep;
+
+        time_step = self.energysystem.timeindex.freq.nanos / 3.6e12
+        n_timesteps = len(self.energysystem.timeindex)
+        factor = time_step * (np.ones(n_timesteps) if self.weighting is None
+                              else np.asarray(self.weighting, dtype=float))
+
+        investment_flow_costs = sum(
+            om.ep_costs_flow[j] * om.InvestmentFlow.invest[
+                groups[i], groups[o]]
+            for j, (i, o) in enumerate(self._ep_keys))
+        investment_storage_costs = (om.ep_costs_storage
+                                    * om.InvestmentStorage.invest[storage])
+        flow_costs = sum(
+            om.variable_costs[j] * sum(
+                float(factor[t]) * om.flow[groups[i], groups[o], t]
+                for t in om.TIMESTEPS)
+            for j, (i, o) in enumerate(self._vc_keys))
+
+        om.InvestmentFlow.investment_costs.set_value(investment_flow_costs)
+        om.InvestmentStorage.investment_costs.set_value(
+            investment_storage_costs)
+        om.Flow.variable_costs.set_value(flow_costs)
+
+        om.del_component(om.objective)
+        om.objective = environ.Objective(
+            expr=om.InvestmentFlow.investment_costs
+            + om.InvestmentStorage.investment_costs + om.Flow.variable_costs,
+            sense=environ.minimize)
+
+    def update(self, **parameters):
+
+        """
+        changes cost parameters without rebuilding the model
+
+        parameters
+        ----------
+        **parameters :
+            new values of parameters from COST_PARAMETERS; parameters not
+            given keep their current value
+
+        """
+
+        structural = sorted(set(parameters) - COST_PARAMETERS)
+        if structural:
+            raise ValueError('Parameter(s) {0} change the constraints and '
+                             'require a new model'.format(', '.join(structural)))
+        self.parameters = gridcon.merge_parameters(self.parameters,
+                                                   **parameters)
+        ep_costs, variable_costs = gridcon.cost_coefficients(self.parameters)
+
+        for j, k in enumerate(self._ep_keys):
+            self.om.ep_costs_flow[j] = ep_costs[k]
+        self.om.ep_costs_storage.set_value(ep_costs['el_lv_1_storage'])
+        for j, k in enumerate(self._vc_keys):
+            self.om.variable_costs[j] = variable_costs[k]
+
+        if self.persistent:
+            self._persistent_solver.set_objective(self.om.objective)
+
+    def refresh_solver(self, added=(), changed=(), variables=()):
+
+        """
+        passes changes made directly on om to a persistent solver
+
+        a persistent solver holds a copy of the model, which does not follow
+        blocks added to om, constraints whose coefficients depend on changed
+        mutable parameters or changed bounds of variables; the objective is
+        always passed again; without persistent solver nothing is done, since
+        the model is written to the solver anew for each solve
+
+        parameters
+        ----------
+        added : list
+            blocks added to om since the model was passed to the solver
+        changed : list
+            constraints (constraint data) to be passed again
+        variables : list
+            variables whose bounds or values (fixed variables) have changed
+
+        """
+
+        if not self.persistent:
+            return
+        opt = self._persistent_solver
+        for block in added:
+            opt.add_block(block)
+        for constraint in changed:
+            opt.remove_constraint(constraint)
+            opt.add_constraint(constraint)
+        for var in variables:
+            opt.update_var(var)
+        opt.set_objective(self.om.objective)
+
+    def update_profile(self, data):
+
+        """
+        replaces the profile without rebuilding the model
+
+        only the timesteps in which the new profile differs from the current
+        one are updated: the net injection into the low voltage grid if the
+        model was built with collapse_fixed_flows, else the values of the
+        fixed flow variables; persistent solvers only receive the balances of
+        these timesteps again
+
+        parameters
+        ----------
+        data : pandas.DataFrame
+            profile with the columns "demand_el", "machine_load" and "pv" and
+            at least as many timesteps as the model
+
+        returns
+        -------
+        numpy.ndarray
+            the changed timesteps
+
+        """
+
+        om = self.om
+        energysystem = self.energysystem
+        groups = energysystem.groups
+        n_timesteps = len(om.TIMESTEPS)
+        if len(data) < n_timesteps:
+            raise ValueError('The profile has {0} timesteps, the model '
+                             '{1}'.format(len(data), n_timesteps))
+
+        profile = {key: np.asarray(data[column], dtype=float)[:n_timesteps]
+                   for key, column in gridcon.FIXED_FLOWS.items()}
+        changed = np.zeros(n_timesteps, dtype=bool)
+        for key, values in profile.items():
+            changed |= values != self._profile[key]
+        changed = np.flatnonzero(changed)
+
+        if energysystem.fixed_flows:
+            net_injection = np.zeros(n_timesteps)
+            for key, values in profile.items():
+                energysystem.fixed_flows[key] = values
+                net_injection += -values if key[0] == 'b_el_lv' else values
+            parameter = om.NetInjection.net_injection
+            for t in changed:
+                parameter[int(t)] = float(net_injection[t])
+        else:
+            for (i, o), values in profile.items():
+                flow = (groups[i], groups[o])
+                nominal_value = om.flows[flow].nominal_value
+                for t in changed:
+                    om.flow[flow[0], flow[1], int(t)].fix(
+                        float(values[t]) * nominal_value)
+        self._profile = profile
+
+        # persistent solvers hold a copy of the constraints, which have to be
+        # passed again with the new right-hand side or fixed values;
+
+        if self.persistent:
+            b_el_lv = groups['b_el_lv']
+            for t in changed:
+                balance = om.Bus.balance[b_el_lv, int(t)]
+                self._persistent_solver.remove_constraint(balance)
+                self._persistent_solver.add_constraint(balance)
+        logging.info('{0} of {1} timesteps of the profile changed'.format(
+            len(changed), n_timesteps))
+        return changed
+
+    def reoptimise(self, data, tee_switch=False):
+
+        """
+        re-solves the model after a change of the profile
+
+        the changed timesteps are updated (see update_profile) and the model
+        is solved warm started from the previous solution, so that the
+        solver iterations grow with the size of the change; with cbc, the
+        model is still written to the lp-file as a whole; a persistent solver
+        (e.g. gurobi) only receives the changed balances
+
+        parameters
+        ----------
+        data : pandas.DataFrame
+            revised profile with the columns "demand_el", "machine_load" and
+            "pv", e.g. with a new machine schedule for a few weeks
+        tee_switch : bool
+            display the solver messages
+
+        returns
+        -------
+        dict
+            summary as returned by solve plus "changed_timesteps"; the
+            previous summary if the profile did not change
+
+        """
+
+        changed = self.update_profile(data)
+        if not len(changed) and self._summary is not None:
+            summary = dict(self._summary)
+        else:
+            summary = self.solve(tee_switch=tee_switch, warmstart=True)
+        summary['changed_timesteps'] = len(changed)
+        return summary
+
+    def solve(self, tee_switch=False, warmstart=False, cold_reference=False,
+              **parameters):
+
+        """
+        solves the model, optionally after updating cost parameters
+
+        parameters
+        ----------
+        tee_switch : bool
+            display the solver messages
+        warmstart : bool
+            start from the solution of the previous solve: persistent solvers
+            keep their basis and receive the current values of all variables
+            (investments, state of charge, flows) as a starting point; cbc is
+            called directly and reads the optimal basis it has written in the
+            previous solve (pyomo's cbc interface places basis options before
+            the import of the model, where cbc ignores them)
+        cold_reference : bool
+            if the solve is warm started, solve the same scenario once more
+            without warm start to measure the iterations saved; this doubles
+            the solve time, the results are those of the warm-started solve
+        **parameters :
+            cost parameters to be updated before solving (see update)
+
+        returns
+        -------
+        dict
+            summary of the results as returned by summarise_results plus the
+            telemetry fields "iterations", "warm_started" and
+            "iterations_saved" (None without cold reference)
+
+        """
+
+        if parameters:
+            self.update(**parameters)
+
+        # the solver log is only needed to read the iterations; it is kept in
+        # the working directory with the basis files of cbc, else it is a
+        # temporary file removed after reading;
+
+        if self.persistent:
+            results = self._persistent_solver.solve(
+                tee=tee_switch, warmstart=warmstart and bool(self.telemetry))
+            self._store_results(results)
+            telemetry = self._record_iterations(results, warmstart)
+        elif warmstart and self.solver == 'cbc':
+            logfile = os.path.join(self._working_directory(), 'solver.log')
+            results = self._solve_cbc_with_basis(logfile, tee_switch)
+            self._store_results(results)
+            telemetry = self._record_iterations(results, warmstart, logfile)
+        else:
+            handle, logfile = tempfile.mkstemp(prefix='gridcon_',
+                                               suffix='.log')
+            os.close(handle)
+            try:
+                results = gridcon.solve_model(
+                    self.om, solver=self.solver, debug=False,
+                    tee_switch=tee_switch, solver_threads=self.solver_threads,
+                    warmstart=warmstart and bool(self.telemetry),
+                    logfile=logfile)
+                telemetry = self._record_iterations(results, warmstart,
+                                                    logfile)
+            finally:
+                os.remove(logfile)
+
+        if cold_reference and telemetry['warm_started']:
+            cold = self._cold_iterations()
+            if cold is not None and telemetry['iterations'] is not None:
+                telemetry['iterations_saved'] = cold - telemetry['iterations']
+
+        summary = gridcon.summarise_results(self.energysystem,
+                                            self.parameters,
+                                            weighting=self.weighting)
+        summary.update(telemetry)
+        self._summary = summary
+        return dict(summary)
+
+    def _working_directory(self):
+
+        # temporary directory for the lp-file, the basis files and the log of
+        # cbc; it is removed by close or when the model is garbage collected;
+
+        if self._directory is None:
+            self._directory = tempfile.mkdtemp(prefix='gridcon_')
+            self._remove_directory = weakref.finalize(
+                self, shutil.rmtree, self._directory, True)
+        return self._directory
+
+    def _solve_cbc_with_basis(self, logfile, tee_switch=False):
+
+        # writes the model as lp-file, calls cbc such that it reads the basis
+        # of the previous solve (if any) after importing the model and writes
+        # the optimal basis after solving, and loads the solution into the
+        # model; returns the termination message of cbc;
+
+        directory = self._working_directory()
+        lp_file = os.path.join(directory, 'GridCon.lp')
+        basis_file = os.path.join(directory, 'GridCon.bas')
+        solution_file = os.path.join(directory, 'GridCon.sol')
+
+        # every lp-file registers a symbol map with the model; only the one of
+        # the current lp-file is kept;
+
+        _, symbol_map_id = self.om.write(
+            lp_file, io_options={'symbolic_solver_labels': True})
+        symbol_map = self.om.solutions.symbol_map[symbol_map_id]
+        self._delete_symbol_map()
+        self._symbol_map_id = symbol_map_id
+
+        command = [SolverFactory('cbc').executable(), '-import', lp_file]
+        if os.path.exists(basis_file):
+            command.extend(['-basisI', basis_file])
+        if self.solver_threads is not None:
+            command.extend(['-threads', str(self.solver_threads)])
+        command.extend(['-solve', '-basisO', basis_file,
+                        '-solu', solution_file])
+        # the output of cbc is written to the log and, with tee_switch, shown
+        # while cbc runs;
+
+        with open(logfile, 'w') as log:
+            process = subprocess.Popen(command, stdout=subprocess.PIPE,
+                                       stderr=subprocess.STDOUT,
+                                       universal_newlines=True)
+            for line in process.stdout:
+                log.write(line)
+                if tee_switch:
+                    sys.stdout.write(line)
+                    sys.stdout.flush()
+            if process.wait():
+                raise subprocess.CalledProcessError(process.returncode,
+                                                    command)
+
+        # cbc only lists variables with non-zero values;
+
+        for var in self.om.component_data_objects(environ.Var):
+            if not var.fixed:
+                var.value = 0
+        with open(solution_file) as solution:
+            status = solution.readline().strip()
+            for line in solution:
+                tokens = line.split()
+                if tokens and tokens[0] == '**':
+                    tokens = tokens[1:]
+                if len(tokens) < 3 or tokens[1] not in symbol_map.bySymbol:
+                    continue
+                var = symbol_map.bySymbol[tokens[1]]()
+                if not var.fixed:
+                    var.value = float(tokens[2])
+        if not status.startswith('Optimal'):
+            raise RuntimeError('cbc did not find an optimal solution: '
+                               '{0}'.format(status))
+        self.cbc_files = {'lp_file': lp_file, 'basis_file': basis_file,
+                          'symbol_map': symbol_map}
+        return status
+
+    def _delete_symbol_map(self):
+
+        # removes the symbol map of the previous lp-file from the model;
+
+        if self._symbol_map_id is not None:
+            self.om.solutions.delete_symbol_map(self._symbol_map_id)
+            self._symbol_map_id = None
+
+    def _record_iterations(self, results, warmstart, logfile=None):
+
+        # records the solver iterations and whether the solve started from
+        # the solution of a previous one;
+
+        iterations = gridcon.solver_iterations(results, logfile)
+        if iterations is None and self.persistent:
+            try:
+                iterations = int(self._persistent_solver.get_model_attr(
+                    'IterCount'))
+            except Exception:
+                iterations = None
+        entry = {'iterations': iterations,
+                 'warm_started': bool(warmstart and self.telemetry),
+                 'iterations_saved': None}
+        self.telemetry.append(entry)
+        return entry
+
+    def _cold_iterations(self):
+
+        # solves the current scenario once more by solve_model without warm
+        # start and returns its iterations; the results of the energy system
+        # are those of the solve before, the basis files of cbc and the
+        # persistent solver are not touched;
+
+        results = self.energysystem.results
+        handle, logfile = tempfile.mkstemp(prefix='gridcon_', suffix='.log')
+        os.close(handle)
+        try:
+            solved = gridcon.solve_model(
+                self.om, solver=self.solver, debug=False, tee_switch=False,
+                solver_threads=self.solver_threads, logfile=logfile)
+            return gridcon.solver_iterations(solved, logfile)
+        finally:
+            os.remove(logfile)
+            self.energysystem.results = results
+
+    def close(self):
+
+        # removes the solver log, the files written for warm starting cbc and
+        # the symbol map of the last lp-file;
+
+        if self._remove_directory is not None:
+            self._remove_directory()
+            self._remove_directory = None
+            self._directory = None
+            self.cbc_files = None
+        self._delete_symbol_map()
+
+    def _store_results(self, results):
+
+        # stores the results, which have already been loaded into the model,
+        # in the energy system in the same way as OperationalModel.solve does;
+
+        self.energysystem.results = self.om.results()
+        self.energysystem.results.objective = self.om.objective()
+        self.energysystem.results.solver = results
+        if self.energysystem.fixed_flows:
+            gridcon.restore_fixed_flows(self.energysystem)
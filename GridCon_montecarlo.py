@@ -0,0 +1,285 @@
+# -*- coding: utf-8 -*-
+"""
+Module to propagate uncertain economic assumptions to the optimal sizing.
+
+Economic inputs like the cost of capital (wacc), the lifetime and cost decrease
+of the storage and the income from primary balancing power (prl_weeks,
+prl_remuneration) are sampled from distributions. They enter the LP only
+through the specific equivalent periodical costs (ep_costs) of the grid
+connection and of the storage, which are computed for all samples at once by
+specific_costs of GridCon_storage on arrays (economics_BAUM.epc_array). The
+ep_costs are quantised into buckets and only one sample per bucket (its
+representative) is solved, in parallel and warm started (see GridCon_sweep);
+all samples of a bucket share its capacities. A few hundred solves thus stand
+for many thousand samples.
+"""
+
+##################################################################################
+# IMPORTS
+##################################################################################
+
+import logging
+
+import numpy as np
+import pandas as pd
+
+import GridCon_storage_171221d as gridcon
+from GridCon_sweep import sweep_storage_size
+
+##################################################################################
+# DISTRIBUTIONS OF THE ECONOMIC PARAMETERS
+##################################################################################
+
+# parameters which only enter the ep_costs of grid connection and storage;
+# cost_electricity_losses and cost_grid_excess also enter the variable costs
+# and cannot be sampled here;
+
+ECONOMIC_PARAMETERS = frozenset([
+    'n', 'invest_grid', 'invest_el_lv_1_storage', 'wacc', 'u_grid',
+    'cost_decrease_grid', 'oc_rate_grid', 'u_el_lv_1_storage',
+    'cost_decrease_el_lv_1_storage', 'oc_rate_el_lv_1_storage', 'prl_on',
+    'prl_weeks', 'prl_remuneration',
+    ])
+
+# default distributions as (name of a numpy.random.RandomState method,
+# arguments); the lifetime of the storage is drawn among divisors of the
+# financial period n;
+
+DEFAULT_DISTRIBUTIONS = {
+    'wacc': ('uniform', 0.03, 0.08),
+    'cost_decrease_el_lv_1_storage': ('uniform', 0.05, 0.15),
+    'u_el_lv_1_storage': ('choice', [5, 10]),
+    'prl_weeks': ('randint', 0, 14),
+    'prl_remuneration': ('triangular', 1500, 3000, 3500),
+    }
+
+
+def sample_parameters(distributions=None, samples=1000, parameters=None,
+                      seed=0):
+
+    """
+    draws random parameter sets
+
+    parameters
+    ----------
+    distributions : dict
+        {parameter: (method, arguments...)}, where method is the name of a
+        numpy.random.RandomState method, e.g. ('uniform', 0.03, 0.08),
+        ('normal', 3000, 500), ('triangular', 1500, 3000, 3500) or
+        ('choice', [5, 10]); defaults to DEFAULT_DISTRIBUTIONS
+    samples : int
+        number of samples
+    parameters : dict
+        overrides of the parameters which are not sampled
+    seed : int
+        seed of the random numbers
+
+    returns
+    -------
+    pandas.DataFrame
+        one row per sample and one column per parameter (complete set)
+
+    """
+
+    if distributions is None:
+        distributions = DEFAULT_DISTRIBUTIONS
+    unknown = sorted(set(distributions) - ECONOMIC_PARAMETERS)
+    if unknown:
+        raise ValueError('Parameter(s) {0} do not only enter the ep_costs '
+                         'and cannot be sampled'.format(', '.join(unknown)))
+
+    rng = np.random.RandomState(seed)
+    base = gridcon.merge_parameters(parameters)
+    frame = pd.DataFrame({name: np.repeat(value, samples)
+                          for name, value in base.items()})
+    for name in sorted(distributions):
+        method, arguments = distributions[name][0], distributions[name][1:]
+        frame[name] = getattr(rng, method)(*arguments, size=samples)
+    return frame[sorted(base)]
+
+
+def ep_costs_array(samples):
+
+    """
+    ep_costs of grid connection and storage for many parameter sets at once
+
+    parameters
+    ----------
+    samples : pandas.DataFrame
+        one complete parameter set per row, see sample_parameters
+
+    returns
+    -------
+    pandas.DataFrame
+        columns "kN" (sepc_grid in €/kW per year), "kS", "prl_income" and
+        "kS_netto" (in €/kWh per year) as in specific_costs
+
+    """
+
+    # specific_costs with one array per parameter, vectorised over the
+    # samples;
+
+    costs = gridcon.specific_costs(
+        {name: samples[name].values.astype(float) for name in samples})
+    return pd.DataFrame({'kN': costs['sepc_grid'], 'kS': costs['kS_el'],
+                         'prl_income': costs['prl_income'],
+                         'kS_netto': costs['kS_el_netto']},
+                        index=samples.index)
+
+##################################################################################
+# MONTE CARLO ANALYSIS
+##################################################################################
+
+def bucket_samples(ep_costs, resolution=0.05):
+
+    """
+    assigns samples with similar ep_costs to the same bucket
+
+    parameters
+    ----------
+    ep_costs : pandas.DataFrame
+        as returned by ep_costs_array
+    resolution : float
+        width of a bucket relative to the range of the ep_costs of grid
+        connection and storage over the samples, respectively; there are at
+        most (1 / resolution + 1) ** 2 buckets
+
+    returns
+    -------
+    tuple
+        numpy.ndarray with the bucket of each sample and list with the
+        index of the representative of each bucket, the sample whose
+        ep_costs are closest to the mean of its bucket
+
+    """
+
+    values = ep_costs[['kN', 'kS_netto']].values
+    low = values.min(axis=0)
+    width = resolution * (values.max(axis=0) - low)
+    width[width == 0] = 1
+    keys = np.floor((values - low) / width).astype(np.int64)
+    _, bucket = np.unique(keys, axis=0, return_inverse=True)
+
+    representatives = []
+    for b in range(bucket.max() + 1):
+        members = np.flatnonzero(bucket == b)
+        distance = (np.abs(values[members] - values[members].mean(axis=0))
+                    / width).sum(axis=1)
+        representatives.append(members[distance.argmin()])
+    return bucket, representatives
+
+
+def monte_carlo(distributions=None, samples=1000, parameters=None,
+                filename="GridCon1_Profile.csv", number_timesteps=(96*366),
+                resolution=0.05, seed=0, solver='cbc', max_workers=None,
+                solver_threads=1):
+
+    """
+    distribution of the optimal sizing under uncertain economic inputs
+
+    parameters
+    ----------
+    distributions, samples, parameters, seed :
+        see sample_parameters
+    filename : str
+        profile file passed to read_profile
+    number_timesteps : int
+        number of 15 minutes timesteps
+    resolution : float
+        width of the ep_costs buckets, see bucket_samples; 0 solves every
+        distinct sample
+    solver, max_workers, solver_threads :
+        see GridCon_sweep.sweep_storage_size
+
+    returns
+    -------
+    pandas.DataFrame
+        one row per sample with the sampled parameters, the ep_costs ("kN",
+        "kS", "prl_income", "kS_netto"), the "bucket", the capacities of the
+        representative of the bucket, the fixed, variable and total annual
+        costs of these capacities at the ep_costs of the sample, and the
+        column "error"; samples with storage ep_costs at or below zero (the
+        balancing power income exceeds the costs) would make the LP
+        unbounded; they are not solved and reported with an error
+
+    """
+
+    frame = sample_parameters(distributions, samples, parameters, seed)
+    ep_costs = ep_costs_array(frame)
+    results = pd.concat([frame, ep_costs], axis=1)
+    for column in ('grid_supply_capacity', 'grid_collection_capacity',
+                   'storage_capacity', 'total_variable_costs'):
+        results[column] = np.nan
+    results['bucket'] = -1
+    results['error'] = 'unbounded: kS_netto <= 0'
+    bounded = np.flatnonzero(ep_costs['kS_netto'].values > 0)
+    if not len(bounded):
+        return results
+
+    if resolution > 0:
+        bucket, representatives = bucket_samples(ep_costs.iloc[bounded],
+                                                 resolution)
+    else:
+        _, representatives, bucket = np.unique(
+            ep_costs[['kN', 'kS_netto']].values[bounded], axis=0,
+            return_index=True, return_inverse=True)
+    representatives = bounded[representatives]
+    logging.info('{0} samples in {1} ep_costs buckets'.format(
+        len(bounded), len(representatives)))
+
+    # only the sampled parameters and the overrides are passed to the sweep;
+    # all sampled parameters are cost parameters, so the representatives are
+    # solved on reusable models, warm started from each other;
+
+    passed = sorted(set(distributions or DEFAULT_DISTRIBUTIONS)
+                    | set(parameters or {}))
+    parameter_sets = [{name: frame[name].iat[i].item() for name in passed}
+                      for i in representatives]
+    solved = sweep_storage_size(
+        parameter_sets, filename, number_timesteps, solver=solver,
+        max_workers=max_workers, solver_threads=solver_threads,
+        warmstart=True)
+
+    rows = results.index[bounded]
+    results.loc[rows, 'bucket'] = bucket
+    for column in ('grid_supply_capacity', 'grid_collection_capacity',
+                   'storage_capacity', 'total_variable_costs', 'error'):
+        if column in solved:
+            results.loc[rows, column] = solved[column].values[bucket]
+
+    results['total_fixed_costs'] = (
+        0.5 * results['kN'] * (results['grid_supply_capacity']
+                               + results['grid_collection_capacity'])
+        + results['kS_netto'] * results['storage_capacity'])
+    results['total_annual_costs'] = (results['total_fixed_costs']
+                                     + results['total_variable_costs'])
+    return results
+
+
+def capacity_distribution(results, quantiles=(0.05, 0.25, 0.5, 0.75, 0.95)):
+
+    """
+    quantiles of the sized capacities and costs over the samples
+
+    parameters
+    ----------
+    results : pandas.DataFrame
+        as returned by monte_carlo
+    quantiles : iterable of float
+        quantiles to be reported
+
+    returns
+    -------
+    pandas.DataFrame
+        one row per quantile plus "mean" for grid and storage capacity and
+        total annual costs; failed samples are left out
+
+    """
+
+    valid = results[results['error'].isnull()]
+    columns = ['grid_supply_capacity', 'storage_capacity',
+               'total_annual_costs']
+    values = valid[columns].astype(float)
+    table = values.quantile(list(quantiles))
+    table.loc['mean'] = values.mean()
+    return table
@@ -0,0 +1,340 @@
+# -*- coding: utf-8 -*-
+"""
+Module to race a portfolio of solvers and configurations on one scenario.
+
+solve_model runs one solver without time limit. Some scenarios take long with
+one solver or LP algorithm and are solved in seconds by another one, e.g. cbc
+with the default perturbation of the dual simplex against cbc without it, or
+the interior point method of GridCon_sparse against both. solve_portfolio
+builds the same model in one worker process per configuration, takes the
+first proven optimal result and terminates the other workers together with
+their solver processes. At the time limit all of them are terminated.
+
+The winner of each scenario (keyed by GridCon_cache.scenario_key without the
+solver) and the solve times are kept in a history file. Configurations are
+started in the order of the history: first the winner of the same scenario,
+then those which won most often, so that with fewer workers than
+configurations the historically fastest ones run first.
+"""
+
+##################################################################################
+# IMPORTS
+##################################################################################
+
+import json
+import logging
+import multiprocessing
+from multiprocessing.connection import wait
+import os
+import signal
+import tempfile
+import time
+
+from pyomo.opt import TerminationCondition
+
+from oemof.tools import helpers
+
+import GridCon_storage_171221d as gridcon
+from GridCon_benchmark import available_solvers
+from GridCon_cache import scenario_key
+import GridCon_sparse
+
+##################################################################################
+# CONFIGURATIONS
+##################################################################################
+
+# configurations of the portfolio by name: the solver for solve_model ("linprog"
+# for the in-memory interior point method of GridCon_sparse), its command line
+# options and its command line flags (options without value, see
+# solve_model); the options of cbc are set before the model is imported, so
+# only parameters, not actions like "barrier", can be given;
+
+CONFIGURATIONS = {
+    'cbc': {'solver': 'cbc'},
+    'cbc_no_perturbation': {'solver': 'cbc',
+                            'cmdline_options': {'perturbation': 'off'}},
+    'cbc_no_scaling': {'solver': 'cbc',
+                       'cmdline_options': {'scaling': 'off'}},
+    'cbc_idiot_crash': {'solver': 'cbc',
+                        'cmdline_options': {'crash': 'idiot1'}},
+    'glpk': {'solver': 'glpk'},
+    'glpk_interior': {'solver': 'glpk', 'cmdline_flags': ['interior']},
+    'gurobi_primal': {'solver': 'gurobi', 'cmdline_options': {'method': 0}},
+    'gurobi_dual': {'solver': 'gurobi', 'cmdline_options': {'method': 1}},
+    'gurobi_barrier': {'solver': 'gurobi', 'cmdline_options': {'method': 2}},
+    'cplex_primal': {'solver': 'cplex', 'cmdline_options': {'lpmethod': 1}},
+    'cplex_dual': {'solver': 'cplex', 'cmdline_options': {'lpmethod': 2}},
+    'cplex_barrier': {'solver': 'cplex', 'cmdline_options': {'lpmethod': 4}},
+    'linprog_interior': {'solver': 'linprog'},
+    }
+
+
+def available_configurations(configurations=None):
+
+    # returns the names of the configurations whose solver can run here;
+
+    if configurations is None:
+        configurations = CONFIGURATIONS
+    solvers = set(available_solvers(
+        {c['solver'] for c in configurations.values()} - {'linprog'}))
+    solvers.add('linprog')
+    return [name for name, c in configurations.items()
+            if c['solver'] in solvers]
+
+##################################################################################
+# HISTORY OF THE WINNERS
+##################################################################################
+
+class SolverHistory(object):
+
+    """
+    winners and solve times of past races, kept in a json file
+
+    parameters
+    ----------
+    filename : str
+        defaults to ~/.oemof/solver_portfolio/history.json
+
+    """
+
+    def __init__(self, filename=None):
+
+        if filename is None:
+            filename = os.path.join(
+                helpers.extend_basic_path('solver_portfolio'),
+                'history.json')
+        self.filename = filename
+
+    def load(self):
+
+        # returns {scenario key: {"winner": name, "solve_time": seconds}};
+        # a missing or unreadable file is an empty history;
+
+        try:
+            with open(self.filename) as f:
+                return json.load(f)
+        except (IOError, OSError, ValueError):
+            return {}
+
+    def record(self, key, winner, solve_time):
+
+        # records the winner of a scenario; the file is read again and
+        # replaced at once, so that concurrent races lose at most the record
+        # of one another, never the whole history;
+
+        history = self.load()
+        history[key] = {'winner': winner, 'solve_time': solve_time}
+        directory = os.path.dirname(os.path.abspath(self.filename))
+        handle, temporary = tempfile.mkstemp(dir=directory,
+                                             prefix='.writing_',
+                                             suffix='.json')
+        try:
+            with os.fdopen(handle, 'w') as f:
+                json.dump(history, f, indent=1, sort_keys=True)
+            os.replace(temporary, self.filename)
+        except OSError:
+            logging.warning('Solver history could not be written')
+        finally:
+            if os.path.exists(temporary):
+                os.remove(temporary)
+
+    def order(self, names, key=None):
+
+        """
+        configurations ordered by their past races
+
+        parameters
+        ----------
+        names : list
+            names of the configurations
+        key : str
+            scenario key; its winner comes first
+
+        returns
+        -------
+        list
+            the winner of the scenario, then the configurations by the
+            number of races won (ties by the median solve time of the wins),
+            then the others in the given order
+
+        """
+
+        history = self.load()
+        wins = {}
+        for entry in history.values():
+            wins.setdefault(entry['winner'], []).append(entry['solve_time'])
+
+        def rank(name):
+            times = sorted(wins.get(name, []))
+            median = times[len(times) // 2] if times else float('inf')
+            first = key is not None and history.get(key, {}).get(
+                'winner') == name
+            return (not first, -len(times), median)
+
+        return sorted(names, key=rank)
+
+##################################################################################
+# RACE
+##################################################################################
+
+def _race_worker(connection, name, configuration, data, parameters,
+                 number_timesteps, solver_threads):
+
+    # solves the scenario with one configuration and sends (name, optimal,
+    # results, solve time, message); the worker leads a process group of its
+    # own, so that terminating the group also terminates the solver started
+    # by pyomo;
+
+    if hasattr(os, 'setpgrp'):
+        os.setpgrp()
+    started = time.perf_counter()
+    try:
+        if configuration['solver'] == 'linprog':
+            results = GridCon_sparse.optimise_sparse(
+                data, parameters, number_timesteps,
+                options=configuration.get('cmdline_options'))
+            optimal, message = True, 'optimal'
+        else:
+            energysystem = gridcon.create_energysystem(
+                data, parameters, number_timesteps, collapse_fixed_flows=True)
+            om = gridcon.create_model(energysystem)
+            solved = gridcon.solve_model(
+                om, solver=configuration['solver'], debug=False,
+                tee_switch=False, solver_threads=solver_threads,
+                cmdline_options=configuration.get('cmdline_options'),
+                cmdline_flags=configuration.get('cmdline_flags'))
+            condition = solved.solver.termination_condition
+            optimal = condition == TerminationCondition.optimal
+            message = str(condition)
+            results = (gridcon.extract_results(energysystem, parameters)
+                       if optimal else None)
+        connection.send((name, optimal, results,
+                         time.perf_counter() - started, message))
+    except Exception as e:
+        logging.exception('Configuration {0} failed'.format(name))
+        connection.send((name, False, None, time.perf_counter() - started,
+                         repr(e)))
+    finally:
+        connection.close()
+
+
+def _terminate(process):
+
+    # terminates a worker and its solver;
+
+    if not process.is_alive():
+        return
+    try:
+        os.killpg(process.pid, signal.SIGTERM)
+    except (AttributeError, OSError):
+        process.terminate()
+    process.join(timeout=5)
+    if process.is_alive():
+        process.terminate()
+
+
+def solve_portfolio(data, parameters=None, number_timesteps=None,
+                    configurations=None, time_limit=None, max_workers=None,
+                    solver_threads=1, history=None):
+
+    """
+    sizes grid connection and storage by the first of several solvers
+
+    parameters
+    ----------
+    data : pandas.DataFrame
+        profile with the columns "demand_el", "machine_load" and "pv"
+    parameters : dict
+        parameter overrides (see GridCon_storage.DEFAULT_PARAMETERS)
+    number_timesteps : int
+        number of 15 minutes timesteps; defaults to the length of the profile
+    configurations : list
+        names of CONFIGURATIONS to race; defaults to all available ones
+    time_limit : float
+        wall time in seconds after which all workers are terminated
+    max_workers : int
+        number of configurations running at once; defaults to all of them;
+        further configurations start whenever one ends without an optimal
+        result
+    solver_threads : int
+        threads of each solver (see solve_model)
+    history : SolverHistory
+        defaults to a SolverHistory in ~/.oemof/solver_portfolio
+
+    returns
+    -------
+    tuple
+        GridCon_storage.GridConResults of the winner and a dict with the
+        "winner", its "solve_time" and the "outcomes" of the configurations
+        which ended before ("optimal" or the reason) and of those terminated
+        ("terminated")
+
+    """
+
+    if number_timesteps is None:
+        number_timesteps = len(data)
+    if history is None:
+        history = SolverHistory()
+    if configurations is None:
+        configurations = available_configurations()
+    unknown = set(configurations) - set(CONFIGURATIONS)
+    if unknown:
+        raise ValueError('Unknown configurations: {0}'.format(
+            ', '.join(sorted(unknown))))
+    p = gridcon.merge_parameters(parameters)
+    key = scenario_key(data, p, number_timesteps, solver=None)
+    waiting = history.order(list(configurations), key)
+    if max_workers is None:
+        max_workers = len(waiting)
+    logging.info('Solver portfolio: {0}'.format(', '.join(waiting)))
+
+    deadline = None if time_limit is None else time.time() + time_limit
+    running = {}
+    outcomes = {}
+    winner = None
+    try:
+        while winner is None and (waiting or running):
+            while waiting and len(running) < max_workers:
+                name = waiting.pop(0)
+                parent, child = multiprocessing.Pipe(duplex=False)
+                process = multiprocessing.Process(
+                    target=_race_worker,
+                    args=(child, name, CONFIGURATIONS[name], data, p,
+                          number_timesteps, solver_threads))
+                process.daemon = True
+                process.start()
+                child.close()
+                running[parent] = (name, process)
+
+            timeout = (None if deadline is None
+                       else max(0, deadline - time.time()))
+            ready = wait(list(running), timeout)
+            if not ready:
+                raise RuntimeError('No optimal result within {0} s'.format(
+                    time_limit))
+            for connection in ready:
+                name, process = running.pop(connection)
+                try:
+                    name, optimal, results, solve_time, message = \
+                        connection.recv()
+                except EOFError:
+                    optimal, message = False, 'worker died'
+                connection.close()
+                process.join(timeout=5)
+                outcomes[name] = message
+                logging.info('{0}: {1}'.format(name, message))
+                if optimal and winner is None:
+                    winner = (name, results, solve_time)
+    finally:
+        for connection, (name, process) in running.items():
+            _terminate(process)
+            connection.close()
+            outcomes[name] = 'terminated'
+
+    if winner is None:
+        raise RuntimeError('No configuration found an optimal result: '
+                           '{0}'.format(outcomes))
+    name, results, solve_time = winner
+    history.record(key, name, solve_time)
+    return results, {'winner': name, 'solve_time': solve_time,
+                     'outcomes': outcomes}
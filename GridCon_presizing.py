@@ -0,0 +1,205 @@
+# -*- coding: utf-8 -*-
+"""
+Module for a fast estimate of grid connection and storage size without LP.
+
+For a given grid capacity G, the storage has to cover the net load exceeding
+G. The energy it has to hold follows from the cumulative energy deficit
+D_t = max(0, D_t-1 + x_t), where x_t is the net load above G (divided by the
+discharging efficiency) or, if negative, the recharging below G (multiplied
+by the charging efficiency). This recursion has the closed form
+D_t = S_t - min(0, min_k<=t S_k) with S the cumulative sum of x, so that the
+required storage for many grid capacities is obtained with a few vectorised
+numpy operations. Self-discharge and the charging power limit are neglected,
+hence the storage size is a lower bound for the given grid capacity.
+
+From the cheapest combination of grid capacity and storage, bounds on the
+investments of the LP are derived.
+"""
+
+##################################################################################
+# IMPORTS
+##################################################################################
+
+import numpy as np
+
+import GridCon_storage_171221d as gridcon
+
+##################################################################################
+# STORAGE REQUIRED FOR GIVEN GRID CAPACITIES
+##################################################################################
+
+def net_load(data):
+
+    # net load of the low voltage grid in kW: base load plus machine load minus
+    # PV generation;
+
+    return (data['demand_el'].values + data['machine_load'].values
+            - data['pv'].values).astype(float)
+
+
+def required_storage(load, grid_capacity, parameters, time_step=0.25,
+                     chunk_size=16):
+
+    """
+    smallest storage capacity covering the net load above the grid capacity
+
+    parameters
+    ----------
+    load : numpy.ndarray
+        net load in kW per timestep
+    grid_capacity : float or array_like
+        grid supply capacities in kW to be evaluated
+    parameters : dict
+        complete set of parameters (see merge_parameters); "icf", "ocf",
+        "capacity_min" and "capacity_max" are used
+    time_step : float
+        duration of a timestep in hours
+    chunk_size : int
+        number of grid capacities evaluated at once (limits the memory)
+
+    returns
+    -------
+    numpy.ndarray
+        nominal storage capacity in kWh per grid capacity; the capacity has
+        to hold the maximum cumulative deficit within the usable range
+        capacity_max - capacity_min and to deliver the peak of the net load
+        above the grid capacity (nominal output ratio of 1 kW per kWh)
+
+    """
+
+    p = parameters
+    grid_capacity = np.atleast_1d(np.asarray(grid_capacity, dtype=float))
+    usable = p['capacity_max'] - p['capacity_min']
+
+    # the profile is repeated once because the storage operates cyclically:
+    # a deficit at the end of the year may be preceded by one at its start;
+
+    cyclic_load = np.concatenate([load, load])
+    energy = np.empty(len(grid_capacity))
+    for start in range(0, len(grid_capacity), chunk_size):
+        g = grid_capacity[start:start + chunk_size, None]
+        x = cyclic_load[None, :] - g
+        x = np.where(x > 0, x / p['ocf'], x * p['icf']) * time_step
+        cumulated = np.cumsum(x, axis=1)
+        deficit = cumulated - np.minimum(
+            np.minimum.accumulate(cumulated, axis=1), 0)
+        energy[start:start + chunk_size] = deficit.max(axis=1)
+
+    power = np.maximum(load.max() - grid_capacity, 0)
+    return np.maximum(energy / usable, power)
+
+##################################################################################
+# COST-OPTIMAL HEURISTIC DESIGN AND INVESTMENT BOUNDS
+##################################################################################
+
+def presize(data, parameters=None, n_candidates=200, time_step=0.25,
+            margin=1.1):
+
+    """
+    heuristic sizing and bounds on the investments of the LP
+
+    parameters
+    ----------
+    data : pandas.DataFrame
+        profile with the columns "demand_el", "machine_load" and "pv"
+    parameters : dict
+        parameter overrides (see GridCon_storage.DEFAULT_PARAMETERS)
+    n_candidates : int
+        number of grid capacities between 0 and the peak net load evaluated
+    time_step : float
+        duration of a timestep in hours
+    margin : float
+        factor applied to the upper bounds to absorb the simplifications of
+        the heuristic
+
+    returns
+    -------
+    dict
+        "grid_capacity", "storage_capacity" and "annual_costs" of the
+        cheapest heuristic design, the estimated "variable_costs" of that
+        design, and "bounds": {"grid": (lower, upper), "storage": (lower,
+        upper)} for create_energysystem and create_model; an upper bound is
+        None if it cannot be derived (e.g. for non-positive storage costs)
+
+    """
+
+    p = gridcon.merge_parameters(parameters)
+    ep_costs, variable_costs = gridcon.cost_coefficients(p)
+    cost_grid = (ep_costs['transformer_mv_to_lv', 'b_el_lv']
+                 + ep_costs['b_el_lv', 'transformer_lv_to_mv'])
+    cost_storage = ep_costs['el_lv_1_storage']
+
+    load = net_load(data)
+    peak_import = max(load.max(), 0.)
+    peak_export = max(-load.min(), 0.)
+
+    candidates = np.linspace(0, peak_import, n_candidates)
+    storage = required_storage(load, candidates, p, time_step)
+    costs = cost_grid * candidates + max(cost_storage, 0) * storage
+    best = int(np.argmin(costs))
+
+    # upper estimate of the variable costs of the heuristic design: every kWh
+    # of net load passes the grid and the storage once, every kWh of surplus
+    # is curtailed;
+
+    energy = np.abs(load).sum() * time_step
+    surplus = np.maximum(-load, 0).sum() * time_step
+    variable = (energy * (variable_costs['transformer_lv_to_mv', 'b_el_mv']
+                          + variable_costs['b_el_mv', 'transformer_mv_to_lv']
+                          + variable_costs['b_el_lv', 'el_lv_1_storage'])
+                + surplus * variable_costs['b_el_lv', 'el_lv_4_excess_sink'])
+
+    # the optimum costs at most as much as the heuristic design; an
+    # investment cannot cost more than that on its own;
+
+    budget = (costs[best] + variable) * margin
+    grid_upper = max(peak_import, peak_export) * margin
+    if cost_grid > 0:
+        grid_upper = min(grid_upper, budget / cost_grid)
+    storage_upper = budget / cost_storage if cost_storage > 0 else None
+
+    # any design needs at least the storage required for its grid capacity;
+    # hence the grid capacity must be large enough for the storage to stay
+    # below its upper bound, and the storage must cover the net load above
+    # the upper bound of the grid capacity;
+
+    grid_lower = 0.
+    if storage_upper is not None:
+        too_small = np.flatnonzero(storage > storage_upper)
+        if len(too_small):
+            grid_lower = float(candidates[too_small[-1]])
+    storage_lower = float(required_storage(load, grid_upper, p, time_step)[0])
+
+    return {
+        'grid_capacity': float(candidates[best]),
+        'storage_capacity': float(storage[best]),
+        'annual_costs': float(costs[best]),
+        'variable_costs': float(variable),
+        'bounds': {'grid': (grid_lower, grid_upper),
+                   'storage': (storage_lower, storage_upper)},
+        }
+
+##################################################################################
+# LP WITH BOUNDED INVESTMENTS
+##################################################################################
+
+def optimise_presized(filename="GridCon1_Profile.csv", solver='cbc',
+                      number_timesteps=(96*366), tee_switch=True,
+                      solver_threads=None, **parameters):
+
+    # solves the LP with the investments bounded by the heuristic; returns the
+    # energy system and the result of presize;
+
+    p = gridcon.merge_parameters(parameters)
+    data = gridcon.read_profile(
+        filename, number_timesteps, list(gridcon.PROFILE_COLUMNS))
+    estimate = presize(data, p)
+    bounds = estimate['bounds']
+
+    energysystem = gridcon.create_energysystem(data, p, number_timesteps,
+                                               investment_bounds=bounds)
+    om = gridcon.create_model(energysystem, investment_bounds=bounds)
+    gridcon.solve_model(om, solver=solver, debug=False, tee_switch=tee_switch,
+                        solver_threads=solver_threads)
+    gridcon.print_results(gridcon.summarise_results(energysystem, p))
+    return energysystem, estimate
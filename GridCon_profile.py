@@ -0,0 +1,204 @@
+# -*- coding: utf-8 -*-
+"""
+Module to store load and generation profiles in a binary cache.
+
+A profile csv-file is parsed once and its numeric columns are written as one
+float64 array (one row per column) in numpy's .npy format, in a directory
+named by the SHA-256 hash of the content of the csv-file. The hash is looked up
+by path, size and modification time of the csv-file first, so that a cached
+profile is found without reading the csv-file. Later reads map the array into
+memory instead of parsing the text again: only the pages of the
+selected columns and timesteps are read, and processes reading the same
+profile (e.g. the workers of a sweep) share these pages in the page cache of
+the operating system instead of each holding its own copy.
+"""
+
+##################################################################################
+# IMPORTS
+##################################################################################
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from oemof.tools import helpers
+
+##################################################################################
+# LOCATION OF THE CACHE
+##################################################################################
+
+def content_hash(filename, block_size=(1 << 20)):
+
+    # returns the SHA-256 hash of the content of a file;
+
+    sha = hashlib.sha256()
+    with open(filename, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+def _file_key(filename):
+
+    # returns the SHA-256 hash of absolute path, size and modification time
+    # of a file, which changes whenever the file is replaced or modified;
+
+    stat = os.stat(filename)
+    description = '{0}|{1}|{2}'.format(os.path.abspath(filename),
+                                       stat.st_size, stat.st_mtime_ns)
+    return hashlib.sha256(description.encode('utf-8')).hexdigest()
+
+
+def cache_directory(filename, cache_dir=None):
+
+    # returns the directory of the cached profile of a csv-file; by default
+    # the cache is kept in ~/.oemof/profile_cache next to the lp_files;
+    # the content hash of the file is stored in "index/<file key>" (see
+    # _file_key), so that the file is only read to hash it if it is new or
+    # has changed;
+
+    if cache_dir is None:
+        cache_dir = helpers.extend_basic_path('profile_cache')
+    index = os.path.join(cache_dir, 'index')
+    entry = os.path.join(index, _file_key(filename))
+    try:
+        with open(entry) as f:
+            digest = f.read().strip()
+    except (IOError, OSError):
+        digest = ''
+    if len(digest) != 64:
+        digest = content_hash(filename)
+        if not os.path.isdir(index):
+            os.makedirs(index, exist_ok=True)
+        handle, temporary = tempfile.mkstemp(dir=index, prefix='.writing_')
+        try:
+            with os.fdopen(handle, 'w') as f:
+                f.write(digest)
+            os.replace(temporary, entry)
+        except OSError:
+            logging.warning('Profile index of {0} could not be '
+                            'written'.format(filename))
+        finally:
+            if os.path.exists(temporary):
+                os.remove(temporary)
+    return os.path.join(cache_dir, digest)
+
+##################################################################################
+# CONVERSION OF CSV-FILES
+##################################################################################
+
+def convert_profile(filename, cache_dir=None):
+
+    """
+    converts a profile csv-file into the binary cache if not yet done
+
+    parameters
+    ----------
+    filename : str
+        csv-file with one column per profile and one row per timestep
+    cache_dir : str
+        directory of the cache; defaults to ~/.oemof/profile_cache
+
+    returns
+    -------
+    str
+        directory holding "profile.npy" (array of shape (columns, timesteps))
+        and "columns.json" (names of the columns)
+
+    """
+
+    directory = cache_directory(filename, cache_dir)
+    if os.path.exists(os.path.join(directory, 'columns.json')):
+        return directory
+
+    logging.info('Convert {0} into the profile cache'.format(filename))
+    data = pd.read_csv(filename, sep=",")
+    numeric = data.select_dtypes(include=[np.number])
+    skipped = [c for c in data.columns if c not in numeric.columns]
+    if skipped:
+        logging.info('Non-numeric column(s) {0} are not cached'.format(
+            ', '.join(skipped)))
+
+    # the files are written to a temporary directory which is renamed at
+    # once, so that concurrent workers never read a partly written profile;
+    # if another worker has converted the file meanwhile, its result is kept;
+
+    parent = os.path.dirname(directory)
+    if not os.path.isdir(parent):
+        os.makedirs(parent)
+    temporary = tempfile.mkdtemp(dir=parent, prefix='.converting_')
+    try:
+        np.save(os.path.join(temporary, 'profile.npy'),
+                np.ascontiguousarray(numeric.values.T, dtype=np.float64))
+        with open(os.path.join(temporary, 'columns.json'), 'w') as f:
+            json.dump([str(c) for c in numeric.columns], f)
+        os.rename(temporary, directory)
+    except OSError:
+        if not os.path.exists(os.path.join(directory, 'columns.json')):
+            raise
+    finally:
+        shutil.rmtree(temporary, ignore_errors=True)
+    return directory
+
+##################################################################################
+# MEMORY-MAPPED LOADING
+##################################################################################
+
+def load_profile(filename, columns=None, number_timesteps=None,
+                 cache_dir=None):
+
+    """
+    loads a profile from the binary cache, converting the csv-file if needed
+
+    parameters
+    ----------
+    filename : str
+        csv-file of the profile
+    columns : list of str
+        columns to be loaded; defaults to all numeric columns
+    number_timesteps : int
+        number of timesteps (rows) to be loaded from the start of the profile;
+        defaults to all
+    cache_dir : str
+        directory of the cache; defaults to ~/.oemof/profile_cache
+
+    returns
+    -------
+    pandas.DataFrame
+        read-only profile; if the selected columns are stored next to each
+        other (e.g. all columns or a single one), its values are a view of
+        the memory-mapped file, otherwise only the selected columns are
+        copied
+
+    """
+
+    directory = convert_profile(filename, cache_dir)
+    with open(os.path.join(directory, 'columns.json')) as f:
+        stored = json.load(f)
+    profile = np.load(os.path.join(directory, 'profile.npy'), mmap_mode='r')
+
+    if columns is None:
+        columns = stored
+    missing = [c for c in columns if c not in stored]
+    if missing:
+        raise KeyError('Column(s) {0} not in profile {1}'.format(
+            ', '.join(missing), filename))
+    positions = [stored.index(c) for c in columns]
+    rows = slice(None, number_timesteps)
+
+    if positions and positions == list(range(positions[0],
+                                             positions[0] + len(positions))):
+        values = profile[positions[0]:positions[-1] + 1, rows]
+    else:
+        values = np.stack([profile[i, rows] for i in positions])
+
+    # the array of shape (columns, timesteps) is passed transposed, which is
+    # the layout pandas uses internally, so that no copy is made;
+
+    return pd.DataFrame(values.T, columns=list(columns), copy=False)
@@ -0,0 +1,239 @@
+# -*- coding: utf-8 -*-
+"""
+Module to run the GridCon model at a coarser time resolution for screening.
+
+The 15 minutes profile is resampled to 30 minutes or hours, which makes the
+LP two to four times smaller. Plain averaging erases the short machine load
+peaks which set the size of the grid connection, hence three rules are
+offered:
+
+- "mean": the mean of each block of timesteps; conserves the energy of each
+  column, but smooths the peaks;
+- "max": the values of the timestep with the largest absolute net load within
+  each block; preserves the import and export peaks of the net load, but not
+  the energy;
+- "energy": the mean of each block, except for the blocks with the highest
+  and the lowest net load of each day, which take the values of their peak
+  timestep; the other blocks of the day are scaled so that the daily energy
+  of each column is conserved where the other blocks allow it.
+
+The time step of the model, the variable costs and the self-discharge of the
+storage follow the resolution (see create_energysystem). resampling_error
+compares the sizing with the full resolution.
+"""
+
+##################################################################################
+# IMPORTS
+##################################################################################
+
+import logging
+import time
+
+import numpy as np
+import pandas as pd
+
+import GridCon_storage_171221d as gridcon
+
+##################################################################################
+# RESAMPLING OF PROFILES
+##################################################################################
+
+RULES = ('mean', 'max', 'energy')
+
+
+def _blocks(data, factor):
+
+    # returns the profile columns as array of shape (blocks, factor, columns)
+    # and the net load of shape (blocks, factor); incomplete blocks at the end
+    # are dropped;
+
+    n_blocks = len(data) // factor
+    if n_blocks * factor < len(data):
+        logging.info('{0} timesteps at the end of the profile are dropped '
+                     'by the resampling'.format(len(data) - n_blocks * factor))
+    values = np.asarray(data[list(gridcon.PROFILE_COLUMNS)], dtype=float)
+    values = values[:n_blocks * factor].reshape(n_blocks, factor, -1)
+    demand, machine, pv = [values[:, :, i] for i in range(3)]
+    return values, demand + machine - pv
+
+
+def resample_profile(data, time_step=1.0, rule='energy',
+                     original_time_step=0.25):
+
+    """
+    resamples a profile to a coarser time step
+
+    parameters
+    ----------
+    data : pandas.DataFrame
+        profile with the columns "demand_el", "machine_load" and "pv"
+    time_step : float
+        new duration of a timestep in hours; a multiple of the original one
+    rule : str
+        "mean", "max" or "energy", see module description
+    original_time_step : float
+        duration of a timestep of "data" in hours
+
+    returns
+    -------
+    pandas.DataFrame
+        resampled profile with the columns "demand_el", "machine_load" and
+        "pv" in kW
+
+    """
+
+    factor = int(round(time_step / original_time_step))
+    if factor < 1 or abs(factor * original_time_step - time_step) > 1e-9:
+        raise ValueError('time_step must be a multiple of {0} h'.format(
+            original_time_step))
+    if rule not in RULES:
+        raise ValueError('Unknown rule {0}, use one of {1}'.format(
+            rule, ', '.join(RULES)))
+
+    values, net = _blocks(data, factor)
+    blocks = np.arange(len(values))
+    mean = values.mean(axis=1)
+
+    if rule == 'mean':
+        resampled = mean
+
+    elif rule == 'max':
+        peak = np.abs(net).argmax(axis=1)
+        resampled = values[blocks, peak]
+
+    else:
+        per_day = int(round(24 / time_step))
+        if len(values) % per_day:
+            raise ValueError('The rule "energy" requires whole days')
+        days = len(values) // per_day
+
+        # blocks and timesteps of the highest and lowest net load of each day;
+
+        highest = net.max(axis=1).reshape(days, per_day).argmax(axis=1)
+        lowest = net.min(axis=1).reshape(days, per_day).argmin(axis=1)
+        offset = np.arange(days) * per_day
+        resampled = mean.copy()
+        for block, step in ((lowest + offset,
+                             net[lowest + offset].argmin(axis=1)),
+                            (highest + offset,
+                             net[highest + offset].argmax(axis=1))):
+            resampled[block] = values[block, step]
+
+        # the remaining blocks of each day are scaled to conserve the daily
+        # energy of each column; this is not possible if they hold no energy
+        # of the column (e.g. a single machine load peak on a day) or if the
+        # peaks alone hold more energy than the whole day (the scaling factor
+        # is limited to zero);
+
+        peak = np.zeros(len(values), dtype=bool)
+        peak[highest + offset] = True
+        peak[lowest + offset] = True
+
+        def daily(x):
+            return x.reshape(days, per_day, -1).sum(axis=1)
+
+        other = daily(np.where(peak[:, None], 0, resampled))
+        target = daily(mean) - daily(np.where(peak[:, None], resampled, 0))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            scale = np.where(other > 0, target / other, 1).clip(0)
+        resampled = np.where(peak[:, None], resampled,
+                             resampled * np.repeat(scale, per_day, axis=0))
+
+    return pd.DataFrame(resampled, columns=list(gridcon.PROFILE_COLUMNS))
+
+##################################################################################
+# OPTIMISATION AT COARSER RESOLUTION
+##################################################################################
+
+def optimise_resampled(data, parameters=None, time_step=1.0, rule='energy',
+                       solver='cbc', solver_threads=None):
+
+    """
+    sizes grid connection and storage on a resampled profile
+
+    parameters
+    ----------
+    data : pandas.DataFrame
+        15 minutes profile with the columns "demand_el", "machine_load" and
+        "pv"
+    parameters : dict
+        parameter overrides (see GridCon_storage.DEFAULT_PARAMETERS)
+    time_step, rule :
+        see resample_profile; a time_step of 0.25 solves the full resolution
+    solver, solver_threads :
+        see GridCon_storage.solve_model
+
+    returns
+    -------
+    dict
+        summary of the results as returned by summarise_results plus
+        "time_step", "rule", "timesteps" and the wall time "run_time" of
+        building and solving in seconds
+
+    """
+
+    p = gridcon.merge_parameters(parameters)
+    started = time.perf_counter()
+    if time_step != 0.25:
+        data = resample_profile(data, time_step, rule)
+
+    energysystem = gridcon.create_energysystem(
+        data, p, len(data), collapse_fixed_flows=True, time_step=time_step)
+    om = gridcon.create_model(energysystem)
+    gridcon.solve_model(om, solver=solver, debug=False, tee_switch=False,
+                        solver_threads=solver_threads)
+    summary = gridcon.extract_results(energysystem, p).summary
+    summary.update({'time_step': time_step, 'rule': rule,
+                    'timesteps': len(data),
+                    'run_time': time.perf_counter() - started})
+    return summary
+
+
+def resampling_error(data, parameters=None, time_steps=(0.5, 1.0),
+                     rules=RULES, solver='cbc', solver_threads=None):
+
+    """
+    compares the sizing at coarser resolutions with the full resolution
+
+    parameters
+    ----------
+    data : pandas.DataFrame
+        15 minutes profile with the columns "demand_el", "machine_load" and
+        "pv"
+    parameters : dict
+        parameter overrides (see GridCon_storage.DEFAULT_PARAMETERS)
+    time_steps : iterable of float
+        coarser time steps in hours
+    rules : iterable of str
+        resampling rules, see resample_profile
+    solver, solver_threads :
+        see GridCon_storage.solve_model
+
+    returns
+    -------
+    pandas.DataFrame
+        one row for the full resolution and one per time step and rule with
+        the capacities, the total annual costs, the run time and the relative
+        errors ("<column>_error") of capacities and costs with respect to the
+        full resolution
+
+    """
+
+    rows = [optimise_resampled(data, parameters, 0.25, None, solver,
+                               solver_threads)]
+    for time_step in time_steps:
+        for rule in rules:
+            rows.append(optimise_resampled(data, parameters, time_step, rule,
+                                           solver, solver_threads))
+
+    columns = ['time_step', 'rule', 'timesteps', 'run_time',
+               'grid_supply_capacity', 'storage_capacity',
+               'total_fixed_costs', 'total_variable_costs',
+               'total_annual_costs']
+    report = pd.DataFrame(rows)[columns]
+    full = report.iloc[0]
+    for column in ('grid_supply_capacity', 'storage_capacity',
+                   'total_annual_costs'):
+        report[column + '_error'] = ((report[column] - full[column])
+                                     / abs(full[column]))
+    return report
@@ -0,0 +1,250 @@
+# -*- coding: utf-8 -*-
+"""
+Module to size the GridCon system over long (multi-year) horizons in windows.
+
+The horizon is split into overlapping time windows which are solved one after
+another, so that only the model of one window is held in memory at any time.
+Two passes are made:
+
+1. sizing pass: the investments (grid connection and storage capacity) are
+   variables in every window, bounded from below by the largest values found
+   in the preceding windows; the final values hold for the whole horizon;
+2. operation pass: the investments are fixed at these values and the dispatch
+   of each window is optimised.
+
+In both passes each window starts from the storage level at the end of the
+committed (non-overlapping) part of the preceding window.
+"""
+
+##################################################################################
+# IMPORTS
+##################################################################################
+
+import gc
+import logging
+
+import numpy as np
+import pandas as pd
+
+import GridCon_storage_171221d as gridcon
+
+##################################################################################
+# TIME WINDOWS
+##################################################################################
+
+def time_windows(number_timesteps, window_length, overlap):
+
+    """
+    overlapping time windows covering a horizon
+
+    parameters
+    ----------
+    number_timesteps : int
+        length of the horizon
+    window_length : int
+        number of timesteps per window including the overlap
+    overlap : int
+        number of timesteps at the end of a window which are optimised but
+        not committed, because they are optimised again in the next window
+
+    returns
+    -------
+    list of tuple
+        (start, committed_end, end) of each window; timesteps start to
+        committed_end - 1 are committed, start to end - 1 are optimised
+
+    """
+
+    if not 0 <= overlap < window_length:
+        raise ValueError('overlap must be smaller than window_length')
+    step = window_length - overlap
+    windows = []
+    for start in range(0, number_timesteps, step):
+        end = min(start + window_length, number_timesteps)
+        windows.append((start, min(start + step, number_timesteps), end))
+        if end == number_timesteps:
+            break
+    return windows
+
+##################################################################################
+# OPTIMISATION OF ONE WINDOW
+##################################################################################
+
+def _solve_window(data, p, weighting, initial_level, lower_bounds, fixed,
+                  solver, solver_threads):
+
+    # solves one window and returns the investments, the flows, the storage
+    # level and the variable costs of the window;
+
+    energysystem = gridcon.create_energysystem(data, p, len(data),
+                                               weighting=weighting)
+    om = gridcon.create_model(energysystem)
+    groups = energysystem.groups
+    storage = groups['el_lv_1_storage']
+    invest_vars = {
+        'grid_supply_capacity': om.InvestmentFlow.invest[
+            groups['transformer_mv_to_lv'], groups['b_el_lv']],
+        'grid_collection_capacity': om.InvestmentFlow.invest[
+            groups['b_el_lv'], groups['transformer_lv_to_mv']],
+        'storage_capacity': om.InvestmentStorage.invest[storage],
+        }
+
+    if initial_level is not None:
+        gridcon.set_initial_storage_level(om, energysystem, p, initial_level)
+    for name, var in invest_vars.items():
+        if fixed is not None:
+            var.fix(fixed[name])
+        elif lower_bounds is not None:
+            var.setlb(lower_bounds[name])
+
+    gridcon.solve_model(om, solver=solver, debug=False, tee_switch=False,
+                        solver_threads=solver_threads)
+
+    investments = {name: var.value for name, var in invest_vars.items()}
+    flows = {key: np.array([om.flow[groups[key[0]], groups[key[1]], t].value
+                            for t in om.TIMESTEPS], dtype=float)
+             for key in gridcon.FLOWS}
+    level = np.array([om.InvestmentStorage.capacity[storage, t].value
+                      for t in om.TIMESTEPS], dtype=float)
+
+    # the model of the window is released before the next one is built;
+
+    del om, energysystem
+    gc.collect()
+    return investments, flows, level
+
+##################################################################################
+# ROLLING HORIZON
+##################################################################################
+
+def optimise_rolling_horizon(data, parameters=None, window_days=28,
+                             overlap_days=7, timesteps_per_day=96,
+                             timesteps_per_year=(96*366), investments=None,
+                             solver='cbc', solver_threads=None,
+                             tolerance=1e-3):
+
+    """
+    sizes grid connection and storage over a long horizon in time windows
+
+    parameters
+    ----------
+    data : pandas.DataFrame
+        profile with the columns "demand_el", "machine_load" and "pv" over
+        the whole horizon, e.g. several weather years one after another
+    parameters : dict
+        parameter overrides (see GridCon_storage.DEFAULT_PARAMETERS)
+    window_days, overlap_days : int
+        length of the windows and of their overlap in days
+    timesteps_per_day, timesteps_per_year : int
+        used to convert the variable costs of a window into annual costs
+    investments : dict
+        if given, the sizing pass is skipped and the capacities
+        ("grid_supply_capacity", "grid_collection_capacity",
+        "storage_capacity") are fixed at these values
+    solver, solver_threads :
+        see GridCon_storage.solve_model
+    tolerance : float
+        unmet load (el_lv_6_grid_excess) up to this power (kW) is solver
+        noise and set to zero, since its variable costs are very high
+
+    returns
+    -------
+    summary : dict
+        capacities, fixed costs (annual costs times number of years),
+        variable costs and total costs over the horizon, and the unmet
+        energy in kWh with its costs, which are part of the variable costs
+    flows : pandas.DataFrame
+        committed flows and storage level over the whole horizon
+
+    """
+
+    p = gridcon.merge_parameters(parameters)
+    number_timesteps = len(data)
+    windows = time_windows(number_timesteps, window_days * timesteps_per_day,
+                           overlap_days * timesteps_per_day)
+    years = number_timesteps / float(timesteps_per_year)
+
+    logging.info('Rolling horizon: {0} timesteps in {1} windows'.format(
+        number_timesteps, len(windows)))
+
+    def run_pass(lower_bounds, fixed):
+
+        # solves all windows one after another and returns the largest
+        # investments found and the committed flows;
+
+        bounds = dict(lower_bounds) if lower_bounds is not None else None
+        level = None
+        committed = {key: [] for key in gridcon.FLOWS}
+        committed['el_lv_1_storage'] = []
+        for start, committed_end, end in windows:
+            window_data = data.iloc[start:end].reset_index(drop=True)
+
+            # the variable costs of a window are scaled to annual costs so that
+            # they are traded off correctly against the annual ep_costs;
+
+            weighting = np.full(end - start, timesteps_per_year
+                                / float(end - start))
+            window_investments, flows, levels = _solve_window(
+                window_data, p, weighting, level, bounds, fixed, solver,
+                solver_threads)
+
+            n = committed_end - start
+            for key in gridcon.FLOWS:
+                committed[key].append(flows[key][:n])
+            committed['el_lv_1_storage'].append(levels[:n])
+            level = levels[n - 1]
+            if bounds is not None:
+                bounds = {k: max(bounds[k], window_investments[k])
+                          for k in bounds}
+            logging.info('Window {0}-{1} solved'.format(start, end))
+        return bounds, {key: np.concatenate(v) for key, v in committed.items()}
+
+    if investments is None:
+        zero = {'grid_supply_capacity': 0, 'grid_collection_capacity': 0,
+                'storage_capacity': 0}
+        investments, _ = run_pass(zero, None)
+
+        # the connection is modelled by two halves of the same size (see
+        # connect_invest_rule), hence both take the larger of the two values;
+
+        grid = max(investments['grid_supply_capacity'],
+                   investments['grid_collection_capacity'])
+        investments['grid_supply_capacity'] = grid
+        investments['grid_collection_capacity'] = grid
+
+    _, committed = run_pass(None, investments)
+
+    unmet = committed['el_lv_6_grid_excess', 'b_el_lv']
+    unmet[unmet <= tolerance] = 0
+
+    ep_costs, variable_costs = gridcon.cost_coefficients(p)
+    time_step = 24. / timesteps_per_day
+    fixed_grid_costs = years * (
+        ep_costs['transformer_mv_to_lv', 'b_el_lv']
+        * investments['grid_supply_capacity']
+        + ep_costs['b_el_lv', 'transformer_lv_to_mv']
+        * investments['grid_collection_capacity'])
+    fixed_storage_costs = (years * ep_costs['el_lv_1_storage']
+                           * investments['storage_capacity'])
+    total_variable_costs = sum(
+        cost * committed[key].sum() * time_step
+        for key, cost in variable_costs.items())
+    unmet_energy = unmet.sum() * time_step
+
+    summary = dict(investments)
+    summary.update({
+        'years': years,
+        'fixed_grid_costs': fixed_grid_costs,
+        'fixed_storage_costs': fixed_storage_costs,
+        'total_fixed_costs': fixed_grid_costs + fixed_storage_costs,
+        'unmet_energy': unmet_energy,
+        'unmet_costs': (unmet_energy
+                        * variable_costs['el_lv_6_grid_excess', 'b_el_lv']),
+        'total_variable_costs': total_variable_costs,
+        'total_costs': (fixed_grid_costs + fixed_storage_costs
+                        + total_variable_costs),
+        })
+    flows = pd.DataFrame(
+        {'_'.join(key) if isinstance(key, tuple) else key: values
+         for key, values in committed.items()})
+    return summary, flows
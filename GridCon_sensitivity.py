@@ -0,0 +1,607 @@
+# -*- coding: utf-8 -*-
+"""
+Module to derive break-even costs and cost ranges from a single solve.
+
+Instead of sweeping the investment costs (see GridCon_sweep), the model is
+solved once and the sensitivity of the optimal sizing is read from the LP
+itself:
+
+- marginal_values uses the duals and reduced costs imported by solve_model
+  (duals=True) with any LP solver: the reduced cost of the investment in the
+  storage and the grid connection and the dual of ConnectInvest; an object
+  which is not built becomes worthwhile once its ep_costs fall below the
+  break-even value ep_costs - reduced cost;
+- cost_ranging uses the optimal basis written by cbc (ReusableModel.solve with
+  warmstart) to compute the interval of each cost coefficient and of cost
+  parameters like invest_el_lv_1_storage over which the current sizing stays
+  optimal (classical LP cost ranging).
+
+Within the interval the optimal basis, and hence the sizing and the dispatch,
+does not change; outside of it another basis is optimal. If the solution is
+degenerate, the sizing may stay the same beyond the interval, so the interval
+is a conservative estimate.
+"""
+
+##################################################################################
+# IMPORTS
+##################################################################################
+
+import logging
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from scipy.sparse.linalg import splu
+
+import GridCon_storage_171221d as gridcon
+from GridCon_model import COST_PARAMETERS, ReusableModel
+
+##################################################################################
+# MARGINAL VALUES FROM DUALS AND REDUCED COSTS
+##################################################################################
+
+# cost parameters ranged by default; the ep_costs and variable costs are
+# linear in each of them;
+
+RANGED_PARAMETERS = ('invest_grid', 'invest_el_lv_1_storage',
+                     'prl_remuneration', 'cost_electricity_losses')
+
+
+def _investment_variables(om, energysystem):
+
+    # returns the investment variables of the storage and of the two halves
+    # of the grid connection together with their ep_costs keys (see
+    # cost_coefficients);
+
+    groups = energysystem.groups
+    variables = [('el_lv_1_storage',
+                  om.InvestmentStorage.invest[groups['el_lv_1_storage']])]
+    for i, o in (('transformer_mv_to_lv', 'b_el_lv'),
+                 ('b_el_lv', 'transformer_lv_to_mv')):
+        variables.append(((i, o),
+                          om.InvestmentFlow.invest[groups[i], groups[o]]))
+    return variables
+
+
+def marginal_values(om, parameters=None):
+
+    """
+    reduced costs of the investments and break-even ep_costs
+
+    parameters
+    ----------
+    om : solph.OperationalModel
+        model solved with solve_model(..., duals=True)
+    parameters : dict
+        parameters of the model (see merge_parameters); defaults to
+        DEFAULT_PARAMETERS
+
+    returns
+    -------
+    dict
+        "storage" and "grid" with the capacity, the ep_costs (€/kWh resp.
+        €/kW per year), the reduced cost and the break-even ep_costs below
+        which an object which is not built becomes worthwhile (NaN for built
+        objects), and "connect_invest_dual", the marginal value of the
+        coupling of the two halves of the grid connection in €/kW per year
+
+    """
+
+    if not hasattr(om, 'rc'):
+        raise ValueError('The model has not been solved with duals=True')
+    ep_costs, _ = gridcon.cost_coefficients(gridcon.merge_parameters(
+        parameters))
+
+    # the grid connection is built in both directions at once (ConnectInvest),
+    # so its ep_costs and reduced cost are those of both halves together;
+
+    values = {}
+    for key, var in _investment_variables(om, om.es):
+        entry = values.setdefault(
+            'storage' if key == 'el_lv_1_storage' else 'grid',
+            {'ep_costs': 0., 'reduced_cost': 0.})
+        entry['capacity'] = var.value
+        entry['ep_costs'] += ep_costs[key]
+        entry['reduced_cost'] += om.rc.get(var, 0.)
+
+    for entry in values.values():
+        entry['break_even_ep_costs'] = (
+            entry['ep_costs'] - entry['reduced_cost']
+            if entry['capacity'] < 1e-9 else np.nan)
+    values['connect_invest_dual'] = om.dual.get(
+        om.ConnectInvest.invest_connect_constr, 0.)
+    return values
+
+##################################################################################
+# READING THE LP-FILE AND THE BASIS OF CBC
+##################################################################################
+
+BASIC, AT_LOWER, AT_UPPER = 0, 1, 2
+
+RELATIONS = ('=', '<=', '>=', '=<', '=>')
+
+
+def _number(token):
+
+    # returns the token as float or None if it is not a number;
+
+    try:
+        return float(token)
+    except ValueError:
+        return None
+
+
+def read_lp(filename):
+
+    """
+    reads an lp-file written by pyomo (CPLEX LP format, one term per line)
+
+    parameters
+    ----------
+    filename : str
+        lp-file of a minimisation problem
+
+    returns
+    -------
+    dict
+        "columns" and "rows" (names), "cost", "lower" and "upper" (bounds
+        of the columns), "row_lower" and "row_upper" (bounds of the rows) as
+        numpy arrays and "matrix", the constraint matrix as
+        scipy.sparse.csc_matrix of shape (rows, columns)
+
+    """
+
+    columns, rows = {}, {}
+    cost, lower, upper, row_lower, row_upper = {}, {}, {}, [], []
+    entries_row, entries_column, entries_value = [], [], []
+    section = None
+
+    def column(name):
+        if name not in columns:
+            columns[name] = len(columns)
+        return columns[name]
+
+    with open(filename) as f:
+        for line in f:
+            tokens = line.split()
+            if not tokens or tokens[0].startswith('\\'):
+                continue
+            head = tokens[0].lower()
+            if head in ('max', 'maximize', 'maximise', 'maximum'):
+                raise ValueError('Only minimisation problems are supported')
+            if head in ('min', 'minimize', 'minimise', 'minimum'):
+                section = 'objective'
+                continue
+            if head in ('s.t.', 'st', 'subject'):
+                section = 'constraints'
+                continue
+            if head == 'bounds':
+                section = 'bounds'
+                continue
+            if head == 'end':
+                break
+
+            if section == 'bounds':
+                if len(tokens) == 5:
+                    name = tokens[2]
+                    lower[name] = float(tokens[0])
+                    upper[name] = float(tokens[4])
+                elif len(tokens) == 2 and tokens[1].lower() == 'free':
+                    name = tokens[0]
+                    lower[name], upper[name] = -np.inf, np.inf
+                elif len(tokens) == 3:
+                    value = _number(tokens[0])
+                    if value is None:
+                        name, relation, value = (tokens[0], tokens[1],
+                                                 float(tokens[2]))
+                    else:
+                        name = tokens[2]
+                        relation = {'<=': '>=', '>=': '<=', '=': '='}[
+                            tokens[1]]
+                    if relation in ('=', '>='):
+                        lower[name] = value
+                    if relation in ('=', '<='):
+                        upper[name] = value
+                else:
+                    raise ValueError('Cannot read the bound {0}'.format(
+                        line.strip()))
+                column(name)
+                continue
+
+            # a label starts the objective or a new row;
+
+            if tokens[0].endswith(':'):
+                if section == 'constraints':
+                    rows[tokens[0][:-1]] = len(rows)
+                    row_lower.append(-np.inf)
+                    row_upper.append(np.inf)
+                tokens = tokens[1:]
+
+            i = 0
+            while i < len(tokens):
+                if tokens[i] in RELATIONS:
+                    rhs = float(tokens[i + 1])
+                    if tokens[i] in ('=', '>=', '=>'):
+                        row_lower[-1] = rhs
+                    if tokens[i] in ('=', '<=', '=<'):
+                        row_upper[-1] = rhs
+                    i += 2
+                    continue
+                coefficient = _number(tokens[i])
+                if coefficient is None:
+                    coefficient, name = 1., tokens[i]
+                    i += 1
+                else:
+                    name = tokens[i + 1]
+                    i += 2
+                j = column(name)
+                if section == 'objective':
+                    cost[j] = cost.get(j, 0.) + coefficient
+                else:
+                    entries_row.append(len(rows) - 1)
+                    entries_column.append(j)
+                    entries_value.append(coefficient)
+
+    # columns without bounds have the default bounds [0, inf) of the format;
+
+    names = sorted(columns, key=columns.get)
+    n = len(names)
+    matrix = sparse.csc_matrix(
+        (entries_value, (entries_row, entries_column)), shape=(len(rows), n))
+    return {
+        'columns': names,
+        'rows': sorted(rows, key=rows.get),
+        'cost': np.array([cost.get(j, 0.) for j in range(n)]),
+        'lower': np.array([lower.get(name, 0.) for name in names]),
+        'upper': np.array([upper.get(name, np.inf) for name in names]),
+        'row_lower': np.array(row_lower),
+        'row_upper': np.array(row_upper),
+        'matrix': matrix,
+        }
+
+
+def read_basis(filename, lp):
+
+    """
+    reads a basis written by cbc (-basisO, MPS basis format)
+
+    parameters
+    ----------
+    filename : str
+        basis file
+    lp : dict
+        the problem as returned by read_lp
+
+    returns
+    -------
+    tuple of numpy.ndarray
+        status of the columns and of the rows (BASIC, AT_LOWER or AT_UPPER)
+
+    """
+
+    # in the MPS basis format, "XU"/"XL" name a basic column and a row which
+    # is at its upper/lower bound, "UL"/"LL" a column at its upper/lower
+    # bound; all other columns are at their lower bound and all other rows
+    # are basic;
+
+    columns = {name: j for j, name in enumerate(lp['columns'])}
+    rows = {name: i for i, name in enumerate(lp['rows'])}
+    column_status = np.full(len(columns), AT_LOWER, dtype=np.int8)
+    row_status = np.full(len(rows), BASIC, dtype=np.int8)
+
+    with open(filename) as f:
+        for line in f:
+            tokens = line.split()
+            if not tokens or tokens[0] in ('NAME', 'ENDATA'):
+                continue
+            if tokens[0] in ('XU', 'XL'):
+                column_status[columns[tokens[1]]] = BASIC
+                row_status[rows[tokens[2]]] = (AT_UPPER if tokens[0] == 'XU'
+                                               else AT_LOWER)
+            elif tokens[0] in ('UL', 'LL'):
+                column_status[columns[tokens[1]]] = (
+                    AT_UPPER if tokens[0] == 'UL' else AT_LOWER)
+
+    basic = (column_status == BASIC).sum() + (row_status == BASIC).sum()
+    if basic != len(rows):
+        raise ValueError('The basis has {0} basic variables for {1} rows'
+                         .format(basic, len(rows)))
+    return column_status, row_status
+
+##################################################################################
+# COST RANGING
+##################################################################################
+
+class BasisFactorisation(object):
+
+    """
+    factorised optimal basis of an LP for cost ranging
+
+    The rows are written as A x - r = 0 with the row activities r bounded by
+    the bounds of the rows, so that the basis consists of columns of A and of
+    -I.
+
+    parameters
+    ----------
+    lp : dict
+        the problem as returned by read_lp
+    column_status, row_status : numpy.ndarray
+        the basis as returned by read_basis
+
+    attributes
+    ----------
+    duals : numpy.ndarray
+        dual of each row, i.e. the change of the objective per unit of the
+        right-hand side
+    reduced_costs : numpy.ndarray
+        reduced cost of each column
+
+    """
+
+    def __init__(self, lp, column_status, row_status):
+
+        self.lp = lp
+        matrix = lp['matrix']
+        m = matrix.shape[0]
+        self._basic_columns = np.flatnonzero(column_status == BASIC)
+        self._basic_rows = np.flatnonzero(row_status == BASIC)
+        basis = sparse.hstack([
+            matrix[:, self._basic_columns],
+            -sparse.identity(m, format='csc')[:, self._basic_rows]]).tocsc()
+        self._lu = splu(basis)
+
+        # the signs with which the reduced costs of the nonbasic columns and
+        # rows must stay non-negative: +1 at the lower bound, -1 at the upper
+        # bound, 0 if fixed (e.g. equality rows); free nonbasic variables
+        # (both bounds infinite) must keep a reduced cost of zero, which is
+        # expressed by listing them twice with both signs;
+
+        self._signs, self._extra = [], []
+        for status, lower, upper in (
+                (column_status, lp['lower'], lp['upper']),
+                (row_status, lp['row_lower'], lp['row_upper'])):
+            sign = np.where(status == AT_LOWER, 1., -1.)
+            sign[(status == BASIC) | (lower == upper)] = 0.
+            free = (status != BASIC) & np.isinf(lower) & np.isinf(upper)
+            self._signs.append(sign)
+            self._extra.append(free)
+
+        self.duals, self.reduced_costs = self._pricing(lp['cost'])
+
+    def _pricing(self, cost):
+
+        # returns y solving B^T y = cost_B and the reduced costs
+        # cost - A^T y of the columns;
+
+        rhs = np.concatenate([cost[self._basic_columns],
+                              np.zeros(len(self._basic_rows))])
+        y = self._lu.solve(rhs, trans='T')
+        return y, cost - self.lp['matrix'].T.dot(y)
+
+    def ranging(self, direction, tolerance=1e-9):
+
+        """
+        interval of a change of the costs along "direction" keeping the basis
+        optimal
+
+        parameters
+        ----------
+        direction : numpy.ndarray
+            change of the cost of each column per unit of the parameter
+        tolerance : float
+            changes of reduced costs below it are neglected
+
+        returns
+        -------
+        tuple of float
+            lower and upper limit of the parameter change (-inf resp. inf if
+            unbounded); the basis stays optimal within both limits
+
+        """
+
+        # the reduced costs change by g per unit of the parameter; the
+        # reduced costs of the rows are their duals;
+
+        u, g_columns = self._pricing(direction)
+        d = np.concatenate([self.reduced_costs, self.duals])
+        g = np.concatenate([g_columns, u])
+        sign = np.concatenate(self._signs)
+        free = np.concatenate(self._extra)
+        d = np.concatenate([sign * d, d[free], -d[free]])
+        g = np.concatenate([sign * g, g[free], -g[free]])
+
+        # each reduced cost d (taken with its sign) must stay non-negative:
+        # d + delta g >= 0; small negative values are numerical noise;
+
+        d = d.clip(0)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            ratio = d / np.abs(g)
+        upper = ratio[g < -tolerance]
+        lower = ratio[g > tolerance]
+        return (-lower.min() if len(lower) else -np.inf,
+                upper.min() if len(upper) else np.inf)
+
+
+def _cost_directions(model, lp, symbol_map, parameter):
+
+    # returns the change of the cost of each column of the lp-file per unit
+    # of a cost parameter of the ReusableModel "model"; the ep_costs and
+    # variable costs must be linear in the parameter;
+
+    p = model.parameters
+    step = max(abs(p[parameter]), 1.)
+    coefficients = [gridcon.cost_coefficients(gridcon.merge_parameters(
+        p, **{parameter: p[parameter] + k * step})) for k in (-1, 0, 1)]
+
+    def slope(index, key):
+        low, middle, high = (c[index][key] for c in coefficients)
+        if abs((high - middle) - (middle - low)) > 1e-9 * max(
+                abs(high), abs(low), 1.):
+            raise ValueError('The costs are not linear in {0}'.format(
+                parameter))
+        return (high - middle) / step
+
+    columns = {name: j for j, name in enumerate(lp['columns'])}
+    direction = np.zeros(len(columns))
+
+    def add(var, value):
+        name = symbol_map.byObject.get(id(var))
+        if name is not None and name in columns:
+            direction[columns[name]] += value
+
+    for key, var in _investment_variables(model.om, model.energysystem):
+        add(var, slope(0, key))
+
+    groups = model.energysystem.groups
+    time_step = model.energysystem.timeindex.freq.nanos / 3.6e12
+    factor = time_step * (np.ones(len(model.om.TIMESTEPS))
+                          if model.weighting is None
+                          else np.asarray(model.weighting, dtype=float))
+    for key in coefficients[1][1]:
+        value = slope(1, key)
+        if value == 0:
+            continue
+        i, o = groups[key[0]], groups[key[1]]
+        for t in model.om.TIMESTEPS:
+            add(model.om.flow[i, o, t], value * float(factor[t]))
+    return direction
+
+
+def cost_ranging(model, parameters=RANGED_PARAMETERS, tolerance=1e-9):
+
+    """
+    cost ranges of the investments and of cost parameters
+
+    parameters
+    ----------
+    model : GridCon_model.ReusableModel
+        model solved with cbc and warmstart (see ReusableModel.solve), which
+        leaves the lp-file and the optimal basis
+    parameters : iterable of str
+        cost parameters (see GridCon_model.COST_PARAMETERS) in which the
+        ep_costs and variable costs are linear, e.g. the specific investment
+        costs "invest_grid" (€/kW) and "invest_el_lv_1_storage" (€/kWh)
+    tolerance : float
+        see BasisFactorisation.ranging
+
+    returns
+    -------
+    dict
+        "investments": pandas.DataFrame with one row for "storage" and
+        "grid" and the columns "capacity", "ep_costs", "reduced_cost",
+        "ep_costs_lower" and "ep_costs_upper" (the interval of the ep_costs
+        over which the sizing stays optimal) and "break_even_ep_costs" (the
+        lower limit if the object is not built, else NaN);
+        "parameters": pandas.DataFrame with one row per parameter and the
+        columns "value", "lower" and "upper" (the interval of the parameter
+        over which the sizing stays optimal) and "break_even" (the lower
+        limit of "invest_*" if the object is not built);
+        "connect_invest_dual": dual of ConnectInvest in €/kW per year
+
+    """
+
+    if model.cbc_files is None:
+        raise ValueError('The model has to be solved with cbc and warmstart')
+    unknown = sorted(set(parameters) - COST_PARAMETERS)
+    if unknown:
+        raise ValueError('Unknown cost parameter(s) {0}'.format(
+            ', '.join(unknown)))
+
+    symbol_map = model.cbc_files['symbol_map']
+    lp = read_lp(model.cbc_files['lp_file'])
+    basis = BasisFactorisation(
+        lp, *read_basis(model.cbc_files['basis_file'], lp))
+    columns = {name: j for j, name in enumerate(lp['columns'])}
+    rows = {name: i for i, name in enumerate(lp['rows'])}
+
+    ep_costs, _ = gridcon.cost_coefficients(model.parameters)
+    investments = {}
+    for key, var in _investment_variables(model.om, model.energysystem):
+        name = 'storage' if key == 'el_lv_1_storage' else 'grid'
+        j = columns[symbol_map.byObject[id(var)]]
+        entry = investments.setdefault(name, {
+            'capacity': var.value, 'ep_costs': 0., 'reduced_cost': 0.,
+            'direction': np.zeros(len(columns))})
+        entry['ep_costs'] += ep_costs[key]
+        entry['reduced_cost'] += basis.reduced_costs[j]
+
+        # each half of the grid connection carries half of its ep_costs (see
+        # cost_coefficients);
+
+        entry['direction'][j] = 0.5 if name == 'grid' else 1.
+
+    for entry in investments.values():
+        lower, upper = basis.ranging(entry.pop('direction'), tolerance)
+        entry['ep_costs_lower'] = entry['ep_costs'] + lower
+        entry['ep_costs_upper'] = entry['ep_costs'] + upper
+        entry['break_even_ep_costs'] = (entry['ep_costs_lower']
+                                        if entry['capacity'] < 1e-9
+                                        else np.nan)
+
+    ranges = {}
+    for parameter in parameters:
+        lower, upper = basis.ranging(
+            _cost_directions(model, lp, symbol_map, parameter), tolerance)
+        value = model.parameters[parameter]
+        ranges[parameter] = {'value': value, 'lower': value + lower,
+                             'upper': value + upper, 'break_even': np.nan}
+    for parameter, name in (('invest_grid', 'grid'),
+                            ('invest_el_lv_1_storage', 'storage')):
+        if parameter in ranges and investments[name]['capacity'] < 1e-9:
+            ranges[parameter]['break_even'] = ranges[parameter]['lower']
+
+    # pyomo writes the rows as "c_e_<symbol>_" for equalities;
+
+    connect = 'c_e_{0}_'.format(symbol_map.byObject[id(
+        model.om.ConnectInvest.invest_connect_constr)])
+    logging.info('Cost ranging of {0} parameter(s) done'.format(
+        len(ranges)))
+    return {
+        'investments': pd.DataFrame(investments).T[[
+            'capacity', 'ep_costs', 'reduced_cost', 'ep_costs_lower',
+            'ep_costs_upper', 'break_even_ep_costs']],
+        'parameters': pd.DataFrame(ranges).T[[
+            'value', 'lower', 'upper', 'break_even']],
+        'connect_invest_dual': basis.duals[rows[connect]],
+        }
+
+
+def sensitivity_report(data, parameters=None, number_timesteps=(96*366),
+                       weighting=None, ranged_parameters=RANGED_PARAMETERS,
+                       solver_threads=None):
+
+    """
+    sizes grid connection and storage once and ranges the cost parameters
+
+    parameters
+    ----------
+    data : pandas.DataFrame
+        profile with the columns "demand_el", "machine_load" and "pv"
+    parameters : dict
+        parameter overrides (see GridCon_storage.DEFAULT_PARAMETERS)
+    number_timesteps : int
+        number of 15 minutes timesteps
+    weighting : array_like
+        optional weighting of the timesteps (see create_energysystem)
+    ranged_parameters : iterable of str
+        cost parameters to be ranged, see cost_ranging
+    solver_threads : int
+        number of threads cbc may use
+
+    returns
+    -------
+    tuple
+        summary of the results (see summarise_results) and the ranges as
+        returned by cost_ranging
+
+    """
+
+    model = ReusableModel(data, parameters, number_timesteps,
+                          weighting=weighting, solver='cbc',
+                          solver_threads=solver_threads,
+                          collapse_fixed_flows=True)
+    try:
+        summary = model.solve(warmstart=True)
+        return summary, cost_ranging(model, ranged_parameters)
+    finally:
+        model.close()
@@ -0,0 +1,644 @@
+# -*- coding: utf-8 -*-
+"""
+Module with a local job-queue service for sizing runs.
+
+The service accepts sizing jobs (a profile file on this host plus parameter
+overrides) over HTTP, runs them in a pool of solver worker processes and
+keeps their results in a directory, so that a planner submits a scenario and
+fetches the results later instead of blocking a terminal with
+run_GridCon_example. It is built on asyncio and the standard library only and
+listens on 127.0.0.1 by default:
+
+- POST /jobs with a JSON job, e.g. {"profile": "/data/farm.csv",
+  "parameters": {"wacc": 0.05}, "number_timesteps": 35136}; returns the job
+  with its "id";
+- GET /jobs, GET /jobs/<id>: state, phase and summary of the jobs;
+- GET /jobs/<id>/events: streams the job as one JSON line per change until
+  it is finished;
+- GET /jobs/<id>/result: flows and storage level as npz file (see
+  GridConResults.write);
+- DELETE /jobs/<id>: cancels a queued job;
+- GET /status: queue depth, running jobs and workers.
+
+Queued jobs are started shortest first, measured by their number of
+timesteps. Jobs above express_timesteps are long; they may occupy all but
+express_workers of the workers, so that cheap jobs do not wait behind long
+multi-year runs. Scenarios already in the result cache (see GridCon_cache)
+are answered without solving.
+
+The service is started with "python GridCon_service.py --workers 4"; the
+functions submit_job, wait_for_job and download_result are a client for
+scripts.
+"""
+
+##################################################################################
+# IMPORTS
+##################################################################################
+
+import argparse
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
+import json
+import logging
+import multiprocessing
+import os
+import re
+import time
+import urllib.request
+import uuid
+
+from oemof.tools import helpers
+
+import GridCon_storage_171221d as gridcon
+from GridCon_cache import ResultCache, scenario_key
+
+##################################################################################
+# JOBS
+##################################################################################
+
+# states of a job; the last three are final;
+
+QUEUED, RUNNING, FINISHED, FAILED, CANCELLED = (
+    'queued', 'running', 'finished', 'failed', 'cancelled')
+FINAL_STATES = (FINISHED, FAILED, CANCELLED)
+
+
+class Job(object):
+
+    """
+    sizing job of the service
+
+    parameters
+    ----------
+    spec : dict
+        "profile" (absolute file name), "parameters" (complete set),
+        "number_timesteps" and "solver", see JobService.submit
+    sequence : int
+        number of the job in the order of submission
+
+    """
+
+    def __init__(self, spec, sequence):
+
+        self.id = uuid.uuid4().hex[:12]
+        self.spec = spec
+        self.sequence = sequence
+        self.state = QUEUED
+        self.phase = None
+        self.submitted = time.time()
+        self.started = None
+        self.finished = None
+        self.summary = None
+        self.error = None
+        self.result_file = None
+        self.changed = asyncio.Event()
+
+    @property
+    def cost(self):
+
+        # the number of timesteps as estimate of the run time;
+
+        return self.spec['number_timesteps']
+
+    def touch(self):
+
+        # wakes up all streams waiting for a change of the job; "changed" is
+        # replaced by a new event for the next change;
+
+        self.changed.set()
+        self.changed = asyncio.Event()
+
+    def to_dict(self):
+
+        return {'id': self.id, 'state': self.state, 'phase': self.phase,
+                'profile': self.spec['profile'],
+                'number_timesteps': self.spec['number_timesteps'],
+                'solver': self.spec['solver'],
+                'submitted': self.submitted, 'started': self.started,
+                'finished': self.finished, 'summary': self.summary,
+                'error': self.error}
+
+##################################################################################
+# WORKER PROCESSES
+##################################################################################
+
+def _run_job(job_id, spec, directory, cache, solver_threads, progress):
+
+    # sizes grid connection and storage for one job in a worker process,
+    # writes the flows to "<directory>/<job_id>.npz" and returns the summary;
+    # the phases of the job are put into the queue "progress";
+
+    def report(phase):
+        progress.put((job_id, phase))
+
+    p = spec['parameters']
+    number_timesteps = spec['number_timesteps']
+    report('read_profile')
+    data = gridcon.read_profile(spec['profile'], number_timesteps,
+                                list(gridcon.PROFILE_COLUMNS))
+    key = None
+    results = None
+    if cache is not None:
+        key = scenario_key(data, p, number_timesteps, spec['solver'])
+        results = cache.get(key)
+    if results is None:
+        report('build_model')
+        energysystem = gridcon.create_energysystem(
+            data, p, number_timesteps, collapse_fixed_flows=True)
+        om = gridcon.create_model(energysystem)
+        report('solve')
+        gridcon.solve_model(om, solver=spec['solver'], debug=False,
+                            tee_switch=False, solver_threads=solver_threads)
+        report('results')
+        results = gridcon.extract_results(energysystem, p)
+        if cache is not None:
+            cache.put(key, results)
+    else:
+        report('cached')
+    result_file = results.write(os.path.join(directory, job_id), 'npz')
+    return results.summary, result_file
+
+##################################################################################
+# SERVICE
+##################################################################################
+
+class JobService(object):
+
+    """
+    queue of sizing jobs dispatched to a pool of worker processes
+
+    parameters
+    ----------
+    directory : str
+        directory of the result files; defaults to ~/.oemof/job_results
+    max_workers : int
+        number of worker processes; defaults to the number of cores divided
+        by solver_threads
+    express_workers : int
+        number of workers kept free of long jobs (at least one worker takes
+        long jobs)
+    express_timesteps : int
+        jobs with more timesteps are long; defaults to a quarter of a year
+    solver_threads : int
+        number of threads each solver may use
+    cache : ResultCache
+        cache of solved scenarios; None to always solve
+
+    """
+
+    def __init__(self, directory=None, max_workers=None, express_workers=1,
+                 express_timesteps=(96*92), solver_threads=1, cache=None):
+
+        if directory is None:
+            directory = helpers.extend_basic_path('job_results')
+        if not os.path.isdir(directory):
+            os.makedirs(directory, exist_ok=True)
+        if max_workers is None:
+            max_workers = max(1, (os.cpu_count() or 1) // solver_threads)
+        self.directory = directory
+        self.max_workers = max_workers
+        self.long_workers = max(1, max_workers - express_workers)
+        self.express_timesteps = express_timesteps
+        self.solver_threads = solver_threads
+        self.cache = cache
+        self.jobs = {}
+        self._sequence = 0
+        self._executor = None
+        self._manager = None
+        self._progress = None
+
+    def start(self):
+
+        # starts the worker processes and the reader of their progress;
+
+        self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+        self._manager = multiprocessing.Manager()
+        self._progress = self._manager.Queue()
+        asyncio.ensure_future(self._read_progress())
+
+    def close(self):
+
+        # stops the reader of the progress and the worker processes; running
+        # jobs are abandoned;
+
+        if self._progress is not None:
+            self._progress.put(None)
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+        if self._manager is not None:
+            self._manager.shutdown()
+
+    async def _read_progress(self):
+
+        # updates the phase of the jobs from the messages of the workers,
+        # reading the queue in a thread;
+
+        loop = asyncio.get_event_loop()
+        while True:
+            try:
+                message = await loop.run_in_executor(None,
+                                                     self._progress.get)
+            except (EOFError, OSError):
+                break
+            if message is None:
+                break
+            job = self.jobs.get(message[0])
+            if job is not None and job.state == RUNNING:
+                job.phase = message[1]
+                job.touch()
+
+    async def submit(self, spec):
+
+        """
+        adds a job to the queue
+
+        parameters
+        ----------
+        spec : dict
+            "profile": csv-file with the columns "demand_el",
+            "machine_load" and "pv" on this host; "parameters": overrides
+            of DEFAULT_PARAMETERS (optional); "number_timesteps": number of
+            15 minutes timesteps (optional, defaults to the length of the
+            profile); "solver" (optional, defaults to cbc)
+
+        returns
+        -------
+        Job
+
+        """
+
+        unknown = sorted(set(spec) - {'profile', 'parameters',
+                                      'number_timesteps', 'solver'})
+        if unknown:
+            raise ValueError('Unknown field(s) {0}'.format(', '.join(unknown)))
+        if 'profile' not in spec:
+            raise ValueError('The job lacks the field "profile"')
+        profile = os.path.abspath(spec['profile'])
+        number_timesteps = spec.get('number_timesteps')
+
+        # the profile is read once here (converting it into the binary
+        # profile cache), so that a missing file or column is reported to the
+        # client instead of failing in the worker;
+
+        loop = asyncio.get_event_loop()
+        data = await loop.run_in_executor(
+            None, gridcon.read_profile, profile, number_timesteps,
+            list(gridcon.PROFILE_COLUMNS))
+        if number_timesteps is None:
+            number_timesteps = len(data)
+        elif len(data) < number_timesteps:
+            raise ValueError('The profile has only {0} timesteps'.format(
+                len(data)))
+
+        self._sequence += 1
+        job = Job({'profile': profile,
+                   'parameters': gridcon.merge_parameters(
+                       spec.get('parameters')),
+                   'number_timesteps': int(number_timesteps),
+                   'solver': spec.get('solver', 'cbc')}, self._sequence)
+        self.jobs[job.id] = job
+        logging.info('Job {0} queued ({1} timesteps)'.format(
+            job.id, job.cost))
+        self._schedule()
+        return job
+
+    def cancel(self, job_id):
+
+        # cancels a queued job; returns False if it is already running or
+        # finished;
+
+        job = self.jobs[job_id]
+        if job.state != QUEUED:
+            return False
+        job.state = CANCELLED
+        job.finished = time.time()
+        job.touch()
+        return True
+
+    def status(self):
+
+        # queue depth and number of jobs per state;
+
+        counts = {state: 0 for state in (QUEUED, RUNNING) + FINAL_STATES}
+        for job in self.jobs.values():
+            counts[job.state] += 1
+        counts.update({'workers': self.max_workers,
+                       'long_workers': self.long_workers,
+                       'express_timesteps': self.express_timesteps})
+        return counts
+
+    def _schedule(self):
+
+        # starts queued jobs, shortest first, while workers are free; long
+        # jobs only start while fewer than long_workers long jobs run;
+
+        running = [job for job in self.jobs.values() if job.state == RUNNING]
+        running_long = sum(job.cost > self.express_timesteps
+                           for job in running)
+        queued = sorted((job for job in self.jobs.values()
+                         if job.state == QUEUED),
+                        key=lambda job: (job.cost, job.sequence))
+        free = self.max_workers - len(running)
+        for job in queued:
+            if free <= 0:
+                break
+            if job.cost > self.express_timesteps:
+                if running_long >= self.long_workers:
+                    continue
+                running_long += 1
+            free -= 1
+            asyncio.ensure_future(self._execute(job))
+
+    async def _execute(self, job):
+
+        # runs a job in a worker process and schedules the next ones when it
+        # is finished;
+
+        job.state = RUNNING
+        job.started = time.time()
+        job.touch()
+        loop = asyncio.get_event_loop()
+        try:
+            job.summary, job.result_file = await loop.run_in_executor(
+                self._executor, _run_job, job.id, job.spec, self.directory,
+                self.cache, self.solver_threads, self._progress)
+            job.state = FINISHED
+        except Exception as e:
+            logging.exception('Job {0} failed'.format(job.id))
+            job.error = repr(e)
+            job.state = FAILED
+        job.phase = None
+        job.finished = time.time()
+        logging.info('Job {0} {1} after {2:.1f} s'.format(
+            job.id, job.state, job.finished - job.started))
+        job.touch()
+        self._schedule()
+
+    ##############################################################################
+    # HTTP INTERFACE
+    ##############################################################################
+
+    async def serve(self, host='127.0.0.1', port=8765):
+
+        # starts the workers and the HTTP server; returns the server;
+
+        self.start()
+        server = await asyncio.start_server(self._handle, host, port)
+        logging.info('GridCon job service listening on http://{0}:{1}'
+                     .format(host, port))
+        return server
+
+    async def _handle(self, reader, writer):
+
+        # answers one HTTP request;
+
+        try:
+            request = (await reader.readline()).decode('latin-1').split()
+            headers = {}
+            while True:
+                line = (await reader.readline()).decode('latin-1').strip()
+                if not line:
+                    break
+                name, _, value = line.partition(':')
+                headers[name.strip().lower()] = value.strip()
+            if len(request) < 2:
+                raise ValueError('Malformed request')
+            body = await reader.readexactly(
+                int(headers.get('content-length', 0)))
+            await self._route(request[0], request[1], body, writer)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        except (ValueError, KeyError, OSError) as e:
+            _respond(writer, 400, {'error': str(e)})
+        except Exception as e:
+            logging.exception('Request failed')
+            _respond(writer, 500, {'error': repr(e)})
+        finally:
+            try:
+                await writer.drain()
+            except ConnectionError:
+                pass
+            writer.close()
+
+    async def _route(self, method, path, body, writer):
+
+        # dispatches a request by method and path;
+
+        match = re.match(r'^/jobs/([0-9a-f]+)(/events|/result)?/?$', path)
+        job = self.jobs.get(match.group(1)) if match else None
+        if match and job is None:
+            _respond(writer, 404, {'error': 'Unknown job'})
+
+        elif path == '/status' and method == 'GET':
+            _respond(writer, 200, self.status())
+
+        elif path.rstrip('/') == '/jobs' and method == 'GET':
+            _respond(writer, 200, [j.to_dict() for j in sorted(
+                self.jobs.values(), key=lambda j: j.sequence)])
+
+        elif path.rstrip('/') == '/jobs' and method == 'POST':
+            spec = json.loads(body.decode('utf-8') or '{}')
+            if not isinstance(spec, dict):
+                raise ValueError('The job must be a JSON object')
+            job = await self.submit(spec)
+            _respond(writer, 202, job.to_dict())
+
+        elif match and match.group(2) is None and method == 'GET':
+            _respond(writer, 200, job.to_dict())
+
+        elif match and match.group(2) is None and method == 'DELETE':
+            if self.cancel(job.id):
+                _respond(writer, 200, job.to_dict())
+            else:
+                _respond(writer, 409, {'error': 'Job is {0}'.format(
+                    job.state)})
+
+        elif match and match.group(2) == '/events' and method == 'GET':
+
+            # one JSON line per change of the job until it is finished;
+
+            writer.write(b'HTTP/1.1 200 OK\r\nContent-Type: '
+                         b'application/x-ndjson\r\nConnection: close\r\n\r\n')
+            while True:
+                changed = job.changed
+                writer.write(json.dumps(job.to_dict()).encode('utf-8')
+                             + b'\n')
+                await writer.drain()
+                if job.state in FINAL_STATES:
+                    break
+                await changed.wait()
+
+        elif match and match.group(2) == '/result' and method == 'GET':
+            if job.state != FINISHED:
+                _respond(writer, 409, {'error': 'Job is {0}'.format(
+                    job.state)})
+            else:
+                with open(job.result_file, 'rb') as f:
+                    _respond(writer, 200, f.read(),
+                             'application/octet-stream')
+
+        else:
+            _respond(writer, 404, {'error': 'Unknown request'})
+
+
+def _respond(writer, status, payload, content_type='application/json'):
+
+    # writes a complete HTTP response; payload is serialised as JSON unless
+    # it is bytes;
+
+    if not isinstance(payload, bytes):
+        payload = json.dumps(payload, default=str).encode('utf-8')
+    reasons = {200: 'OK', 202: 'Accepted', 400: 'Bad Request',
+               404: 'Not Found', 409: 'Conflict',
+               500: 'Internal Server Error'}
+    writer.write('HTTP/1.1 {0} {1}\r\nContent-Type: {2}\r\nContent-Length: '
+                 '{3}\r\nConnection: close\r\n\r\n'.format(
+                     status, reasons[status], content_type,
+                     len(payload)).encode('latin-1') + payload)
+
+
+def run_service(host='127.0.0.1', port=8765, **options):
+
+    """
+    runs the job service until it is interrupted
+
+    parameters
+    ----------
+    host, port :
+        address of the HTTP interface; the default only accepts connections
+        from this host
+    **options :
+        passed to JobService
+
+    """
+
+    service = JobService(**options)
+    loop = asyncio.get_event_loop()
+    server = loop.run_until_complete(service.serve(host, port))
+    try:
+        loop.run_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+        loop.run_until_complete(server.wait_closed())
+        service.close()
+
+##################################################################################
+# CLIENT
+##################################################################################
+
+def _request(url, method='GET', payload=None):
+
+    data = None if payload is None else json.dumps(payload).encode('utf-8')
+    request = urllib.request.Request(
+        url, data=data, method=method,
+        headers={'Content-Type': 'application/json'})
+    return urllib.request.urlopen(request)
+
+
+def submit_job(profile, parameters=None, number_timesteps=None,
+               solver='cbc', url='http://127.0.0.1:8765'):
+
+    """
+    submits a sizing job to the service
+
+    parameters
+    ----------
+    profile : str
+        profile csv-file on the host of the service
+    parameters : dict
+        parameter overrides (see GridCon_storage.DEFAULT_PARAMETERS)
+    number_timesteps : int
+        number of 15 minutes timesteps; defaults to the length of the profile
+    solver : str
+        name of the solver
+    url : str
+        address of the service
+
+    returns
+    -------
+    dict
+        the job with its "id" and "state"
+
+    """
+
+    spec = {'profile': os.path.abspath(profile), 'solver': solver,
+            'parameters': parameters or {}}
+    if number_timesteps is not None:
+        spec['number_timesteps'] = number_timesteps
+    with _request(url + '/jobs', 'POST', spec) as response:
+        return json.loads(response.read().decode('utf-8'))
+
+
+def wait_for_job(job_id, url='http://127.0.0.1:8765', callback=None):
+
+    """
+    waits until a job is finished
+
+    parameters
+    ----------
+    job_id : str
+    url : str
+        address of the service
+    callback : callable
+        called with the job (dict) on every change, e.g. print
+
+    returns
+    -------
+    dict
+        the finished, failed or cancelled job with its "summary"
+
+    """
+
+    job = None
+    with _request('{0}/jobs/{1}/events'.format(url, job_id)) as response:
+        for line in response:
+            job = json.loads(line.decode('utf-8'))
+            if callback is not None:
+                callback(job)
+    return job
+
+
+def download_result(job_id, filename, url='http://127.0.0.1:8765'):
+
+    # writes the flows of a finished job to "filename" (npz, see
+    # GridConResults.write) and returns the file name;
+
+    with _request('{0}/jobs/{1}/result'.format(url, job_id)) as response:
+        with open(filename, 'wb') as f:
+            f.write(response.read())
+    return filename
+
+##################################################################################
+# COMMAND LINE
+##################################################################################
+
+def main(arguments=None):
+
+    parser = argparse.ArgumentParser(
+        description='Local job-queue service for GridCon sizing runs')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--express-workers', type=int, default=1)
+    parser.add_argument('--express-timesteps', type=int, default=96*92)
+    parser.add_argument('--solver-threads', type=int, default=1)
+    parser.add_argument('--directory', default=None,
+                        help='directory of the results (default: '
+                             '~/.oemof/job_results)')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='solve every job, ignoring the result cache')
+    args = parser.parse_args(arguments)
+
+    logging.basicConfig(level=logging.INFO,
+                        format='%(asctime)s %(levelname)s %(message)s')
+    run_service(args.host, args.port, directory=args.directory,
+                max_workers=args.workers,
+                express_workers=args.express_workers,
+                express_timesteps=args.express_timesteps,
+                solver_threads=args.solver_threads,
+                cache=None if args.no_cache else ResultCache())
+
+if __name__ == "__main__":
+    main()
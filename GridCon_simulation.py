@@ -0,0 +1,412 @@
+# -*- coding: utf-8 -*-
+"""
+Module to stress-test a sizing against many years by rule-based dispatch.
+
+The LP chooses grid capacity and storage size for one profile. To check a
+design against hundreds of synthetic or historical years, the dispatch of
+the low voltage grid is simulated by a rule instead of an LP. Two bounds of
+the state of charge are computed backwards over the year: the required one
+covers the deficits to come (net load above the grid capacity), the allowed
+one leaves room for the PV surplus to come (above the grid capacity). The
+storage covers the deficits, takes the PV surplus first, up to the allowed
+state of charge, replaces imports down to the required state of charge and
+feeds into the grid down to the allowed one; the grid charges it only up to
+the required state of charge, so that it does not take the room of the PV.
+On a profile of 14 days, the variable costs of the design of the LP are
+300 against 289 of the LP, with 1.96 MWh curtailed against 1.94 MWh; a
+storage kept as full as possible by the grid curtails 11.6 MWh and costs
+892. The storage follows el_lv_1_storage: charging and discharging
+efficiencies icf and ocf, state of charge between capacity_min and
+capacity_max of the capacity, charging and discharging power up to the
+capacity (nominal ratios of 1), self-discharge capacity_loss. Net load above
+grid and storage is unmet (el_lv_6_grid_excess), surplus above the grid
+capacity is curtailed (el_lv_4_excess_sink).
+
+The years are simulated together: the bounds are cumulative sums and maxima
+over blocks of timesteps for all years, the recursion of the state of charge
+runs over the timesteps with vector operations for all years. The loop over
+the timesteps stays in Python, so its overhead is shared by the years of a
+chunk: on one core about 180 years of 35136 timesteps are simulated per
+second in chunks of 512 years, about 160 in chunks of 256. A compiled
+recursion (numba, one year at a time) reaches only about 400, since the
+rule is evaluated twice per timestep; thousands of years per second take a
+pool of processes instead, about six cores per thousand years per second.
+stress_test simulates the chunks in a pool of worker processes, one chunk
+per task, as GridCon_sweep does with the parameter sets.
+"""
+
+##################################################################################
+# IMPORTS
+##################################################################################
+
+from concurrent.futures import ProcessPoolExecutor
+import os
+
+import numpy as np
+import pandas as pd
+
+import GridCon_storage_171221d as gridcon
+
+##################################################################################
+# DISPATCH SIMULATION
+##################################################################################
+
+def simulate_dispatch(load, grid_capacity, storage_capacity, parameters=None,
+                      time_step=0.25, initial_level=None, block_size=None,
+                      tolerance=1e-3):
+
+    """
+    simulates the rule-based dispatch of many years at once
+
+    parameters
+    ----------
+    load : array_like
+        net load of the low voltage grid (base load plus machine load minus
+        PV generation) in kW, shape (years, timesteps) or (timesteps,)
+    grid_capacity, storage_capacity : float or array_like
+        design in kW resp. kWh; one value or one per year
+    parameters : dict
+        parameter overrides (see GridCon_storage.DEFAULT_PARAMETERS)
+    time_step : float
+        duration of a timestep in hours
+    initial_level : float
+        state of charge at the start of each year relative to the storage
+        capacity; defaults to the state of charge required by the first
+        deficits
+    block_size : int
+        number of timesteps whose bounds and grid flows are derived at
+        once; defaults to arrays of 256 kB, which stay in the cache
+    tolerance : float
+        unmet load up to this power (kW) is neglected, since the capacities
+        of a solved LP are exact only up to the tolerance of the solver
+
+    returns
+    -------
+    dict
+        numpy.ndarray with one value per year: energies in kWh ("import",
+        "export" at the low voltage side, "unmet", "curtailed", "charged",
+        "discharged", "grid_losses", "storage_losses" by conversion,
+        "self_discharge"), "unmet_timesteps", "peak_unmet" in kW and the
+        costs as in extract_results ("fixed_grid_costs",
+        "fixed_storage_costs", "total_fixed_costs", "grid_loss_costs",
+        "storage_loss_costs", "curtailment_costs", "unmet_costs",
+        "total_variable_costs", "total_annual_costs")
+
+    """
+
+    p = gridcon.merge_parameters(parameters)
+    load = np.atleast_2d(np.asarray(load, dtype=float))
+    years, n_timesteps = load.shape
+    G = np.broadcast_to(np.asarray(grid_capacity, dtype=float),
+                        (years,)).copy()
+    S = np.broadcast_to(np.asarray(storage_capacity, dtype=float),
+                        (years,)).copy()
+
+    icf, ocf = p['icf'], p['ocf']
+    keep = 1 - gridcon.capacity_loss_per_timestep(p, time_step)
+    lowest = p['capacity_min'] * S
+    highest = p['capacity_max'] * S
+    if block_size is None:
+        block_size = max(16, (1 << 15) // years)
+    starts = range(0, n_timesteps, block_size)
+
+    # bounds of the state of charge at the end of each timestep, computed
+    # backwards over the year (see _bound_backwards): the required state of
+    # charge covers the deficits to come, charging as much as possible in
+    # between; the allowed state of charge leaves room for the excess to
+    # come, discharging as much as possible in between (see
+    # _storage_levels); where both cannot be kept, the deficits come first;
+
+    required = np.empty((n_timesteps, years))
+    allowed = np.empty((n_timesteps, years))
+    carry_required = np.full(years, -np.inf)
+    carry_allowed = np.full(years, -np.inf)
+    for start in reversed(starts):
+        L = load[:, start:start + block_size].T
+        deficit, supply, feed_in, excess, pv, grid_charge = \
+            _storage_energies(L, G, S, icf, ocf, time_step)
+        scale = keep ** -np.arange(start, start + len(L),
+                                   dtype=float)[:, None]
+        needed, carry_required = _bound_backwards(
+            deficit - excess - pv - grid_charge, lowest, scale,
+            carry_required)
+        room, carry_allowed = _bound_backwards(
+            excess - deficit - supply - feed_in, -highest, scale,
+            carry_allowed)
+        needed = np.minimum(needed, highest)
+        required[start:start + len(L)] = needed
+        allowed[start:start + len(L)] = np.maximum(-room, needed)
+
+    if initial_level is None:
+        level = np.clip(carry_required / keep, lowest, highest)
+    else:
+        level = initial_level * S
+    start_level = level.copy()
+
+    totals = {name: np.zeros(years) for name in (
+        'import', 'export', 'unmet', 'curtailed', 'charged', 'discharged',
+        'unmet_timesteps', 'peak_unmet')}
+
+    for start in starts:
+
+        # the timesteps are the first axis, so that each step is contiguous;
+
+        L = load[:, start:start + block_size].T.copy()
+        deficit, supply, feed_in, excess, pv, grid_charge = \
+            _storage_energies(L, G, S, icf, ocf, time_step)
+        block = slice(start, start + len(L))
+        levels = _storage_levels(level, keep, L, excess - deficit, supply,
+                                 feed_in, pv, grid_charge, required[block],
+                                 allowed[block], lowest, highest)
+
+        # charging and discharging follow from the change of the state of
+        # charge against the previous one, reduced by the self-discharge;
+
+        previous = np.empty_like(levels)
+        previous[0] = level
+        previous[1:] = levels[:-1]
+        previous *= keep
+        change = levels - previous
+        charged = np.maximum(change, 0) * (1 / (icf * time_step))
+        discharged = np.maximum(-change, 0) * (ocf / time_step)
+        level = levels[-1].copy()
+
+        # flows of the grid: imports up to the grid capacity, the rest is
+        # unmet; exports up to the grid capacity, the rest is curtailed;
+
+        grid = L + charged - discharged
+        unmet = np.maximum(grid - G, 0)
+        unmet[unmet <= tolerance] = 0
+        surplus = np.maximum(-grid, 0)
+        export = np.minimum(surplus, G)
+        totals['import'] += np.minimum(np.maximum(grid, 0), G).sum(axis=0)
+        totals['unmet'] += unmet.sum(axis=0)
+        totals['export'] += export.sum(axis=0)
+        totals['curtailed'] += (surplus - export).sum(axis=0)
+        totals['charged'] += charged.sum(axis=0)
+        totals['discharged'] += discharged.sum(axis=0)
+        totals['unmet_timesteps'] += (unmet > 0).sum(axis=0)
+        totals['peak_unmet'] = np.maximum(totals['peak_unmet'],
+                                          unmet.max(axis=0))
+
+    results = {name: values * time_step for name, values in totals.items()
+               if name not in ('unmet_timesteps', 'peak_unmet')}
+    results['unmet_timesteps'] = totals['unmet_timesteps']
+    results['peak_unmet'] = totals['peak_unmet']
+
+    # losses; the self-discharge follows from the energy balance of the
+    # storage;
+
+    grid_loss_rate = p['grid_loss_rate']
+    grid_eff = 1 - grid_loss_rate
+    results['grid_losses'] = (results['import'] / grid_eff
+                              - results['import']
+                              + results['export'] * grid_loss_rate)
+    results['storage_losses'] = (results['charged'] * (1 - icf)
+                                 + results['discharged'] * (1 / ocf - 1))
+    results['self_discharge'] = (start_level - level
+                                 + results['charged'] * icf
+                                 - results['discharged'] / ocf)
+
+    # costs as in extract_results;
+
+    ep_costs, variable_costs = gridcon.cost_coefficients(p)
+    cost_electricity_losses = p['cost_electricity_losses']
+    results['fixed_grid_costs'] = (
+        (ep_costs['transformer_mv_to_lv', 'b_el_lv']
+         + ep_costs['b_el_lv', 'transformer_lv_to_mv']) * G)
+    results['fixed_storage_costs'] = ep_costs['el_lv_1_storage'] * S
+    results['total_fixed_costs'] = (results['fixed_grid_costs']
+                                    + results['fixed_storage_costs'])
+    results['grid_loss_costs'] = (
+        (results['import'] / grid_eff + results['export'])
+        * cost_electricity_losses * grid_loss_rate)
+    results['storage_loss_costs'] = (
+        results['charged'] * cost_electricity_losses
+        * (1 - icf * ocf))
+    results['curtailment_costs'] = (results['curtailed']
+                                    * cost_electricity_losses)
+    results['unmet_costs'] = (results['unmet'] * variable_costs[
+        'el_lv_6_grid_excess', 'b_el_lv'])
+    results['total_variable_costs'] = (
+        results['unmet_costs']
+        + results['curtailment_costs']
+        + variable_costs['b_el_mv', 'transformer_mv_to_lv']
+        * results['import'] / grid_eff
+        + variable_costs['transformer_lv_to_mv', 'b_el_mv']
+        * results['export'] * grid_eff
+        + variable_costs['b_el_lv', 'el_lv_1_storage'] * results['charged'])
+    results['total_annual_costs'] = (results['total_fixed_costs']
+                                     + results['total_variable_costs'])
+    return results
+
+def _storage_energies(L, G, S, icf, ocf, time_step):
+
+    # returns the energies of the storage (at its side) per timestep, all
+    # limited by the power of the storage: the deficit which has to be
+    # discharged (net load above the grid capacity), the discharge which may
+    # replace imports (net load up to the grid capacity), the discharge
+    # which may be fed into the grid while there is net load, the excess
+    # which has to be charged or curtailed (PV surplus above the grid
+    # capacity), the charge which may replace exports (PV surplus up to the
+    # grid capacity) and the charge which may be drawn from the grid;
+
+    deficit = np.minimum(np.maximum(L - G, 0), S)
+    supply = np.minimum(np.clip(L, 0, G), S - deficit)
+    feed_in = np.where(L > 0, np.minimum(G, S - deficit - supply), 0)
+    excess = np.minimum(np.maximum(-L - G, 0), S)
+    pv = np.minimum(np.clip(-L, 0, G), S - excess)
+    grid = np.minimum(np.maximum(G - L, 0), S) - excess - pv
+    discharge, charge = time_step / ocf, icf * time_step
+    return (deficit * discharge, supply * discharge, feed_in * discharge,
+            excess * charge, pv * charge, grid * charge)
+
+
+def _bound_backwards(a, bound, scale, carry):
+
+    # solves the recursion x[t-1] = max(bound, (x[t] + a[t]) / keep) for a
+    # block of timesteps at once: with scale = keep^-t and w = x * scale it
+    # becomes w[t-1] = max(bound * scale[t-1], w[t] + b[t]) with
+    # b = a * scale, i.e. a cumulative sum and a cumulative maximum from the
+    # end of the block; "carry" is w + b of the first timestep of the next
+    # block (-inf for the last one); returns x and the carry of this block;
+
+    b = a * scale
+    after = np.cumsum(b[::-1], axis=0)[::-1] - b
+    w = after + np.maximum(
+        np.maximum.accumulate((bound * scale - after)[::-1], axis=0)[::-1],
+        carry)
+    return w / scale, w[0] + b[0]
+
+
+def _storage_levels(level, keep, L, gain, supply, feed_in, pv, grid_charge,
+                    required, allowed, lowest, highest):
+
+    # recursion of the state of charge over the timesteps (first axis) for
+    # all years at once, starting from the previous state of charge, reduced
+    # by the self-discharge, plus the surplus minus the deficit: while there
+    # is net load, the storage replaces imports down to the required state of
+    # charge and exports down to the allowed one; while there is PV surplus,
+    # it replaces exports up to the allowed state of charge; the grid charges
+    # it up to the required state of charge; all within the limits of the
+    # state of charge;
+
+    levels = np.empty_like(gain)
+    for t in range(gain.shape[0]):
+        free = level * keep + gain[t]
+        stored = free + pv[t]
+        target = np.where(L[t] > 0, required[t], allowed[t])
+        high = np.minimum(target, np.maximum(
+            stored, np.minimum(required[t], stored + grid_charge[t])))
+        drained = free - supply[t]
+        low = np.minimum(free, np.minimum(
+            np.maximum(drained, target),
+            np.maximum(drained - feed_in[t], allowed[t])))
+        level = np.minimum(np.maximum(np.maximum(low, high), lowest),
+                           highest)
+        levels[t] = level
+    return levels
+
+##################################################################################
+# STRESS TEST OF A DESIGN
+##################################################################################
+
+def synthetic_years(data, years=100, window=7, seed=0):
+
+    """
+    synthetic years bootstrapped from the days of a profile
+
+    every day of a synthetic year is a day of the profile drawn from within
+    "window" days of the same day of the year (cyclically), with base load,
+    machine load and PV of that day kept together
+
+    parameters
+    ----------
+    data : pandas.DataFrame
+        profile of whole days with the columns "demand_el", "machine_load"
+        and "pv" (15 minutes timesteps)
+    years : int
+        number of synthetic years
+    window : int
+        maximum distance in days of the drawn day
+    seed : int
+        seed of the random numbers
+
+    returns
+    -------
+    numpy.ndarray
+        net load in kW, shape (years, timesteps of the profile)
+
+    """
+
+    load = (data['demand_el'].values + data['machine_load'].values
+            - data['pv'].values).astype(float)
+    days = len(load) // 96
+    if days * 96 != len(load):
+        raise ValueError('The profile must consist of whole days')
+    rng = np.random.RandomState(seed)
+    drawn = (np.arange(days)[None, :]
+             + rng.randint(-window, window + 1, size=(years, days))) % days
+    return load.reshape(days, 96)[drawn].reshape(years, -1)
+
+
+def stress_test(load, grid_capacity, storage_capacity, parameters=None,
+                time_step=0.25, chunk_size=512, max_workers=None):
+
+    """
+    distribution of unmet load and costs of one design over many years
+
+    parameters
+    ----------
+    load : array_like
+        net load in kW, shape (years, timesteps), e.g. from synthetic_years
+    grid_capacity, storage_capacity : float
+        design in kW resp. kWh, e.g. from extract_results
+    parameters : dict
+        parameter overrides (see GridCon_storage.DEFAULT_PARAMETERS)
+    time_step : float
+        duration of a timestep in hours
+    chunk_size : int
+        number of years simulated at once (limits the memory, about 300 MB
+        per chunk of 512 years of 35136 timesteps); below 512 years the
+        overhead of the loop over the timesteps grows
+    max_workers : int
+        number of worker processes; defaults to the number of cores, at
+        most one per chunk; with one worker the chunks are simulated in this
+        process
+
+    returns
+    -------
+    pandas.DataFrame
+        one row per year with the results of simulate_dispatch
+
+    """
+
+    load = np.atleast_2d(load)
+    tasks = [(load[start:start + chunk_size], grid_capacity,
+              storage_capacity, parameters, time_step)
+             for start in range(0, len(load), chunk_size)]
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+    max_workers = max(1, min(max_workers, len(tasks)))
+
+    # the results are collected in the order of the chunks, so that the rows
+    # keep the order of the years;
+    if max_workers == 1:
+        chunks = [_simulate_chunk(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            chunks = list(executor.map(_simulate_chunk, tasks))
+    frame = pd.concat(chunks, ignore_index=True)
+    frame.index.name = 'year'
+    return frame
+
+
+def _simulate_chunk(task):
+
+    # simulates one chunk of years in a worker process;
+
+    load, grid_capacity, storage_capacity, parameters, time_step = task
+    return pd.DataFrame(simulate_dispatch(load, grid_capacity,
+                                          storage_capacity, parameters,
+                                          time_step))
@@ -0,0 +1,339 @@
+# -*- coding: utf-8 -*-
+"""
+Module to build the GridCon LP directly as sparse matrices.
+
+The topology of the GridCon model is fixed: two buses, two transformers, one
+storage and the fixed profiles of PV, base load and machine load. oemof and
+pyomo nevertheless create several python objects per timestep and variable,
+and solving writes the whole model to a file. build_lp assembles the same LP
+with numpy index arithmetic as scipy.sparse matrices, one block of columns
+per flow, and solve_lp passes them in memory to scipy.optimize.linprog; no
+file is written. The results have the same structure as extract_results.
+
+The LP is the one of create_model with collapsed fixed flows, with two
+equalities eliminated: both halves of the grid connection share one
+investment (ConnectInvest), and the charging and discharging power of the
+storage is bounded by its capacity directly (nominal ratios of 1). Hence the
+optimum and the objective are the same as those of the oemof model.
+
+The capacities bound a flow in every timestep; as single columns they would
+make the normal equations of the interior point method dense. Therefore each
+capacity has one column per timestep, chained by equalities, which keeps the
+factorisation sparse (splitting of dense columns).
+"""
+
+##################################################################################
+# IMPORTS
+##################################################################################
+
+import logging
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from scipy.optimize import linprog
+
+import GridCon_storage_171221d as gridcon
+
+##################################################################################
+# LAYOUT OF THE COLUMNS
+##################################################################################
+
+# flows with one column per timestep, in the order of the column blocks; the
+# fixed flows are not variables but enter the balance of the low voltage grid
+# as net injection (see add_net_injection);
+
+VARIABLE_FLOWS = [key for key in gridcon.FLOWS
+                  if key not in gridcon.FIXED_FLOWS]
+
+# column blocks of the storage level and of the copies of the capacities of
+# the grid connection and of the storage following the flows;
+
+LEVEL = len(VARIABLE_FLOWS)
+GRID = LEVEL + 1
+STORAGE = LEVEL + 2
+
+
+class SparseLP(object):
+
+    """
+    the GridCon LP in the form of scipy.optimize.linprog
+
+    minimise cost @ x subject to A_ub @ x <= b_ub, A_eq @ x == b_eq and
+    bounds on x; the columns are the flows in VARIABLE_FLOWS, the storage
+    level and the capacities of the grid connection and of the storage, each
+    one block of "timesteps" columns
+
+    parameters
+    ----------
+    cost, b_ub, b_eq : numpy.ndarray
+    A_ub, A_eq : scipy.sparse.csr_matrix
+    bounds : numpy.ndarray
+        lower and upper bound of each column, shape (columns, 2)
+    timeindex : pandas.DatetimeIndex
+    fixed_flows : dict
+        the values of the fixed flows (see FIXED_FLOWS)
+
+    """
+
+    def __init__(self, cost, A_ub, b_ub, A_eq, b_eq, bounds, timeindex,
+                 fixed_flows):
+
+        self.cost = cost
+        self.A_ub = A_ub
+        self.b_ub = b_ub
+        self.A_eq = A_eq
+        self.b_eq = b_eq
+        self.bounds = bounds
+        self.timeindex = timeindex
+        self.fixed_flows = fixed_flows
+
+    @property
+    def timesteps(self):
+        return len(self.timeindex)
+
+##################################################################################
+# ASSEMBLY OF THE LP
+##################################################################################
+
+def _rows(entries, n_rows, n_columns):
+
+    # returns the sparse matrix of the rows given as list of (row indices,
+    # column indices, coefficients), each of them broadcast to the same
+    # length;
+
+    rows, columns, values = [], [], []
+    for row, column, value in entries:
+        row, column, value = np.broadcast_arrays(row, column, value)
+        rows.append(row.ravel())
+        columns.append(column.ravel())
+        values.append(value.ravel().astype(float))
+    return sparse.csr_matrix(
+        (np.concatenate(values), (np.concatenate(rows),
+                                  np.concatenate(columns))),
+        shape=(n_rows, n_columns))
+
+
+def build_lp(data, parameters=None, number_timesteps=None, weighting=None,
+             investment_bounds=None, time_step=0.25):
+
+    """
+    assembles the GridCon LP as sparse matrices
+
+    parameters
+    ----------
+    data : pandas.DataFrame
+        profile with the columns "demand_el", "machine_load" and "pv"
+    parameters : dict
+        parameter overrides (see GridCon_storage.DEFAULT_PARAMETERS)
+    number_timesteps : int
+        number of timesteps; defaults to the length of the profile
+    weighting, investment_bounds, time_step :
+        see GridCon_storage.create_energysystem
+
+    returns
+    -------
+    SparseLP
+
+    """
+
+    if number_timesteps is None:
+        number_timesteps = len(data)
+    p = gridcon.merge_parameters(parameters)
+    ep_costs, variable_costs = gridcon.cost_coefficients(p)
+    T = number_timesteps
+    t = np.arange(T)
+    timeindex = pd.date_range('1/1/2016', periods=T,
+                              freq=pd.Timedelta(hours=time_step))
+    fixed_flows = {key: data[column].values[:T].astype(float)
+                   for key, column in gridcon.FIXED_FLOWS.items()}
+
+    def block(key):
+        return VARIABLE_FLOWS.index(key) * T + t
+
+    level = LEVEL * T + t
+    grid = GRID * T + t
+    storage = STORAGE * T + t
+    n_columns = (STORAGE + 1) * T
+
+    # objective: variable costs per kWh of each timestep, weighted, and the
+    # ep_costs of both halves of the grid connection and of the storage,
+    # charged on the first copy of the capacities;
+
+    w = np.ones(T) if weighting is None else np.asarray(weighting,
+                                                        dtype=float)
+    cost = np.zeros(n_columns)
+    for key, value in variable_costs.items():
+        cost[block(key)] = value * time_step * w
+    cost[grid[0]] = (ep_costs['transformer_mv_to_lv', 'b_el_lv']
+                  + ep_costs['b_el_lv', 'transformer_lv_to_mv'])
+    cost[storage[0]] = ep_costs['el_lv_1_storage']
+
+    # equalities: balances of both buses, conversion of both transformers,
+    # balance of the storage, which is cyclic like in oemof (the first
+    # timestep follows the last one), and the chains of the copies of the
+    # capacities;
+
+    grid_eff = 1 - p['grid_loss_rate']
+    keep = 1 - gridcon.capacity_loss_per_timestep(p, time_step)
+    icf, ocf = p['icf'], p['ocf']
+    net_injection = np.zeros(T)
+    for (source, target), values in fixed_flows.items():
+        net_injection += -values if source == 'b_el_lv' else values
+
+    mv, lv, supply, collect, balance = (k * T + t for k in range(5))
+    chain = 5 * T + np.arange(T - 1)
+    A_eq = _rows([
+        (mv, block(('mv_source', 'b_el_mv')), 1),
+        (mv, block(('transformer_lv_to_mv', 'b_el_mv')), 1),
+        (mv, block(('b_el_mv', 'el_mv_sink')), -1),
+        (mv, block(('b_el_mv', 'transformer_mv_to_lv')), -1),
+        (lv, block(('transformer_mv_to_lv', 'b_el_lv')), 1),
+        (lv, block(('el_lv_6_grid_excess', 'b_el_lv')), 1),
+        (lv, block(('el_lv_1_storage', 'b_el_lv')), 1),
+        (lv, block(('b_el_lv', 'transformer_lv_to_mv')), -1),
+        (lv, block(('b_el_lv', 'el_lv_4_excess_sink')), -1),
+        (lv, block(('b_el_lv', 'el_lv_1_storage')), -1),
+        (supply, block(('transformer_mv_to_lv', 'b_el_lv')), 1),
+        (supply, block(('b_el_mv', 'transformer_mv_to_lv')), -grid_eff),
+        (collect, block(('transformer_lv_to_mv', 'b_el_mv')), 1),
+        (collect, block(('b_el_lv', 'transformer_lv_to_mv')), -grid_eff),
+        (balance, level, 1),
+        (balance, LEVEL * T + (t - 1) % T, -keep),
+        (balance, block(('b_el_lv', 'el_lv_1_storage')), -icf * time_step),
+        (balance, block(('el_lv_1_storage', 'b_el_lv')), time_step / ocf),
+        (chain, grid[:-1], 1),
+        (chain, grid[1:], -1),
+        (chain + T - 1, storage[:-1], 1),
+        (chain + T - 1, storage[1:], -1),
+        ], 7 * T - 2, n_columns)
+    b_eq = np.zeros(7 * T - 2)
+    b_eq[lv] = -net_injection
+
+    # inequalities: flows through the grid connection and into and out of
+    # the storage up to the capacity, storage level between capacity_min and
+    # capacity_max of the capacity;
+
+    rows = [k * T + t for k in range(6)]
+    A_ub = _rows([
+        (rows[0], block(('transformer_mv_to_lv', 'b_el_lv')), 1),
+        (rows[0], grid, -1),
+        (rows[1], block(('b_el_lv', 'transformer_lv_to_mv')), 1),
+        (rows[1], grid, -1),
+        (rows[2], block(('b_el_lv', 'el_lv_1_storage')), 1),
+        (rows[2], storage, -1),
+        (rows[3], block(('el_lv_1_storage', 'b_el_lv')), 1),
+        (rows[3], storage, -1),
+        (rows[4], level, 1),
+        (rows[4], storage, -p['capacity_max']),
+        (rows[5], level, -1),
+        (rows[5], storage, p['capacity_min']),
+        ], 6 * T, n_columns)
+    b_ub = np.zeros(6 * T)
+
+    bounds = np.zeros((n_columns, 2))
+    bounds[:, 1] = np.inf
+    for columns, name in ((grid, 'grid'), (storage, 'storage')):
+        if investment_bounds is not None and name in investment_bounds:
+            lower = investment_bounds[name][0]
+            bounds[columns, 0] = 0 if lower is None else lower
+        bounds[columns, 1] = gridcon.investment_maximum(investment_bounds,
+                                                        name)
+
+    return SparseLP(cost, A_ub, b_ub, A_eq, b_eq, bounds, timeindex,
+                    fixed_flows)
+
+##################################################################################
+# SOLVING
+##################################################################################
+
+def solve_lp(lp, method='interior-point', options=None):
+
+    """
+    solves the LP in memory by scipy.optimize.linprog
+
+    parameters
+    ----------
+    lp : SparseLP
+    method : str
+        method of linprog; "interior-point" keeps the matrices sparse, the
+        simplex methods of scipy work on dense matrices and suit short
+        profiles only
+    options : dict
+        options of the method; for "interior-point" "sparse" defaults to
+        True, "tol" to 1e-10 and "rr" to False
+
+    returns
+    -------
+    GridCon_storage.GridConResults
+        flows, storage level, investments and objective in the structure of
+        extract_results, without summary (see GridCon_storage.cost_summary)
+
+    """
+
+    options = dict(options or {})
+    if method == 'interior-point':
+        options.setdefault('sparse', True)
+        options.setdefault('tol', 1e-10)
+
+        # the equalities have full rank by construction, each balance and
+        # chain having a column of its own; the redundancy check of linprog
+        # grows quadratically with the timesteps;
+
+        options.setdefault('rr', False)
+        A_ub, A_eq = lp.A_ub, lp.A_eq
+    else:
+        A_ub, A_eq = lp.A_ub.toarray(), lp.A_eq.toarray()
+
+    logging.info('Solve the sparse LP by linprog ({0})'.format(method))
+    solution = linprog(lp.cost, A_ub=A_ub, b_ub=lp.b_ub, A_eq=A_eq,
+                       b_eq=lp.b_eq, bounds=lp.bounds, method=method,
+                       options=options)
+    if solution.status != 0:
+        raise RuntimeError('linprog failed: {0}'.format(solution.message))
+
+    x = solution.x
+    T = lp.timesteps
+    grid = x[GRID * T]
+    flows = {key: x[k * T:(k + 1) * T].copy()
+             for k, key in enumerate(VARIABLE_FLOWS)}
+    flows.update(lp.fixed_flows)
+    flows = {key: flows[key] for key in gridcon.FLOWS}
+    investments = {
+        'grid_collection_capacity': grid,
+        'grid_supply_capacity': grid,
+        'storage_capacity': x[STORAGE * T],
+        }
+    return gridcon.GridConResults(
+        lp.timeindex, flows, x[LEVEL * T:(LEVEL + 1) * T].copy(),
+        investments, float(solution.fun))
+
+
+def optimise_sparse(data, parameters=None, number_timesteps=None,
+                    weighting=None, investment_bounds=None, time_step=0.25,
+                    method='interior-point', options=None):
+
+    """
+    sizes grid connection and storage without oemof and pyomo
+
+    parameters
+    ----------
+    data, parameters, number_timesteps, weighting, investment_bounds,
+    time_step :
+        see build_lp
+    method, options :
+        see solve_lp
+
+    returns
+    -------
+    GridCon_storage.GridConResults
+        flows, storage level, investments and cost breakdown ("summary")
+
+    """
+
+    p = gridcon.merge_parameters(parameters)
+    results = solve_lp(build_lp(data, p, number_timesteps, weighting,
+                                investment_bounds, time_step),
+                       method, options)
+    results.summary = gridcon.cost_summary(results, p, weighting)
+    return results
@@ -0,0 +1,436 @@
+# -*- coding: utf-8 -*-
+"""
+Module to size grid connection and storage for several scenario years.
+
+The capacities of grid connection and storage are first-stage decisions which
+have to suit all scenario years (e.g. PV generation and machine load of
+different weather years), the dispatch is decided per scenario. The expected
+annual costs are minimised by progressive hedging: every scenario is solved
+as its own GridCon model with a penalty on the deviation of its capacities
+from their probability-weighted mean, the penalties are increased until all
+scenarios agree on the capacities. The scenario models are built once in
+worker processes, which keep them for all iterations and solve them warm
+started (see ReusableModel), so that the scenarios are solved in parallel
+and no extensive form with all scenario years in one LP is built.
+
+The quadratic proximal term of progressive hedging is approximated by
+tangents around the mean, as cbc only solves linear programs; the tangents
+are refined with the remaining spread of the capacities.
+"""
+
+##################################################################################
+# IMPORTS
+##################################################################################
+
+import logging
+import multiprocessing
+import os
+
+import numpy as np
+import pandas as pd
+from pyomo import environ
+
+import GridCon_storage_171221d as gridcon
+from GridCon_model import ReusableModel
+
+##################################################################################
+# SCENARIO SUBPROBLEMS
+##################################################################################
+
+# first-stage decisions; the capacity of the grid collection equals the
+# capacity of the grid supply (ConnectInvest) and follows it;
+
+FIRST_STAGE = ('grid_supply_capacity', 'storage_capacity')
+
+# number of tangents of the proximal term on each side of the mean, besides
+# the outer ones;
+
+TANGENTS = 8
+
+
+def _first_stage_variables(om):
+
+    # returns the investment variables of FIRST_STAGE;
+
+    groups = om.es.groups
+    return [om.InvestmentFlow.invest[groups['transformer_mv_to_lv'],
+                                     groups['b_el_lv']],
+            om.InvestmentStorage.invest[groups['el_lv_1_storage']]]
+
+
+def first_stage_costs(parameters):
+
+    # returns the ep_costs of FIRST_STAGE (in €/kW resp. €/kWh per year); the
+    # grid supply carries the costs of both halves of the grid connection;
+
+    ep_costs, _ = gridcon.cost_coefficients(parameters)
+    return np.array([
+        ep_costs['transformer_mv_to_lv', 'b_el_lv']
+        + ep_costs['b_el_lv', 'transformer_lv_to_mv'],
+        ep_costs['el_lv_1_storage']])
+
+
+def add_hedging(om):
+
+    """
+    adds the terms of progressive hedging to the objective of a model
+
+    the objective becomes costs + w x + z, where x are the FIRST_STAGE
+    variables and z >= rho/2 (x - xbar)^2 is approximated from below by
+    tangents at xbar + offset[k] (see tangent_offsets); w, xbar, rho and
+    offset are mutable parameters of the block "Hedging"; with rho = 0 and
+    w = 0 the model is the plain scenario model
+
+    parameters
+    ----------
+    om : solph.OperationalModel
+        model with the objective built by ReusableModel
+
+    returns
+    -------
+    pyomo.environ.Block
+
+    """
+
+    x = _first_stage_variables(om)
+    variables = range(len(x))
+    tangents = range(2 * TANGENTS + 3)
+
+    block = environ.Block()
+    om.add_component('Hedging', block)
+    block.w = environ.Param(variables, mutable=True, initialize=0)
+    block.xbar = environ.Param(variables, mutable=True, initialize=0)
+    block.rho = environ.Param(variables, mutable=True, initialize=0)
+    block.offset = environ.Param(variables, tangents, mutable=True,
+                                 initialize=0)
+    block.z = environ.Var(variables, within=environ.NonNegativeReals)
+
+    def tangent_rule(block, j, k):
+        return block.z[j] >= (
+            block.rho[j] * block.offset[j, k] * (x[j] - block.xbar[j])
+            - 0.5 * block.rho[j] * block.offset[j, k] ** 2)
+
+    block.tangent = environ.Constraint(variables, tangents,
+                                       rule=tangent_rule)
+
+    om.del_component(om.objective)
+    om.objective = environ.Objective(
+        expr=om.InvestmentFlow.investment_costs
+        + om.InvestmentStorage.investment_costs + om.Flow.variable_costs
+        + sum(block.w[j] * x[j] + block.z[j] for j in variables),
+        sense=environ.minimize)
+    return block
+
+
+def tangent_offsets(spread, reach):
+
+    # returns the offsets of the tangents from the mean, one row per
+    # variable: 0, +-spread / 2**k for k = 0..TANGENTS-1, and +-reach; the
+    # outer tangents make the slope of the objective positive for large
+    # capacities, which the linear term w x alone may not (unbounded LP);
+
+    spread = np.asarray(spread, dtype=float)[:, None]
+    reach = np.asarray(reach, dtype=float)[:, None]
+    inner = spread / 2.0 ** np.arange(TANGENTS)
+    return np.hstack([np.zeros_like(spread), inner, -inner, reach, -reach])
+
+
+def _set_hedging(block, w, xbar, rho, offsets):
+
+    # sets the parameters of the hedging terms (see add_hedging);
+
+    for j in range(len(xbar)):
+        block.w[j] = float(w[j])
+        block.xbar[j] = float(xbar[j])
+        block.rho[j] = float(rho[j])
+        for k, offset in enumerate(offsets[j]):
+            block.offset[j, k] = float(offset)
+
+
+def _scenario_worker(connection, scenarios, parameters, number_timesteps,
+                     solver, solver_threads):
+
+    # builds the models of the given scenarios {index: data} and answers the
+    # commands of the parent process until it sends None:
+    # ("solve", {index: (w, xbar, rho, offsets)}) solves the scenarios with
+    # these hedging terms and returns {index: (x, summary)};
+    # ("evaluate", x) solves all scenarios with the capacities fixed to x and
+    # returns {index: (x, summary)};
+    # errors are returned as ("error", message);
+
+    models = {}
+    try:
+        for index, data in scenarios.items():
+            model = ReusableModel(data, parameters, number_timesteps,
+                                  solver=solver, solver_threads=solver_threads,
+                                  collapse_fixed_flows=True)
+            block = add_hedging(model.om)
+            model.refresh_solver(added=[block])
+            models[index] = (model, block)
+        connection.send(('ready', None))
+
+        while True:
+            command = connection.recv()
+            if command is None:
+                break
+            action, arguments = command
+            answer = {}
+            for index, (model, block) in models.items():
+                x = _first_stage_variables(model.om)
+                if action == 'solve':
+                    _set_hedging(block, *arguments[index])
+                else:
+                    _set_hedging(block, np.zeros(len(x)), arguments,
+                                 np.zeros(len(x)),
+                                 tangent_offsets(np.zeros(len(x)),
+                                                 np.zeros(len(x))))
+                    for var, value in zip(x, arguments):
+                        var.setlb(float(value))
+                        var.setub(float(value))
+
+                # the tangents and the objective depend on the mutable
+                # parameters of the hedging terms; a persistent solver
+                # receives them, and the fixed capacities, again;
+
+                model.refresh_solver(
+                    changed=list(block.tangent.values()),
+                    variables=x if action == 'evaluate' else ())
+                summary = model.solve(warmstart=True)
+                answer[index] = (np.array([var.value for var in x]), summary)
+            connection.send(('done', answer))
+    except Exception as e:
+        logging.exception('Scenario worker failed')
+        connection.send(('error', repr(e)))
+    finally:
+        for model, _ in models.values():
+            model.close()
+        connection.close()
+
+
+class _ScenarioPool(object):
+
+    # worker processes which keep the models of the scenarios, each
+    # scenario assigned to one of them;
+
+    def __init__(self, scenarios, parameters, number_timesteps, solver,
+                 max_workers, solver_threads):
+
+        workers = max(1, min(max_workers, len(scenarios)))
+        self.connections = []
+        self.processes = []
+        for w in range(workers):
+            assigned = {i: data for i, data in enumerate(scenarios)
+                        if i % workers == w}
+            parent, child = multiprocessing.Pipe()
+            process = multiprocessing.Process(
+                target=_scenario_worker,
+                args=(child, assigned, parameters, number_timesteps, solver,
+                      solver_threads))
+            process.daemon = True
+            process.start()
+            child.close()
+            self.connections.append(parent)
+            self.processes.append(process)
+        self._receive()
+
+    def _receive(self):
+
+        answers = {}
+        errors = []
+        for connection in self.connections:
+            status, answer = connection.recv()
+            if status == 'error':
+                errors.append(answer)
+            elif answer is not None:
+                answers.update(answer)
+        if errors:
+            raise RuntimeError('Scenario subproblem failed: {0}'.format(
+                '; '.join(errors)))
+        return answers
+
+    def solve(self, hedging):
+
+        # solves all scenarios in parallel; returns {index: (x, summary)};
+
+        for w, connection in enumerate(self.connections):
+            connection.send(('solve', {
+                i: arguments for i, arguments in hedging.items()
+                if i % len(self.connections) == w}))
+        return self._receive()
+
+    def evaluate(self, x):
+
+        # solves all scenarios with the capacities fixed to x;
+
+        for connection in self.connections:
+            connection.send(('evaluate', x))
+        return self._receive()
+
+    def close(self):
+
+        for connection in self.connections:
+            try:
+                connection.send(None)
+            except (OSError, EOFError):
+                pass
+        for process in self.processes:
+            process.join(timeout=10)
+            if process.is_alive():
+                process.terminate()
+
+##################################################################################
+# PROGRESSIVE HEDGING
+##################################################################################
+
+def stochastic_sizing(scenarios, probabilities=None, parameters=None,
+                      number_timesteps=None, solver='cbc', max_workers=None,
+                      solver_threads=1, rho_factor=5.0, tolerance=1e-4,
+                      max_iterations=50):
+
+    """
+    sizes grid connection and storage for several scenario years
+
+    parameters
+    ----------
+    scenarios : list of pandas.DataFrame
+        profiles with the columns "demand_el", "machine_load" and "pv", one
+        per scenario year
+    probabilities : array_like
+        probabilities of the scenarios; defaults to equal probabilities
+    parameters : dict
+        parameter overrides (see GridCon_storage.DEFAULT_PARAMETERS)
+    number_timesteps : int
+        number of 15 minutes timesteps; defaults to the length of the
+        shortest profile
+    solver : str
+        name of the solver
+    max_workers : int
+        maximum number of worker processes; defaults to the number of cores
+        divided by solver_threads
+    solver_threads : int
+        number of threads each solver may use
+    rho_factor : float
+        penalty of the deviation from the mean relative to the ep_costs of
+        the capacities divided by their initial spread over the scenarios
+    tolerance : float
+        the iterations stop once the mean deviation of the capacities of the
+        scenarios from their mean is below this fraction of the mean
+    max_iterations : int
+        maximum number of iterations of progressive hedging
+
+    returns
+    -------
+    dict
+        "grid_supply_capacity" and "storage_capacity" (the hedged
+        capacities), "expected_total_annual_costs" at these capacities,
+        "converged", "scenarios" (pandas.DataFrame with one row per scenario:
+        probability, capacities of its own deterministic solution, and the
+        summary at the hedged capacities) and "history" (pandas.DataFrame
+        with the mean capacities and the convergence metric per iteration)
+
+    """
+
+    if len(scenarios) < 1:
+        raise ValueError('At least one scenario is required')
+    if probabilities is None:
+        probabilities = np.full(len(scenarios), 1 / len(scenarios))
+    probabilities = np.asarray(probabilities, dtype=float)
+    if len(probabilities) != len(scenarios) or (probabilities < 0).any():
+        raise ValueError('One non-negative probability per scenario is '
+                         'required')
+    probabilities = probabilities / probabilities.sum()
+    if number_timesteps is None:
+        number_timesteps = min(len(data) for data in scenarios)
+    p = gridcon.merge_parameters(parameters)
+    if max_workers is None:
+        max_workers = max(1, (os.cpu_count() or 1) // solver_threads)
+    n = len(scenarios)
+    m = len(FIRST_STAGE)
+
+    pool = _ScenarioPool(scenarios, p, number_timesteps, solver, max_workers,
+                         solver_threads)
+    try:
+
+        # iteration 0 solves the scenarios without hedging terms;
+
+        zero = np.zeros(m)
+        answers = pool.solve({i: (zero, zero, zero,
+                                  tangent_offsets(zero, zero))
+                              for i in range(n)})
+        x = np.array([answers[i][0] for i in range(n)])
+        deterministic = x.copy()
+        xbar = probabilities @ x
+        spread = probabilities @ np.abs(x - xbar)
+        costs = first_stage_costs(p)
+        rho = rho_factor * costs / np.maximum(spread, 1)
+        w = rho * (x - xbar)
+
+        history = []
+        converged = False
+        for iteration in range(max_iterations + 1):
+            metric = (probabilities @ np.abs(x - xbar)).sum() / max(
+                1, np.abs(xbar).sum())
+            history.append(dict(zip(FIRST_STAGE, xbar), iteration=iteration,
+                                convergence=metric))
+            logging.info('Progressive hedging iteration {0}: capacities {1}, '
+                         'convergence {2:.2e}'.format(
+                             iteration, np.round(xbar, 3), metric))
+            if metric < tolerance:
+                converged = True
+                break
+            if iteration == max_iterations:
+                break
+
+            # the tangents of the proximal term are placed within the
+            # current largest deviation from the mean; the outer tangents of
+            # a scenario lie twice as far as the capacity at which the
+            # penalty outweighs a negative w + ep_costs;
+
+            deviation = np.maximum(np.abs(x - xbar).max(axis=0),
+                                   tolerance * np.maximum(np.abs(xbar), 1))
+            answers = pool.solve({
+                i: (w[i], xbar, rho, tangent_offsets(
+                    deviation, np.maximum(
+                        2 * deviation,
+                        2 * np.abs(w[i] + costs) / np.maximum(rho, 1e-12))))
+                for i in range(n)})
+            x = np.array([answers[i][0] for i in range(n)])
+            xbar = probabilities @ x
+            w += rho * (x - xbar)
+
+        if not converged:
+            logging.warning('Progressive hedging did not converge within {0} '
+                            'iterations'.format(max_iterations))
+
+        # the scenarios are evaluated at the mean capacities and at the
+        # largest capacities of the scenarios, which differ by about the
+        # tolerance; the dummy source el_lv_6_grid_excess makes the costs
+        # jump if the mean falls short of the peak of a scenario, hence the
+        # cheaper of both is returned;
+
+        candidates = [xbar, x.max(axis=0)]
+        evaluations = [pool.evaluate(c) for c in candidates]
+        expected = [probabilities @ np.array(
+            [e[i][1]['total_annual_costs'] for i in range(n)])
+            for e in evaluations]
+        best = int(np.argmin(expected))
+        hedged, evaluated = candidates[best], evaluations[best]
+        logging.info('Expected annual costs {0:.2f} at the mean, {1:.2f} at '
+                     'the largest capacities of the scenarios'.format(
+                         *expected))
+    finally:
+        pool.close()
+
+    rows = []
+    for i in range(n):
+        row = {'scenario': i, 'probability': probabilities[i]}
+        row.update({'deterministic_' + name: value
+                    for name, value in zip(FIRST_STAGE, deterministic[i])})
+        row.update(evaluated[i][1])
+        rows.append(row)
+    table = pd.DataFrame(rows).set_index('scenario')
+
+    return {'grid_supply_capacity': hedged[0], 'storage_capacity': hedged[1],
+            'expected_total_annual_costs': expected[best],
+            'converged': converged, 'scenarios': table,
+            'history': pd.DataFrame(history).set_index('iteration')}
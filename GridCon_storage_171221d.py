@@ -2,126 +2,204 @@
 # IMPORTS
 ##################################################################################
 
-# outputlib
-
-from oemof import outputlib
-
 # default logger of oemof
 
 from oemof.tools import logger
 from oemof.tools import helpers
 from oemof.tools import economics_BAUM
+from oemof import network
 
-    # economics is a tool to calculate the equivalent periodical cost (epc) of 
-    # an investment; 
-    # it has been modified by B.A.U.M. Consult GmbH within the frame of the 
-    # GridCon project (www.gridcon-project.de) and the modified version 
+    # economics is a tool to calculate the equivalent periodical cost (epc) of
+    # an investment;
+    # it has been modified by B.A.U.M. Consult GmbH within the frame of the
+    # GridCon project (www.gridcon-project.de) and the modified version
     # has been called "economics_BAUM";
     # it allows now calculting epc of a series of investments with a defined
     # cost-decrease rate;
-    # it also allows taking into account fixed periodical costs such as staff 
+    # it also allows taking into account fixed periodical costs such as staff
     # cost and offset fixed periodical income;
 
 from pyomo import environ
+from pyomo.opt import SolverFactory
 import oemof.solph as solph
 
 # import oemof base classes to create energy system objects
 
+from collections import UserDict, UserList
 import logging
 import os
+import re
+import numpy as np
 import pandas as pd
 
+import GridCon_instrumentation
+from GridCon_instrumentation import phase
+import GridCon_profile
+
 try:
     import matplotlib.pyplot as plt
 except ImportError:
     plt = None
 
-# import load and generation data from csv-file and define timesteps
-
-def optimise_storage_size(filename="GridCon1_Profile.csv", 
-                          solver='cbc', debug=True, number_timesteps= (96*366),
-                          tee_switch=True):
-    
-    # the file "GridCon1_Profile" contains the normalised profile for the 
-    # agricultural base load profile L2, a synthetic electrified agricultural 
-    # machine load profile, and the PV generation profile ES0;
-    # number_timesteps: one timestep has a duration of 15 minutes, 
-    # hence, 96 is the number of timesteps per day;
-    # 366 is the number of days in a leap year, chosen here because 
-    # standard load profils of 2016 are used;
-    # the total number of timesteps is therefore 96*366 = 35136;
-
-# initialise energysystem, date, time increment
-    
-    logging.info('Initialise the Energysystem')
-    
-    date_time_index = pd.date_range('1/1/2016', periods=number_timesteps, 
-                                                                freq='15min')
-    energysystem = solph.EnergySystem(timeindex=date_time_index)
-
-    time_step = 0.25 
-    
-    # a 15 minutes time step equals 0.25 hours;
-
-# read data file
+##################################################################################
+# DEFAULT PARAMETERS
+##################################################################################
 
-    full_filename = os.path.join(os.path.dirname(__file__), filename)
-    data = pd.read_csv(full_filename, sep=",")
+# default values of all economic and technical assumptions of the model;
+# their meaning and sources are explained where they are used below;
+# each of them can be overridden by a keyword argument of the same name passed
+# to optimise_storage_size, e.g. optimise_storage_size(prl_weeks=26);
+
+DEFAULT_PARAMETERS = {
+    'n': 50,
+    'invest_grid': 500,
+    'invest_el_lv_1_storage': 300,
+    'wacc': 0.05,
+    'u_grid': 50,
+    'cost_decrease_grid': 0,
+    'oc_rate_grid': 0.02,
+    'u_el_lv_1_storage': 5,
+    'cost_decrease_el_lv_1_storage': 0.1,
+    'oc_rate_el_lv_1_storage': 0.02,
+    'prl_on': 1,
+    'prl_weeks': 13,
+    'prl_remuneration': 3000,
+    'cost_electricity_losses': 6.5E-2,
+    'cost_grid_excess': 100000000,
+    'grid_loss_rate': 0.0685,
+    'icf': 0.95,
+    'ocf': 0.95,
+    'capacity_min': 0.1,
+    'capacity_max': 0.9,
+    'capacity_loss': 0.0000025,
+    }
+
+# flows of the GridCon energy system, given by the labels of their source and
+# target; the storage level is stored under the key of the storage itself;
+
+FLOWS = [
+    ('mv_source', 'b_el_mv'),
+    ('b_el_mv', 'el_mv_sink'),
+    ('b_el_mv', 'transformer_mv_to_lv'),
+    ('transformer_mv_to_lv', 'b_el_lv'),
+    ('b_el_lv', 'transformer_lv_to_mv'),
+    ('transformer_lv_to_mv', 'b_el_mv'),
+    ('el_lv_7_pv', 'b_el_lv'),
+    ('el_lv_6_grid_excess', 'b_el_lv'),
+    ('b_el_lv', 'el_lv_2_base_load'),
+    ('b_el_lv', 'el_lv_3_machine_load'),
+    ('b_el_lv', 'el_lv_4_excess_sink'),
+    ('b_el_lv', 'el_lv_1_storage'),
+    ('el_lv_1_storage', 'b_el_lv'),
+    ]
+
+# columns of the profile used by the model;
+
+PROFILE_COLUMNS = ('demand_el', 'machine_load', 'pv')
+
+# flows which are fixed to the columns of the profile; with
+# collapse_fixed_flows (see create_energysystem) they are not modelled as
+# flows but enter the balance of the low voltage grid as one net injection;
+
+FIXED_FLOWS = {
+    ('el_lv_7_pv', 'b_el_lv'): 'pv',
+    ('b_el_lv', 'el_lv_2_base_load'): 'demand_el',
+    ('b_el_lv', 'el_lv_3_machine_load'): 'machine_load',
+    }
+
+# solvers which understand the command line option "threads" (glpk is single
+# threaded and rejects it);
+
+THREADED_SOLVERS = ('cbc', 'gurobi', 'cplex')
+
+
+def merge_parameters(parameters=None, **overrides):
+
+    # returns a complete set of parameters: the default values updated by the
+    # given dictionary and keyword arguments;
+    # unknown names are rejected so that a typo in a sweep definition does not
+    # silently fall back to a default value;
+
+    merged = dict(DEFAULT_PARAMETERS)
+    given = dict(parameters or {}, **overrides)
+    unknown = sorted(set(given) - set(DEFAULT_PARAMETERS))
+    if unknown:
+        raise ValueError('Unknown GridCon parameter(s): {0}'.format(
+            ', '.join(unknown)))
+    merged.update(given)
+    return merged
 
 ##################################################################################
 # DEFINITION OF TO-BE-OPTIMISED STRUCTURES
 ##################################################################################
 
+def specific_costs(parameters):
+
+    # returns the specific equivalent periodical costs of the grid connection
+    # and of the electric energy storage system for a complete set of
+    # parameters (see merge_parameters);
+    # the parameters may also be numpy arrays of one value per parameter set
+    # (see GridCon_montecarlo.ep_costs_array); then the costs are arrays as
+    # well, computed by economics_BAUM.epc_array;
+
+    p = parameters
+    if any(np.ndim(value) for value in p.values()):
+        epc = economics_BAUM.epc_array
+    else:
+        epc = economics_BAUM.epc
+
 # definition of the investigated (financial) period for which the optimisation
-# is performed; 
+# is performed;
 # needs to be the same for all objects whose costs are taken into account;
 
-    n = 50
+    n = p['n']
 
-    # financial period in years for which equivalent periodical costs of 
-    # different options are compared;
+    # financial period in years for which equivalent periodical costs of
+    # different options are compared; default: 50 years;
 
 # definition of the specific investment costs of those objects whose size is
 # optimised; here, the electric grid connection and the electrical storage;
 # the electric grid connection considered here comprises the local mv-lv trans-
 # former plus the respective share of the entire up-stream grid;
 # as a consequence of oemof allowing to handle only positive flow values, the
-# grid connection needs to be modelled twice: a "collecting half" for the electric 
+# grid connection needs to be modelled twice: a "collecting half" for the electric
 # power flow from the local lv-grid to a far point in the up-stream grid (it
 # collects electricty generated in areas where generation exceeds the demand at
-# a given moment), and a "supplying half" for the inverse flow from that far 
-# point to the local grid (it supplies areas where the demand exceeds the 
+# a given moment), and a "supplying half" for the inverse flow from that far
+# point to the local grid (it supplies areas where the demand exceeds the
 # generation at a given moment);
-    
-    invest_grid = 500
-    
-    # assumed specific investment costs of the electric transformer linking the 
-    # low voltage and the medium voltage grid including respective share of 
-    # up-stream grid costs in €/kW;
+
+    invest_grid = p['invest_grid']
+
+    # assumed specific investment costs of the electric transformer linking the
+    # low voltage and the medium voltage grid including respective share of
+    # up-stream grid costs in €/kW; default: 500 €/kW;
     # the value is taken from a real price (about 200000 €) paid by an investor
     # for grid connection of about 400 kW active power provision capacity (at the
-    # low-voltage side of the transformer) set up for a new large load in a 
+    # low-voltage side of the transformer) set up for a new large load in a
     # rural area; this amount contains essentially upstream grid costs;
     # source: oral communication from a private investor;
-    
-    invest_el_lv_1_storage = 300
-    
+
+    invest_el_lv_1_storage = p['invest_el_lv_1_storage']
+
     # assumed specific investment costs of electric energy storage system in €/kWh
+    # default: 300 €/kWh;
     # figure reflects roughly specific investment costs of lithium-ion batteries;
     # source: Sterner/Stadler, Energiespeicher, p. 600 (indicates 170 - 600 €/kWh)
 
-# definition of parameters entering in the calculation of the equivalent 
+# definition of parameters entering in the calculation of the equivalent
 # periodical costs (epc) of the electric transformer and the up-stream grid;
 
-    wacc = 0.05
+    wacc = p['wacc']
+
+    # assumed weighted average cost of capital; default: 0.05;
 
-    # assumed weighted average cost of capital; 
-    
-    u_grid = 50
+    u_grid = p['u_grid']
 
     # assumed technical lifetime of electric transformer and up-stream grid;
+    # default: 50 years;
 
-    cost_decrease_grid = 0
+    cost_decrease_grid = p['cost_decrease_grid']
 
     # indicates the relative annual decrease of investment costs;
     # allows calculating the cost of a second or any further investment
@@ -130,103 +208,188 @@ def optimise_storage_size(filename="GridCon1_Profile.csv",
     # is considered to be made here within the financial period;
     # hence, there is no cost decrease and the variable takes the value zero;
 
-    oc_rate_grid = 0.02
+    oc_rate_grid = p['oc_rate_grid']
 
-    # percentage of initial investment costs assumed for calculation of 
-    # specific annual fixed operational costs of electric transformer and 
-    # up-stream grid;
+    # percentage of initial investment costs assumed for calculation of
+    # specific annual fixed operational costs of electric transformer and
+    # up-stream grid; default: 0.02;
 
     oc_grid = oc_rate_grid * invest_grid
 
-    # specific annual fixed operational costs of electric transformer and 
+    # specific annual fixed operational costs of electric transformer and
     # up-stream grid in €/kW of active power provision capacity;
 
-# calculation of specific equivalent periodical costs (epc) i.e. the annual costs 
-# equivalent to the investment costs (annuitiy) plus the fixed operational costs 
+# calculation of specific equivalent periodical costs (epc) i.e. the annual costs
+# equivalent to the investment costs (annuitiy) plus the fixed operational costs
 # of the electric transformer and the up-stream grid per kW of active power
-# provision capacity;      
-                  
-    sepc_grid = economics_BAUM.epc(invest_grid, n, u_grid, wacc, 
-                                      cost_decrease_grid, oc_grid)
+# provision capacity;
+
+    sepc_grid = epc(invest_grid, n, u_grid, wacc, cost_decrease_grid, oc_grid)
 
     # specific equivalent periodical costs of transformer and of up-stream grid
     # in €/kW;
-                                                                                                                                                                       
+
 # definition of parameters entering in the calculation of the equivalent
 # periodical costs of the electric energy storage system;
 
-    u_el_lv_1_storage = 5
+    u_el_lv_1_storage = p['u_el_lv_1_storage']
 
-    # assumed technical lifetime of electric energy storage system
+    # assumed technical lifetime of electric energy storage system;
+    # default: 5 years;
 
-    cost_decrease_el_lv_1_storage = 0.1
+    cost_decrease_el_lv_1_storage = p['cost_decrease_el_lv_1_storage']
 
     # assumed annual cost decrease rate for newly installed electric energy
     # storage systems; reflects roughly learning curve for lithium-ion battery
-    # storage systems in 2010-2016;
+    # storage systems in 2010-2016; default: 0.1;
 
-    oc_rate_el_lv_1_storage = 0.02
+    oc_rate_el_lv_1_storage = p['oc_rate_el_lv_1_storage']
 
-    # percentage of specific initial investment costs assumed for calculation of 
+    # percentage of specific initial investment costs assumed for calculation of
     # specific annual fixed operational costs of electric storage system;
+    # default: 0.02;
 
     oc_el_lv_1_storage = oc_rate_el_lv_1_storage * invest_el_lv_1_storage
 
     # specific annual fixed operational costs of electric storage system in €/kWh;
 
-# calculation of specific equivalent periodical costs (sepc in €/kWh/year) 
-# i.e. the specific annual costs equivalent to the investment costs (annuitiy) 
-# plus the fixed operational costs of the electric energy storage system;      
-                  
-    sepc_el_lv_1_storage = economics_BAUM.epc(invest_el_lv_1_storage, n, 
-                                       u_el_lv_1_storage, wacc,
-                                       cost_decrease_el_lv_1_storage, 
-                                       oc_el_lv_1_storage)
-    
+# calculation of specific equivalent periodical costs (sepc in €/kWh/year)
+# i.e. the specific annual costs equivalent to the investment costs (annuitiy)
+# plus the fixed operational costs of the electric energy storage system;
+
+    sepc_el_lv_1_storage = epc(invest_el_lv_1_storage, n, u_el_lv_1_storage,
+                               wacc, cost_decrease_el_lv_1_storage,
+                               oc_el_lv_1_storage)
+
     kS_el = sepc_el_lv_1_storage
-    
+
     # equivalent specific annual costs of electric energy storage system in €/kWh;
     # refers to nominal storage capacity;
 
 # calculation of income from provision of primary balancing power by electric
 # energy storage system; income is substracted from equivalent periodical costs;
 
-    prl_on = 1
+    prl_on = p['prl_on']
 
     # if primary balancing power is planned to be provided by the energy storage,
-    # set value "1", otherwise "0";
+    # set value "1", otherwise "0"; default: 1;
+
+    prl_weeks = p['prl_weeks']
+
+    # number of entire weeks for which primary balancing power is planned to be
+    # provided; default: 13;
+
+    prl_remuneration = p['prl_remuneration']
 
-    prl_weeks = 13
+    # remuneration for the provision of primary balancing power in €/week per
+    # MW; default: 3000 €/week;
 
-    # number of entire weeks for which primary balancing power is planned to be 
-    # provided
-    
-    prl_income = 2.4 * prl_on * prl_weeks
+    prl_income = prl_remuneration / 1000 * 0.8 * prl_on * prl_weeks
 
-    # corresponds to specific annual income per kWh of nominal electric energy 
-    # storage capacity, i.e. expressed in €/kWh, generated by provision 
-    # of primary balancing power in Germany at a remuneration of 3000 €/week by 
-    # an energy storage with a charge/ discharge rate of at least 1 MW per MWh 
-    # of storage capacity operated between 10% and 90% of its nominal capacity; 
+    # corresponds to specific annual income per kWh of nominal electric energy
+    # storage capacity, i.e. expressed in €/kWh, generated by provision
+    # of primary balancing power in Germany at a remuneration of 3000 €/week by
+    # an energy storage with a charge/ discharge rate of at least 1 MW per MWh
+    # of storage capacity operated between 10% and 90% of its nominal capacity;
+    # at the default remuneration this amounts to 2.4 €/kWh per week;
 
     sepc_el_lv_1_storage = sepc_el_lv_1_storage - prl_income
-    
+
     kS_el_netto = sepc_el_lv_1_storage
 
-    # net specific equivalent periodical costs of electric energy storage system 
-    # taking into account income generated from provision of primary balancing 
+    # net specific equivalent periodical costs of electric energy storage system
+    # taking into account income generated from provision of primary balancing
     # power;
-       
+
+    return {'sepc_grid': sepc_grid, 'kS_el': kS_el, 'prl_income': prl_income,
+            'kS_el_netto': kS_el_netto}
+
+
+def cost_coefficients(parameters):
+
+    # returns the coefficients of the objective function for a complete set of
+    # parameters: the ep_costs of the investment objects (in €/kW resp. €/kWh
+    # per year) and the variable costs of the flows (in €/kWh), keyed by the
+    # labels of the source and target of the flow, respectively by the label
+    # of the storage;
+    # the meaning of the individual terms is explained in create_energysystem;
+
+    p = parameters
+    costs = specific_costs(p)
+    cost_electricity_losses = p['cost_electricity_losses']
+    grid_loss_rate = p['grid_loss_rate']
+    grid_eff = 1 - grid_loss_rate
+    el_storage_conversion_factor = p['icf'] * p['ocf']
+
+    ep_costs = {
+        ('transformer_mv_to_lv', 'b_el_lv'): 0.5 * costs['sepc_grid'],
+        ('b_el_lv', 'transformer_lv_to_mv'): 0.5 * costs['sepc_grid'],
+        'el_lv_1_storage': costs['kS_el_netto'],
+        }
+    variable_costs = {
+        ('el_lv_6_grid_excess', 'b_el_lv'): p['cost_grid_excess'],
+        ('b_el_lv', 'el_lv_4_excess_sink'): cost_electricity_losses,
+        ('b_el_mv', 'transformer_mv_to_lv'):
+            grid_loss_rate * cost_electricity_losses,
+        ('transformer_lv_to_mv', 'b_el_mv'):
+            cost_electricity_losses * grid_loss_rate / grid_eff,
+        ('b_el_lv', 'el_lv_1_storage'):
+            cost_electricity_losses * (1 - el_storage_conversion_factor),
+        }
+    return ep_costs, variable_costs
+
 ##################################################################################
 # CREATION OF OEMOF STRUCTURE
 ##################################################################################
 
+def create_energysystem(data, parameters, number_timesteps=(96*366),
+                        weighting=None, investment_bounds=None,
+                        collapse_fixed_flows=False, time_step=0.25):
+
+    # returns the GridCon energy system for the load and generation data in
+    # "data" (columns "demand_el", "machine_load" and "pv") and a complete set
+    # of parameters (see merge_parameters);
+    # "weighting" optionally gives the number of times each timestep stands
+    # for in the modelled year (e.g. for typical days); all variable costs
+    # are multiplied by it, the investment costs remain annual costs;
+    # "investment_bounds" optionally limits the investments, see
+    # investment_maximum;
+    # if "collapse_fixed_flows" is true, PV generation, base load and machine
+    # load (FIXED_FLOWS) are not created as components; create_model adds
+    # their sum to the balance of the low voltage grid instead, which saves
+    # three variables per timestep, and restore_fixed_flows adds the
+    # components and their flows to the results after solving;
+    # "time_step" is the duration of a timestep of "data" in hours, e.g. 1 for
+    # a profile resampled to hours (see GridCon_resampling); the variable
+    # costs and the storage balance follow it through the time increment of
+    # the model, the self-discharge is converted by capacity_loss_per_timestep;
+
+# initialise energysystem, date, time increment
+
+    logging.info('Initialise the Energysystem')
+
+    date_time_index = pd.date_range('1/1/2016', periods=number_timesteps,
+                                    freq=pd.Timedelta(hours=time_step))
+    energysystem = solph.EnergySystem(timeindex=date_time_index)
+    energysystem.fixed_flows = {}
+    if collapse_fixed_flows:
+        energysystem.fixed_flows = {
+            key: data[column].values[:number_timesteps].astype(float)
+            for key, column in FIXED_FLOWS.items()}
+
+    p = parameters
+    ep_costs, variable_costs = cost_coefficients(p)
+
+    w = 1 if weighting is None else np.asarray(weighting, dtype=float)
+    grid_maximum = investment_maximum(investment_bounds, 'grid')
+    storage_maximum = investment_maximum(investment_bounds, 'storage')
+
     logging.info('Constructing GridCon energy system structure')
-    
+
 ##################################################################################
 # CREATION OF BUSES REPRESENTING ENERGY DISTRIBUTION
 ##################################################################################
-    
+
     b_el_mv = solph.Bus(label="b_el_mv")
 
     # creates medium voltage electric grid
@@ -234,333 +397,866 @@ def optimise_storage_size(filename="GridCon1_Profile.csv",
     b_el_lv = solph.Bus(label="b_el_lv")
 
     # creates low voltage electric grid
-    
+
 ##################################################################################
 # CREATION OF SOURCE OBJECTS
 ##################################################################################
-    
-    solph.Source(label='mv_source', outputs={b_el_mv: solph.Flow()})    
+
+    solph.Source(label='mv_source', outputs={b_el_mv: solph.Flow()})
 
     # represents aggregated electric generators at a far point in the up-stream
     # grid; here, no limit is considered for this source;
-    
-    solph.Source(label='el_lv_7_pv', outputs={b_el_lv: 
-        solph.Flow(actual_value=data['pv'], nominal_value = 1, fixed=True)}) 
-
-    # represents aggregated pv power plants in investigated area which are looked
-    # at as a single source of energy;
-    # "outputs={b_el_lv: ...}" defines that this source is connected to the 
-    # low voltage grid;
-    # "solph.Flow ..." defines properties of this connection: actual_value get 
-    # the pv generation data for all time intervals from csv-file;
-    # "nominal_value = 1" signifies that pv generation data do not need further 
-    # processing, they are already absolute figures in kW;
-    # "fixed=True" signifies that these data are not modified by the solver;
-    
+
+    if not collapse_fixed_flows:
+        solph.Source(label='el_lv_7_pv', outputs={b_el_lv:
+            solph.Flow(actual_value=data['pv'], nominal_value = 1, fixed=True)})
+
+        # represents aggregated pv power plants in investigated area which are looked
+        # at as a single source of energy;
+        # "outputs={b_el_lv: ...}" defines that this source is connected to the
+        # low voltage grid;
+        # "solph.Flow ..." defines properties of this connection: actual_value get
+        # the pv generation data for all time intervals from csv-file;
+        # "nominal_value = 1" signifies that pv generation data do not need further
+        # processing, they are already absolute figures in kW;
+        # "fixed=True" signifies that these data are not modified by the solver;
+
     solph.Source(label='el_lv_6_grid_excess', outputs={b_el_lv: solph.Flow(
-            variable_costs = 100000000)})   
+            variable_costs = variable_costs[
+            'el_lv_6_grid_excess', 'b_el_lv'] * w)})
 
-    # dummy producer of electric energy connected to low voltage grid; 
+    # dummy producer of electric energy connected to low voltage grid;
     # introduced to ensure energy balance in case no other solution is found;
     # extremely high variable costs ensure that source is normally not used;
-    
+
 ##################################################################################
 # CREATION OF SINK OBJECTS
-##################################################################################    
+##################################################################################
 
     solph.Sink(label='el_mv_sink', inputs={b_el_mv: solph.Flow()})
 
     # represents aggregated consumers at a far point in the up-stream grid;
     # here, it is assumed that no limit exists for this sink;
-    
-    solph.Sink(label='el_lv_2_base_load', inputs={b_el_lv: 
-        solph.Flow(actual_value=data['demand_el'], nominal_value= 1, fixed=True)})
-
-    # represents base load in low voltage (lv) electric grid;
-    # "inputs={b_el_lv: ...}" defines that this sink is connected to the
-    # low-voltage electric grid;
-    # "solph.Flow ..." defines properties of this connection: actual_value 
-    # gets the base load data for all time intervals from csv-file;
-    # "nominal_value = 1" signifies that base load data do not need further
-    # processing, they are already absolute figures in kW;
-    # "fixed=True" signifies that these data are not modified by the solver;
-
-    solph.Sink(label='el_lv_3_machine_load', inputs={b_el_lv: 
-        solph.Flow(actual_value=data['machine_load'], 
-                   nominal_value= 1, fixed=True)})    
-
-    # represents electrified agricultural machine connected to lv-grid;
-    # "inputs={b_el_lv: ...}" defines that this sink is connected to the
-    # low voltage electric grid;
-    # "solph.Flow ..." defines properties of this connection: actual_value 
-    # gets the electrified agricultural machine load data for all time 
-    # intervals from csv-file;
-    # "nominal_value = 1" signifies that base load data do not need further 
-    # processing, they are already absolute figures in kW;
-    # "fixed=True" signifies that these data are not modified by the solver;
-
-    cost_electricity_losses = 6.5E-2
 
-    # (unit) cost that a farmer or equivalent investor in grid extension and/or 
+    if not collapse_fixed_flows:
+        solph.Sink(label='el_lv_2_base_load', inputs={b_el_lv:
+            solph.Flow(actual_value=data['demand_el'], nominal_value= 1,
+                       fixed=True)})
+
+        # represents base load in low voltage (lv) electric grid;
+        # "inputs={b_el_lv: ...}" defines that this sink is connected to the
+        # low-voltage electric grid;
+        # "solph.Flow ..." defines properties of this connection: actual_value
+        # gets the base load data for all time intervals from csv-file;
+        # "nominal_value = 1" signifies that base load data do not need further
+        # processing, they are already absolute figures in kW;
+        # "fixed=True" signifies that these data are not modified by the solver;
+
+        solph.Sink(label='el_lv_3_machine_load', inputs={b_el_lv:
+            solph.Flow(actual_value=data['machine_load'],
+                       nominal_value= 1, fixed=True)})
+
+        # represents electrified agricultural machine connected to lv-grid;
+        # "inputs={b_el_lv: ...}" defines that this sink is connected to the
+        # low voltage electric grid;
+        # "solph.Flow ..." defines properties of this connection: actual_value
+        # gets the electrified agricultural machine load data for all time
+        # intervals from csv-file;
+        # "nominal_value = 1" signifies that base load data do not need further
+        # processing, they are already absolute figures in kW;
+        # "fixed=True" signifies that these data are not modified by the solver;
+
+    cost_electricity_losses = p['cost_electricity_losses']
+
+    # (unit) cost that a farmer or equivalent investor in grid extension and/or
     # electric energy storage pays for 1 kWh of electric energy which is lost;
-    # the value of 0.065 €/kWh corresponds to assumed average cost of electricity 
-    # in a future energy system with predominant generation from PV and wind
-    # power plants;
-            
-    curtailment = solph.Sink(label='el_lv_4_excess_sink', inputs={b_el_lv: 
-        solph.Flow(variable_costs = cost_electricity_losses)})
+    # the default value of 0.065 €/kWh corresponds to assumed average cost of
+    # electricity in a future energy system with predominant generation from PV
+    # and wind power plants;
+
+    solph.Sink(label='el_lv_4_excess_sink', inputs={b_el_lv:
+        solph.Flow(variable_costs = variable_costs[
+            'b_el_lv', 'el_lv_4_excess_sink'] * w)})
 
     # represents curtailment of electric energy from PV plants, i.e. that part
     # of possible PV electricity generation which is actually not generated by
     # tuning the PV power electronics such that the output is reduced below the
     # instantaneous maximum power;
-    # "inputs={b_el_lv: ...}" defines that this "sink" is connected to the 
+    # "inputs={b_el_lv: ...}" defines that this "sink" is connected to the
     # low voltage electric grid;
     # "solph.Flow ..." defines properties of this connection: variable_costs
     # are set at costs of electricity which is lost;
-          
+
 ##################################################################################
 # CREATION OF TRANSFORMER OBJECTS
-##################################################################################     
+##################################################################################
 
 # as a consequence of oemof allowing to handle only positive flow values,the local
 # mv-lv transformer needs to be modelled by two different objects, one for the
-# electric power flow from the local lv-grid to a far point in the up-stream grid, 
+# electric power flow from the local lv-grid to a far point in the up-stream grid,
 # one for the inverse flow from that far point to the local grid;
 # each (!) of the two objects represents, for the respective power flow direction,
-# not only the local mv-lv transformer, but the whole grid infrastructure between 
-# a virtuel power supplier/ sink at a far point in the up-stream grid and the 
+# not only the local mv-lv transformer, but the whole grid infrastructure between
+# a virtuel power supplier/ sink at a far point in the up-stream grid and the
 # local lv-grid, including all grid lines and voltage transformation steps;
 
-    grid_loss_rate = 0.0685
-    
+    grid_loss_rate = p['grid_loss_rate']
+
     # rate of losses within the entire up-stream grid including the local
     # transformer;
-    # the value of 6.85% reflects average grid losses in Germany from January 
-    # to September 2017;
+    # the default value of 6.85% reflects average grid losses in Germany from
+    # January to September 2017;
     # source: https://www.destatis.de/DE/ZahlenFakten/Wirtschaftsbereiche/
-    # Energie/Erzeugung/Tabellen/BilanzElektrizitaetsversorgung.html 
+    # Energie/Erzeugung/Tabellen/BilanzElektrizitaetsversorgung.html
     # [last retrieved on 16 November 2017];
-    
+
     grid_eff = 1 - grid_loss_rate
-    
+
     # effective efficiency of power transmission in the up-stream grid;
-     
-    transformer_mv_to_lv = solph.LinearTransformer(label="transformer_mv_to_lv", 
-            inputs={b_el_mv: solph.Flow(variable_costs = 
-                        (grid_loss_rate * cost_electricity_losses))}, 
+
+    solph.LinearTransformer(label="transformer_mv_to_lv",
+            inputs={b_el_mv: solph.Flow(variable_costs = variable_costs[
+                        'b_el_mv', 'transformer_mv_to_lv'] * w)},
             outputs={b_el_lv: solph.Flow(investment=solph.Investment
-                                                    (ep_costs=0.5 * sepc_grid))}, 
-            conversion_factors={b_el_lv: grid_eff})              
+                    (ep_costs=ep_costs['transformer_mv_to_lv', 'b_el_lv'],
+                     maximum=grid_maximum))},
+            conversion_factors={b_el_lv: grid_eff})
 
     # represents the "supplying half" of the whole up-stream grid including the
     # "mv-to-lv electric transformer", i.e. that "half" of the
-    # physical local transformer linking the low and medium voltage grid 
+    # physical local transformer linking the low and medium voltage grid
     # "in the direction mv -> lv";
-    # "input" designates source bus of electricity, here: medium-voltage grid; 
+    # "input" designates source bus of electricity, here: medium-voltage grid;
     # variable costs are cost of electricity lost within one time interval in
     # the up-stream grid and transformer; they are a fraction of the electricity
-    # generated at a far point in the up-stream grid times the cost of 
+    # generated at a far point in the up-stream grid times the cost of
     # electricity which gets lost;
     # "output" designates destination bus of electricity, here: low-voltage grid;
     # fixed grid costs (epc), i.e. costs of "supplying half" of local transformer
-    # and up-stream grid are attributed to output, because it is the lv-side 
+    # and up-stream grid are attributed to output, because it is the lv-side
     # whose size has to be determined in the optimisation process;
     # the conversion factor defines the ratio between the output flow, here the
-    # electricity flowing from the local transformer into the low-voltage grid, 
-    # and the input flow, here the electricity injected into the up-stream grid 
+    # electricity flowing from the local transformer into the low-voltage grid,
+    # and the input flow, here the electricity injected into the up-stream grid
     # at a far point;
-                
-    transformer_lv_to_mv = solph.LinearTransformer(label="transformer_lv_to_mv",
-                            inputs={b_el_lv: solph.Flow(investment = 
-                                solph.Investment(ep_costs = 0.5 * sepc_grid))}, 
-                            outputs={b_el_mv: solph.Flow(variable_costs = 
-                        (cost_electricity_losses*grid_loss_rate/grid_eff))}, 
+
+    solph.LinearTransformer(label="transformer_lv_to_mv",
+                            inputs={b_el_lv: solph.Flow(investment =
+                                solph.Investment(ep_costs = ep_costs[
+                                'b_el_lv', 'transformer_lv_to_mv'],
+                                maximum = grid_maximum))},
+                            outputs={b_el_mv: solph.Flow(variable_costs =
+                        variable_costs['transformer_lv_to_mv', 'b_el_mv'] * w)},
                         conversion_factors = {b_el_mv: grid_eff})
-             
+
     # represents the "collecting half" of the whole up-stream grid including the
     # local "lv-to-mv electric transformer", i.e. that "half" of the
-    # physical local transformer linking the low and medium voltage grid 
+    # physical local transformer linking the low and medium voltage grid
     # "in the direction lv -> mv";
     # "input" designates source bus of electricity, here: low-voltage grid;
-    # fixed grid costs (epc), i.e. the epc of the "collecting half" of local 
-    # transformer and up-stream grid are attributed to input, because it is 
+    # fixed grid costs (epc), i.e. the epc of the "collecting half" of local
+    # transformer and up-stream grid are attributed to input, because it is
     # the lv-side whose size needs to match the rest of the modelled system;
-    # "output" designates the destination bus of electricity, 
+    # "output" designates the destination bus of electricity,
     # here: medium-voltage grid;
     # variable costs are cost of electricity lost within one time interval in
     # the transformer and up-stream grid; they are a fraction of the electricity
-    # generated in the modelled system and fed into the up-stream grid times the 
+    # generated in the modelled system and fed into the up-stream grid times the
     # cost of electricity which gets lost;
-    # the conversion factor defines the ratio between the output flow, here the 
+    # the conversion factor defines the ratio between the output flow, here the
     # electric power flow consumed at a far point in the up-stream grid, and the
-    # input flow, here the electricity flowing from the low-voltage grid into the 
-    # transformer; 
+    # input flow, here the electricity flowing from the low-voltage grid into the
+    # transformer;
 
 ##################################################################################
 # CREATION OF STORAGE OBJECTS
-##################################################################################       
-   
-    icf = 0.95
+##################################################################################
 
-    ocf = 0.95
+    icf = p['icf']
+
+    ocf = p['ocf']
 
     # charging (icf) and discharging efficiency of the electric energy storage;
-    # the values reflect the efficiency of a lithium-ion battery with typical 
-    # input, respectively output electronic converters;
+    # the default values of 0.95 reflect the efficiency of a lithium-ion battery
+    # with typical input, respectively output electronic converters;
 
     el_storage_conversion_factor = icf * ocf
 
     # approximate term for effective efficiency of electric energy storage system
     # used for calculating the costs of electricity lost in the electric energy
-    # storage system; for this purpose, and only for this purpose, self-discharge 
-    # losses are neglected;    
+    # storage system; for this purpose, and only for this purpose, self-discharge
+    # losses are neglected;
 
     solph.Storage(label='el_lv_1_storage',
-            inputs={b_el_lv: solph.Flow(variable_costs = cost_electricity_losses
-            *(1-el_storage_conversion_factor))}, outputs={b_el_lv: solph.Flow()},
-            capacity_min = 0.1, capacity_max = 0.9,
+            inputs={b_el_lv: solph.Flow(variable_costs = variable_costs[
+            'b_el_lv', 'el_lv_1_storage'] * w)}, outputs={b_el_lv: solph.Flow()},
+            capacity_min = p['capacity_min'], capacity_max = p['capacity_max'],
             nominal_input_capacity_ratio = 1,
             nominal_output_capacity_ratio = 1,
-            inflow_conversion_factor = icf, outflow_conversion_factor = ocf, 
-            capacity_loss = 0.0000025,
-            investment=solph.Investment(ep_costs = sepc_el_lv_1_storage))  
+            inflow_conversion_factor = icf, outflow_conversion_factor = ocf,
+            capacity_loss = capacity_loss_per_timestep(p, time_step),
+            investment=solph.Investment(ep_costs = ep_costs['el_lv_1_storage'],
+                                        maximum = storage_maximum))
 
     # represents electric energy storage (input and output are electricity)
-    # "input" designates source of electricity charging the storage, here the 
-    # low voltage electricity grid, "output" the same for sink of electricity 
+    # "input" designates source of electricity charging the storage, here the
+    # low voltage electricity grid, "output" the same for sink of electricity
     # discharged from the storage;
     # "capacity_min" and "capacity_max" designate, respectively, the minimum and
-    # maximum state of charge of the storage, related to its maximum energy 
+    # maximum state of charge of the storage, related to its maximum energy
     # content;
-    # values are typical for operation of lithium-ion batteries in practical 
-    # applications;
-    # "inflow_conversion_factor" and "outflow_conversion_factor" designate, 
+    # default values (0.1 and 0.9) are typical for operation of lithium-ion
+    # batteries in practical applications;
+    # "inflow_conversion_factor" and "outflow_conversion_factor" designate,
     # respectively, the efficiency of the charging and discharging process;
-    # "capacity_loss" reflects the self-discharge of the storage per timestep as 
+    # "capacity_loss" reflects the self-discharge of the storage per timestep as
     # a fraction of the energy contained in the storage in the preceding timestep;
-    # the value 0.0000025 (0.00025%) corresponds to the self-discharge within 
-    # 15 minutes, respectively 0.024% per day; that is in the midth of the 
+    # the default value 0.0000025 (0.00025%) corresponds to the self-discharge
+    # within 15 minutes, respectively 0.024% per day; that is in the midth of the
     # typical range of 0,008-0,041% per day for lithium-ion batteries
     # source: Sterner/Stadler, Energiespeicher, p. 600;
-     
+
+    return energysystem
+
+def capacity_loss_per_timestep(parameters, time_step=0.25):
+
+    # returns the self-discharge of the storage per timestep of "time_step"
+    # hours; the parameter "capacity_loss" is given per 15 minutes;
+
+    if time_step == 0.25:
+        return parameters['capacity_loss']
+    return 1 - (1 - parameters['capacity_loss']) ** (time_step / 0.25)
+
+def investment_maximum(investment_bounds, name):
+
+    # returns the upper bound of investment "name" ("grid" or "storage") from
+    # a dictionary {name: (lower bound, upper bound)}, e.g. as returned by
+    # GridCon_presizing.investment_bounds; missing bounds are infinite;
+
+    if investment_bounds is None or name not in investment_bounds:
+        return float('+inf')
+    upper = investment_bounds[name][1]
+    return float('+inf') if upper is None else upper
+
 ##################################################################################
 # OPTIMISATION OF THE ENERGY SYSTEM
 ##################################################################################
 
+def create_model(energysystem, investment_bounds=None):
+
+    # returns the operational model of the energy system including the
+    # additional constraint linking both halves of the grid connection;
+    # the lower bounds in "investment_bounds" (see investment_maximum) are
+    # set on the investment variables, the upper bounds are already part of
+    # the energy system;
+
     logging.info('Optimise the energysystem')
 
+    b_el_lv = energysystem.groups['b_el_lv']
+    transformer_mv_to_lv = energysystem.groups['transformer_mv_to_lv']
+    transformer_lv_to_mv = energysystem.groups['transformer_lv_to_mv']
+
 # initialise the operational model
 
     om = solph.OperationalModel(energysystem)
-        
+
 # adding constraint
 
     my_block = environ.Block()
 
-    def connect_invest_rule(m):        
+    def connect_invest_rule(m):
         expr = (om.InvestmentFlow.invest[b_el_lv, transformer_lv_to_mv] ==
                 om.InvestmentFlow.invest[transformer_mv_to_lv, b_el_lv])
         return expr
-    
+
     my_block.invest_connect_constr = environ.Constraint(
             rule=connect_invest_rule)
     om.add_component('ConnectInvest', my_block)
 
-    # defines that upper limit for energy flow from electric transformer to 
-    # medium voltage grid equals upper limit for energy flow from transformer 
+    # defines that upper limit for energy flow from electric transformer to
+    # medium voltage grid equals upper limit for energy flow from transformer
     # to low voltage;
-    # the fact that the maximum is addressed instead of the value in a specific 
+    # the fact that the maximum is addressed instead of the value in a specific
     # timestep is reflected by the string ".invest" in the name of the objects;
-        
+
+    if energysystem.fixed_flows:
+        add_net_injection(om, energysystem)
+
+    if investment_bounds is not None:
+        storage = energysystem.groups['el_lv_1_storage']
+        invest_vars = {
+            'grid': [om.InvestmentFlow.invest[b_el_lv, transformer_lv_to_mv],
+                     om.InvestmentFlow.invest[transformer_mv_to_lv, b_el_lv]],
+            'storage': [om.InvestmentStorage.invest[storage]],
+            }
+        for name, (lower, upper) in investment_bounds.items():
+            if lower is not None:
+                for var in invest_vars[name]:
+                    var.setlb(lower)
+
+    return om
+
+
+def add_net_injection(om, energysystem):
+
+    # adds the sum of the collapsed fixed flows (see create_energysystem) to
+    # the balance of the low voltage grid: PV generation minus base load and
+    # machine load is injected into the grid in each timestep;
+    # the net injection is a mutable parameter, so that it can be changed
+    # without rebuilding the model;
+    # fixed flows whose components exist (e.g. after restore_fixed_flows) are
+    # already part of the balance and are skipped;
+
+    b_el_lv = energysystem.groups['b_el_lv']
+    net_injection = np.zeros(len(om.TIMESTEPS))
+    for (source, target), values in energysystem.fixed_flows.items():
+        component = target if source == 'b_el_lv' else source
+        if component in energysystem.groups:
+            continue
+        net_injection += -values if source == 'b_el_lv' else values
+
+    block = environ.Block()
+    block.net_injection = environ.Param(
+        om.TIMESTEPS, mutable=True,
+        initialize=dict(enumerate(net_injection.tolist())))
+    om.add_component('NetInjection', block)
+
+    # oemof writes the balance as inflows - outflows == 0; the net injection
+    # is an inflow and moves to the right-hand side;
+
+    for t in om.TIMESTEPS:
+        balance = om.Bus.balance[b_el_lv, t]
+        balance.set_value((balance.body, -block.net_injection[t]
+                           * om.timeincrement[t]))
+    return block
+
+
+def restore_fixed_flows(energysystem):
+
+    # adds the components of the collapsed fixed flows to the energy system
+    # and their flows to its results, so that the results have the same
+    # structure as without collapse_fixed_flows (e.g. for create_csv);
+    # the components are created after the model, hence they do not enter it;
+
+    results = energysystem.results
+    b_el_lv = energysystem.groups['b_el_lv']
+    registry = network.Node.registry
+    network.Node.registry = energysystem
+    try:
+        for (source, target), values in energysystem.fixed_flows.items():
+            flow = solph.Flow(actual_value=values, nominal_value=1, fixed=True)
+            if source == 'b_el_lv':
+                component = energysystem.groups.get(target) or solph.Sink(
+                    label=target, inputs={b_el_lv: flow})
+                results[b_el_lv][component] = UserList(values.tolist())
+            else:
+                component = energysystem.groups.get(source) or solph.Source(
+                    label=source, outputs={b_el_lv: flow})
+                results[component] = results.get(component, UserDict())
+                results[component][b_el_lv] = UserList(values.tolist())
+    finally:
+        network.Node.registry = registry
+
+
+def set_initial_storage_level(om, energysystem, parameters, level):
+
+    # replaces the cyclic storage balance of the first timestep (oemof links it
+    # to the last timestep) by a balance starting from the given storage level
+    # in kWh, e.g. the level at the end of a preceding time window;
+
+    storage = energysystem.groups['el_lv_1_storage']
+    b_el_lv = energysystem.groups['b_el_lv']
+    capacity = om.InvestmentStorage.capacity
+    time_step = energysystem.timeindex.freq.nanos / 3.6e12
+    t = 0
+
+    om.InvestmentStorage.balance[storage, t].deactivate()
+
+    block = environ.Block()
+    block.initial_level = environ.Constraint(
+        expr=(capacity[storage, t] == level
+              * (1 - capacity_loss_per_timestep(parameters, time_step))
+              + om.flow[b_el_lv, storage, t] * parameters['icf'] * time_step
+              - om.flow[storage, b_el_lv, t] / parameters['ocf'] * time_step))
+    om.add_component('InitialStorageLevel', block)
+    return block
+
+
+def solve_model(om, solver='cbc', debug=True, tee_switch=True,
+                solver_threads=None, cmdline_options=None, warmstart=False,
+                logfile=None, report=None, duals=False, cmdline_flags=None):
+
+    # "cmdline_options" are passed to the solver in addition to the number of
+    # threads; "cmdline_flags" are options without value, e.g. ["interior"]
+    # for the interior point method of glpk; if warmstart is true and the
+    # solver interface supports it, the current values of the variables are
+    # passed to the solver as a starting point; if "logfile" is given, the
+    # solver output is written to it;
+    # writing the lp-file and solving are recorded as phases of "report" (see
+    # GridCon_instrumentation.RunReport);
+    # if duals is true, the duals of the constraints and the reduced costs of
+    # the variables are imported into om.dual and om.rc (see
+    # GridCon_sensitivity.marginal_values);
+
 # if debug is true an lp-file will be written
 
     if debug:
         filename = os.path.join(
             helpers.extend_basic_path('lp_files'), 'GridCon.lp')
         logging.info('Store lp-file in {0}.'.format(filename))
-        om.write(filename, io_options={'symbolic_solver_labels': True})
+        with phase(report, 'write_lp'):
+            om.write(filename, io_options={'symbolic_solver_labels': True})
+
+# if solver_threads is set, the number of threads used by the solver is limited
+# (only for THREADED_SOLVERS, the others run single threaded anyway); flags are
+# passed with the value None, which pyomo writes as option without value;
+
+    cmdline_options = dict(cmdline_options or {})
+    if solver_threads is not None and solver in THREADED_SOLVERS:
+        cmdline_options['threads'] = solver_threads
+    for flag in cmdline_flags or ():
+        cmdline_options[flag] = None
 
 # if tee_switch is true solver messages will be displayed
 
+    solve_kwargs = {'tee': tee_switch}
+    if warmstart and SolverFactory(solver).warm_start_capable():
+        solve_kwargs['warmstart'] = True
+    if logfile is not None:
+        solve_kwargs['logfile'] = logfile
+
+    if duals and not hasattr(om, 'dual'):
+        om.receive_duals()
+
     logging.info('Solve the optimisation problem')
-    om.solve(solver=solver, solve_kwargs={'tee': tee_switch})
-    
+    with phase(report, 'solve'):
+        results = om.solve(solver=solver, solve_kwargs=solve_kwargs,
+                           cmdline_options=cmdline_options)
+    if om.es.fixed_flows:
+        with phase(report, 'results'):
+            restore_fixed_flows(om.es)
+    if report is not None:
+        report.model_statistics(om, results)
+    return results
+
+
+def solver_iterations(results, logfile=None):
+
+    # returns the number of simplex/barrier iterations reported by the solver
+    # or None if they are not reported;
+    # the statistics of the results are used if the solver interface fills
+    # them, otherwise the solver output in "logfile" is searched for a line
+    # like "Optimal objective 15644.78 - 2920 iterations" (cbc) or
+    # "Simplex iterations: 2920";
+
+    for path in (('solver', 'statistics', 'black_box', 'number_of_iterations'),
+                 ('solver', 'statistics', 'branch_and_bound',
+                  'number_of_iterations')):
+        value = results
+        try:
+            for attribute in path:
+                value = getattr(value, attribute)
+            value = getattr(value, 'value', value)
+            return int(value)
+        except (AttributeError, TypeError, ValueError):
+            continue
+
+    if logfile is None or not os.path.exists(logfile):
+        return None
+    with open(logfile) as f:
+        log = f.read()
+    found = (re.findall(r'(\d+) iterations', log)
+             or re.findall(r'[Ii]terations:?\s+(\d+)', log))
+    return int(found[-1]) if found else None
+
+##################################################################################
+# EVALUATION OF RESULTS
+##################################################################################
+
+class GridConResults(object):
+
+    """
+    flows, storage level and investments of a solved GridCon model as numpy
+    arrays, together with the cost breakdown
+
+    parameters
+    ----------
+    timeindex : pandas.DatetimeIndex
+    flows : dict
+        flow values in kW per timestep, keyed by (source label, target label)
+        as in FLOWS
+    storage_level : numpy.ndarray
+        energy content of the storage in kWh per timestep
+    investments : dict
+        "grid_collection_capacity", "grid_supply_capacity" and
+        "storage_capacity"
+    objective : float
+        value of the objective function
+    summary : dict
+        cost breakdown as returned by summarise_results, None if not computed
+
+    """
+
+    def __init__(self, timeindex, flows, storage_level, investments,
+                 objective, summary=None):
+
+        self.timeindex = timeindex
+        self.flows = flows
+        self.storage_level = storage_level
+        self.investments = investments
+        self.objective = objective
+        self.summary = summary
+
+    def to_frame(self, bus_label=None):
+
+        """
+        flows and storage level as pandas.DataFrame
+
+        parameters
+        ----------
+        bus_label : str
+            if given, only the flows into and out of this bus (and the
+            storage level, if the storage is connected to it) are included
+
+        returns
+        -------
+        pandas.DataFrame
+            one column per flow, named "<source>_<target>", and the column
+            "el_lv_1_storage" for the storage level, indexed by timeindex
+
+        """
+
+        columns = {'_'.join(key): values for key, values in self.flows.items()
+                   if bus_label is None or bus_label in key}
+        if bus_label in (None, 'b_el_lv'):
+            columns['el_lv_1_storage'] = self.storage_level
+        order = ['_'.join(key) for key in FLOWS] + ['el_lv_1_storage']
+        return pd.DataFrame(columns, index=self.timeindex,
+                            columns=[c for c in order if c in columns])
+
+    def bus_balance(self, bus_label='b_el_lv'):
+
+        """
+        flows of a bus in the layout of outputlib.ResultsDataFrame
+
+        parameters
+        ----------
+        bus_label : str
+
+        returns
+        -------
+        pandas.DataFrame
+            as slice_bus_balance of outputlib: the flows out of the bus named
+            by their target, the storage level (if the storage is connected
+            to the bus) and the flows into the bus named by their source,
+            each group sorted by label, indexed by "datetime"
+
+        """
+
+        outputs = sorted((key[1], values) for key, values in self.flows.items()
+                         if key[0] == bus_label)
+        others = ([('el_lv_1_storage', self.storage_level)]
+                  if bus_label == 'b_el_lv' else [])
+        inputs = sorted((key[0], values) for key, values in self.flows.items()
+                        if key[1] == bus_label)
+        columns = outputs + others + inputs
+        frame = pd.DataFrame(np.column_stack([c[1] for c in columns]),
+                             index=self.timeindex)
+        frame.columns = [c[0] for c in columns]
+        frame.index.name = 'datetime'
+        return frame
+
+    def write(self, filename, file_format='npz', bus_label=None):
+
+        """
+        writes the flows and the storage level to a file
+
+        parameters
+        ----------
+        filename : str
+            name of the file without extension
+        file_format : str
+            "npz" (compressed numpy archive, one array per column plus
+            "timeindex" in nanoseconds since 1970), "parquet" (requires
+            pyarrow or fastparquet) or "csv"
+        bus_label : str
+            see to_frame
+
+        returns
+        -------
+        str
+            name of the written file
+
+        """
+
+        frame = self.to_frame(bus_label)
+        filename = '{0}.{1}'.format(filename, file_format)
+        if file_format == 'npz':
+            arrays = {column: frame[column].values for column in frame}
+            arrays['timeindex'] = self.timeindex.asi8
+            np.savez_compressed(filename, **arrays)
+        elif file_format == 'parquet':
+            frame.to_parquet(filename, compression='snappy')
+        elif file_format == 'csv':
+            frame.to_csv(filename)
+        else:
+            raise ValueError('Unknown file format {0}'.format(file_format))
+        return filename
+
+
+def extract_results(energysystem, parameters=None, weighting=None):
+
+    # collects the flows, the storage level and the investments of a solved
+    # energy system (energysystem.results) in numpy arrays and, if the
+    # parameters are given, computes the cost breakdown from them with
+    # vector operations; returns a GridConResults object;
+    # "weighting" has to be the same as passed to create_energysystem;
+
+    results = energysystem.results
+    groups = energysystem.groups
+    storage = groups['el_lv_1_storage']
+    flows = {key: np.asarray(results[groups[key[0]]][groups[key[1]]],
+                             dtype=float) for key in FLOWS}
+    investments = {
+        'grid_collection_capacity':
+            results[groups['b_el_lv']][groups['transformer_lv_to_mv']].invest,
+        'grid_supply_capacity':
+            results[groups['transformer_mv_to_lv']][groups['b_el_lv']].invest,
+        'storage_capacity': results[storage][storage].invest,
+        }
+    extracted = GridConResults(energysystem.timeindex, flows,
+                               np.asarray(results[storage][storage],
+                                          dtype=float),
+                               investments, results.objective)
+    if parameters is not None:
+        extracted.summary = cost_summary(extracted, parameters, weighting)
+    return extracted
+
+
+def cost_summary(extracted, parameters, weighting=None):
+
+    # returns the cost breakdown of the flows and investments of a
+    # GridConResults object with vector operations (see extract_results);
+    # it does not depend on how the model was built and solved, e.g. it is
+    # also used for the results of GridCon_sparse;
+
+    p = parameters
+    flows = extracted.flows
+    investments = extracted.investments
+    costs = specific_costs(p)
+    ep_costs, variable_costs = cost_coefficients(p)
+
+    time_step = extracted.timeindex.freq.nanos / 3.6e12
+
+    # the duration of a timestep in hours, i.e. 0.25 for 15 minutes;
+
+    w = 1 if weighting is None else np.asarray(weighting, dtype=float)
+
+    # energy of each flow in kWh over all timesteps, each timestep counted as
+    # often as given by the weighting;
+
+    keys = list(FLOWS)
+    energy = dict(zip(keys, np.sum(np.vstack([flows[key] for key in keys])
+                                   * w, axis=1) * time_step))
+
+    cost_electricity_losses = p['cost_electricity_losses']
+    grid_loss_rate = p['grid_loss_rate']
+    el_storage_conversion_factor = p['icf'] * p['ocf']
+
+    fixed_grid_costs = (
+        ep_costs['transformer_mv_to_lv', 'b_el_lv']
+        * investments['grid_supply_capacity']
+        + ep_costs['b_el_lv', 'transformer_lv_to_mv']
+        * investments['grid_collection_capacity'])
+    fixed_storage_costs = (ep_costs['el_lv_1_storage']
+                           * investments['storage_capacity'])
+    total_variable_costs = sum(cost * energy[key]
+                               for key, cost in variable_costs.items())
+
+    summary = dict(investments)
+    summary.update({
+        'kN': costs['sepc_grid'],
+        'kS': costs['kS_el'],
+        'prl_income': costs['prl_income'],
+        'kS_netto': costs['kS_el_netto'],
+        'fixed_grid_costs': fixed_grid_costs,
+        'fixed_storage_costs': fixed_storage_costs,
+        'total_fixed_costs': fixed_grid_costs + fixed_storage_costs,
+        'grid_loss_costs':
+            (energy['b_el_mv', 'transformer_mv_to_lv']
+             + energy['b_el_lv', 'transformer_lv_to_mv'])
+            * cost_electricity_losses * grid_loss_rate,
+        'storage_loss_costs':
+            energy['b_el_lv', 'el_lv_1_storage'] * cost_electricity_losses
+            * (1 - el_storage_conversion_factor),
+        'curtailment_costs':
+            energy['b_el_lv', 'el_lv_4_excess_sink'] * cost_electricity_losses,
+        'total_variable_costs': total_variable_costs,
+        'total_annual_costs':
+            fixed_grid_costs + fixed_storage_costs + total_variable_costs,
+        'objective': extracted.objective,
+        })
+    return summary
+
+
+def summarise_results(energysystem, parameters, weighting=None):
+
+    # returns the sized capacities and the cost breakdown of a solved model as
+    # a dictionary (see extract_results);
+
+    return extract_results(energysystem, parameters, weighting).summary
+
+
+def print_results(summary):
+
 # Visualisation of results
 
-    el_lv_1_storage = energysystem.groups['el_lv_1_storage']
-    
-    print(' ') 
+    s = summary
+
+    print(' ')
     print('CAPACITY OF GRID CONNECTION')
     print('####################################################')
     print(' ')
-    print('Grid collection capacity:  ', energysystem.results
-                              [ b_el_lv][transformer_lv_to_mv].invest, 'kW')
-    print('Grid supply capacity:      ', energysystem.results
-                              [ transformer_mv_to_lv][b_el_lv].invest, 'kW')
-    print(' kN:                       ', sepc_grid, '€/kW')
+    print('Grid collection capacity:  ', s['grid_collection_capacity'], 'kW')
+    print('Grid supply capacity:      ', s['grid_supply_capacity'], 'kW')
+    print(' kN:                       ', s['kN'], '€/kW')
     print(' ')
     print('CAPACITY OF ELECTRIC ENERGY STORAGE')
     print('####################################################')
     print(' ')
-    print('Storage capacity:          ', energysystem.results
-                            [el_lv_1_storage][el_lv_1_storage].invest, 'kWh')
-    print(' kS:                       ', kS_el,  '€/kWh')
-    print(' PRL income:               ', prl_income,   '€/kWh')
-    print(' kS_netto:                 ', kS_el_netto,  '€/kWh')
+    print('Storage capacity:          ', s['storage_capacity'], 'kWh')
+    print(' kS:                       ', s['kS'],  '€/kWh')
+    print(' PRL income:               ', s['prl_income'],   '€/kWh')
+    print(' kS_netto:                 ', s['kS_netto'],  '€/kWh')
     print(' ')
     print('COST BREAKDOWN')
     print('####################################################')
     print(' ')
-    print('Fixed grid costs:          ', om.InvestmentFlow.investment_costs(),'€')
-    print('Fixed storage costs:       ', om.InvestmentStorage.investment_costs(), 
-                                                                             '€')
-    print('Total fixed costs:         ', om.InvestmentFlow.investment_costs() +
-                                    om.InvestmentStorage.investment_costs(), '€')
+    print('Fixed grid costs:          ', s['fixed_grid_costs'], '€')
+    print('Fixed storage costs:       ', s['fixed_storage_costs'], '€')
+    print('Total fixed costs:         ', s['total_fixed_costs'], '€')
     print(' ')
-    print('Costs of grid losses:      ', sum(energysystem.results[b_el_mv]
-                               [transformer_mv_to_lv]) * cost_electricity_losses 
-                            * grid_loss_rate * time_step 
-            + sum(energysystem.results[b_el_lv][transformer_lv_to_mv])
-                * cost_electricity_losses * grid_loss_rate * time_step,'€')
-    print('Costs of storage losses:   ', sum(energysystem.results[b_el_lv]
-                            [el_lv_1_storage]) * cost_electricity_losses * 
-                            (1-el_storage_conversion_factor) * time_step, '€')
-    print('Costs of curtailment:      ', sum(energysystem.results[b_el_lv]
-                    [curtailment]) * cost_electricity_losses * time_step, '€')
-    print('Total variable costs:      ',om.Flow.variable_costs(), '€')
-    print(' ') 
-    print('Total annual costs         ', om.InvestmentFlow.investment_costs()
-                    + om.InvestmentStorage.investment_costs()
-                    + om.Flow.variable_costs(), '€')
+    print('Costs of grid losses:      ', s['grid_loss_costs'], '€')
+    print('Costs of storage losses:   ', s['storage_loss_costs'], '€')
+    print('Costs of curtailment:      ', s['curtailment_costs'], '€')
+    print('Total variable costs:      ', s['total_variable_costs'], '€')
+    print(' ')
+    print('Total annual costs         ', s['total_annual_costs'], '€')
     print('--------------------------------------------------')
-    print('Objective function:        ', energysystem.results.objective, '€')
-    print('Accordance:                ', (om.InvestmentFlow.investment_costs()
-                    + om.InvestmentStorage.investment_costs() 
-                    + om.Flow.variable_costs())
-                        / energysystem.results.objective*100, '%')
+    print('Objective function:        ', s['objective'], '€')
+    print('Accordance:                ',
+          s['total_annual_costs'] / s['objective'] * 100, '%')
     print(' ')
     print('####################################################')
     print(' ')
     print(' ')
+
+##################################################################################
+# COMPLETE OPTIMISATION RUN
+##################################################################################
+
+# import load and generation data from csv-file and define timesteps
+
+def read_profile(filename="GridCon1_Profile.csv", number_timesteps=None,
+                 columns=None, cache=True):
+
+    # relative file names are resolved against the directory of this script;
+    # with "cache", the profile is read memory-mapped from the binary profile
+    # cache (see GridCon_profile.load_profile), which is created on the first
+    # read of a csv-file; only "columns" (default: all numeric columns) and
+    # the first "number_timesteps" timesteps (default: all) are read;
+
+    full_filename = os.path.join(os.path.dirname(__file__), filename)
+    if cache:
+        return GridCon_profile.load_profile(full_filename, columns,
+                                            number_timesteps)
+    return pd.read_csv(full_filename, sep=",", usecols=columns,
+                       nrows=number_timesteps)
+
+
+def optimise_storage_size(filename="GridCon1_Profile.csv",
+                          solver='cbc', debug=True, number_timesteps= (96*366),
+                          tee_switch=True, solver_threads=None,
+                          collapse_fixed_flows=True, report=None,
+                          **parameters):
+
+    # the file "GridCon1_Profile" contains the normalised profile for the
+    # agricultural base load profile L2, a synthetic electrified agricultural
+    # machine load profile, and the PV generation profile ES0;
+    # number_timesteps: one timestep has a duration of 15 minutes,
+    # hence, 96 is the number of timesteps per day;
+    # 366 is the number of days in a leap year, chosen here because
+    # standard load profils of 2016 are used;
+    # the total number of timesteps is therefore 96*366 = 35136;
+    # "collapse_fixed_flows" is passed to create_energysystem;
+    # if a RunReport is passed as "report", the time and memory of each phase
+    # of the run, the size of the model and the results are recorded in it;
+    # further keyword arguments override the default parameters, see
+    # DEFAULT_PARAMETERS;
+
+    p = merge_parameters(parameters)
+
+# read data file
+
+    with phase(report, 'read_profile'):
+        data = read_profile(filename, number_timesteps, list(PROFILE_COLUMNS))
+
+    with phase(report, 'energysystem'):
+        energysystem = create_energysystem(
+            data, p, number_timesteps,
+            collapse_fixed_flows=collapse_fixed_flows)
+    with phase(report, 'operational_model'):
+        om = create_model(energysystem)
+    solve_model(om, solver=solver, debug=debug, tee_switch=tee_switch,
+                solver_threads=solver_threads, report=report)
+    with phase(report, 'results'):
+        summary = extract_results(energysystem, p).summary
+    print_results(summary)
+    if report is not None:
+        report.results.update(summary)
     return energysystem
 
 ##################################################################################
-# GENERATION OF CSV-FILE 
+# GENERATION OF CSV-FILE
 ##################################################################################
 
-def create_csv(energysystem):
+def create_csv(energysystem, file_format='csv',
+               output_path='results_as_csv_LV_Net'):
+
+    # writes the flows into and out of the low voltage grid and the storage
+    # level to "<output_path>/b_el_lv.<file_format>"; the csv-file has the
+    # columns of outputlib's bus_balance_to_csv as before (see
+    # GridConResults.bus_balance), "npz" and "parquet" are compressed, much
+    # faster to write and read and have one column per flow, named
+    # "<source>_<target>" (see GridConResults.write);
+
+    if not os.path.isdir(output_path):
+        os.makedirs(output_path)
+    results = extract_results(energysystem)
+    filename = os.path.join(output_path, 'b_el_lv')
+    if file_format == 'csv':
+        filename += '.csv'
+        results.bus_balance('b_el_lv').to_csv(filename)
+        return filename
+    return results.write(filename, file_format, bus_label='b_el_lv')
+
+def run_GridCon_example(file_format='csv', report_file='GridCon_report.json',
+                        **kwargs):
+
+    # runs optimise_storage_size with the given keyword arguments, writes the
+    # results (see create_csv) if matplotlib is available, as before, and
+    # returns the RunReport of the run, which is also written to "report_file"
+    # as JSON unless it is None;
 
-    results = outputlib.ResultsDataFrame(energy_system=energysystem)    
-    results.bus_balance_to_csv(bus_labels=['b_el_lv'],
-                               output_path='results_as_csv_LV_Net')
-   
-def run_GridCon_example(**kwargs):
     logger.define_logging()
-    esys = optimise_storage_size(**kwargs)
-
+    report = GridCon_instrumentation.RunReport(**kwargs)
+    esys = optimise_storage_size(report=report, **kwargs)
     if plt is not None:
-        create_csv(esys)
-   
+        with phase(report, 'write_results'):
+            create_csv(esys, file_format)
+    if report_file is not None:
+        report.write(report_file)
+    return report
+
 if __name__ == "__main__":
     run_GridCon_example()
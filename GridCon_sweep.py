@@ -0,0 +1,331 @@
+# -*- coding: utf-8 -*-
+"""
+Module to run the GridCon optimisation for many parameter sets in parallel.
+
+Each parameter set is solved in a separate worker process; the sized
+capacities and the cost breakdown of all runs are collected in one
+pandas.DataFrame with one row per parameter set.
+"""
+
+##################################################################################
+# IMPORTS
+##################################################################################
+
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import itertools
+import logging
+import os
+
+import numpy as np
+import pandas as pd
+
+import GridCon_storage_171221d as gridcon
+from GridCon_cache import scenario_key
+from GridCon_model import COST_PARAMETERS, ReusableModel
+
+##################################################################################
+# DEFINITION OF PARAMETER SETS
+##################################################################################
+
+def parameter_grid(**values):
+
+    """
+    full factorial combination of parameter values
+
+    parameters
+    ----------
+    **values : iterable
+        values per parameter name, e.g.
+        parameter_grid(invest_el_lv_1_storage=[200, 300], prl_weeks=[0, 13])
+
+    returns
+    -------
+    list of dict
+        one dictionary per combination of the given values
+
+    """
+
+    names = sorted(values)
+    return [dict(zip(names, combination)) for combination in
+            itertools.product(*[list(values[name]) for name in names])]
+
+
+def order_neighbours(parameter_sets):
+
+    """
+    orders parameter sets such that similar sets follow each other
+
+    parameters
+    ----------
+    parameter_sets : list of dict
+        parameter overrides
+
+    returns
+    -------
+    list of int
+        indices of the parameter sets in the order of a greedy nearest
+        neighbour path starting from the first set; the distance is measured
+        on the parameter values scaled to their range within the sweep
+
+    """
+
+    if len(parameter_sets) < 3:
+        return list(range(len(parameter_sets)))
+    names = sorted(set().union(*parameter_sets))
+    values = np.array([[float(gridcon.merge_parameters(p)[name])
+                        for name in names] for p in parameter_sets])
+    span = values.max(axis=0) - values.min(axis=0)
+    span[span == 0] = 1
+    values = values / span
+
+    order = [0]
+    remaining = np.ones(len(values), dtype=bool)
+    remaining[0] = False
+    for _ in range(len(values) - 1):
+        distance = np.abs(values - values[order[-1]]).sum(axis=1)
+        distance[~remaining] = np.inf
+        following = int(distance.argmin())
+        order.append(following)
+        remaining[following] = False
+    return order
+
+##################################################################################
+# WORKER PROCESSES
+##################################################################################
+
+def _solve_parameter_set(task):
+
+    # solves one parameter set and returns the parameters together with the
+    # summary of the results; errors are reported in the column "error"
+    # instead of aborting the whole sweep;
+
+    index, parameters, options = task
+    row = {'scenario': index}
+    row.update(parameters)
+    try:
+        p = gridcon.merge_parameters(parameters)
+        data = gridcon.read_profile(
+            options['filename'], options['number_timesteps'],
+            list(gridcon.PROFILE_COLUMNS))
+        energysystem = gridcon.create_energysystem(
+            data, p, options['number_timesteps'])
+        om = gridcon.create_model(energysystem)
+        gridcon.solve_model(om, solver=options['solver'], debug=False,
+                            tee_switch=False,
+                            solver_threads=options['solver_threads'])
+        results = gridcon.extract_results(energysystem, p)
+        row.update(results.summary)
+        row['error'] = None
+        if options['cache'] is not None:
+            options['cache'].put(scenario_key(
+                data, p, options['number_timesteps'], options['solver']),
+                results)
+    except Exception as e:
+        logging.exception('Scenario {0} failed'.format(index))
+        row['error'] = repr(e)
+    return row
+
+
+def _solve_parameter_chain(task):
+
+    # solves a chain of parameter sets which differ only in cost parameters on
+    # one reusable model, each solve warm started from the previous one; the
+    # first warm-started solve of the chain is also solved cold, so that its
+    # iterations saved are measured against the same scenario;
+
+    indices, parameter_sets, options = task
+    rows = []
+    model = None
+    try:
+        data = gridcon.read_profile(
+            options['filename'], options['number_timesteps'],
+            list(gridcon.PROFILE_COLUMNS))
+        model = ReusableModel(data, parameter_sets[0],
+                              options['number_timesteps'],
+                              solver=options['solver'],
+                              solver_threads=options['solver_threads'])
+        for position, (index, parameters) in enumerate(
+                zip(indices, parameter_sets)):
+            row = {'scenario': index}
+            row.update(parameters)
+            try:
+                p = gridcon.merge_parameters(parameters)
+                costs = {k: v for k, v in p.items() if k in COST_PARAMETERS}
+                row.update(model.solve(warmstart=True,
+                                       cold_reference=position == 1,
+                                       **costs))
+                row['error'] = None
+                if options['cache'] is not None:
+                    options['cache'].put(
+                        scenario_key(data, p, options['number_timesteps'],
+                                     options['solver']),
+                        gridcon.extract_results(model.energysystem, p))
+            except Exception as e:
+                logging.exception('Scenario {0} failed'.format(index))
+                row['error'] = repr(e)
+            rows.append(row)
+    except Exception as e:
+        logging.exception('Model for scenarios {0} failed'.format(indices))
+        done = set(row['scenario'] for row in rows)
+        for index, parameters in zip(indices, parameter_sets):
+            if index not in done:
+                row = {'scenario': index, 'error': repr(e)}
+                row.update(parameters)
+                rows.append(row)
+    finally:
+        if model is not None:
+            model.close()
+    return rows
+
+
+def _warmstart_chains(parameter_sets, n_chains):
+
+    # groups the parameter sets by their non-cost parameters (which need a
+    # model of their own), orders each group by similarity and cuts it into
+    # contiguous chains so that all workers are busy;
+
+    groups = {}
+    for i, p in enumerate(parameter_sets):
+        structure = tuple(sorted((k, v) for k, v in p.items()
+                                 if k not in COST_PARAMETERS))
+        groups.setdefault(structure, []).append(i)
+
+    chains = []
+    chain_length = max(1, -(-len(parameter_sets) // n_chains))
+    for members in groups.values():
+        order = order_neighbours([parameter_sets[i] for i in members])
+        ordered = [members[j] for j in order]
+        for start in range(0, len(ordered), chain_length):
+            chains.append(ordered[start:start + chain_length])
+    return chains
+
+##################################################################################
+# PARAMETER SWEEP
+##################################################################################
+
+def sweep_storage_size(parameter_sets, filename="GridCon1_Profile.csv",
+                       number_timesteps=(96*366), solver='cbc',
+                       max_workers=None, solver_threads=1, warmstart=False,
+                       cache=None):
+
+    """
+    solves the GridCon model for several parameter sets in parallel
+
+    parameters
+    ----------
+    parameter_sets : list of dict
+        parameter overrides per run (see GridCon_storage.DEFAULT_PARAMETERS),
+        e.g. the output of parameter_grid
+    filename : str
+        profile file passed to read_profile
+    number_timesteps : int
+        number of 15 minutes timesteps of each run
+    solver : str
+        name of the solver used by pyomo
+    max_workers : int
+        maximum number of worker processes; defaults to the number of cores
+        divided by solver_threads
+    solver_threads : int
+        number of threads each solver may use
+    warmstart : bool
+        if true, similar parameter sets are solved one after another on a
+        reusable model per worker, each solve starting from the previous
+        solution (see GridCon_model.ReusableModel.solve)
+    cache : GridCon_cache.ResultCache
+        if given, parameter sets found in the cache are not solved again and
+        the solved ones are added to it
+
+    returns
+    -------
+    pandas.DataFrame
+        one row per parameter set (in the given order) with the parameter
+        overrides, the sized capacities, the cost breakdown and the column
+        "error" which is None for successful runs; with warmstart, the
+        columns "iterations" and "warm_started" report the solver
+        iterations and "iterations_saved" the iterations saved by the first
+        warm-started solve of each chain against a cold solve of the same
+        parameter set (None for the others); with a cache, the column "cached" marks the parameter
+        sets loaded from it
+
+    """
+
+    parameter_sets = [dict(p) for p in parameter_sets]
+
+    # unknown parameter names are rejected before any process is started;
+
+    for p in parameter_sets:
+        gridcon.merge_parameters(p)
+
+    # the profile is converted into the binary profile cache before the
+    # workers start, which then map the same file into memory;
+
+    data = gridcon.read_profile(filename, number_timesteps,
+                                list(gridcon.PROFILE_COLUMNS))
+
+    # parameter sets found in the result cache are not passed to the workers;
+
+    rows = []
+    pending = list(range(len(parameter_sets)))
+    if cache is not None:
+        for i, p in enumerate(parameter_sets):
+            results = cache.get(scenario_key(data, p, number_timesteps,
+                                             solver))
+            if results is not None:
+                row = {'scenario': i}
+                row.update(p)
+                row.update(results.summary)
+                row['error'] = None
+                row['cached'] = True
+                rows.append(row)
+        cached = set(row['scenario'] for row in rows)
+        pending = [i for i in pending if i not in cached]
+        logging.info('{0} parameter sets loaded from the result cache'
+                     .format(len(cached)))
+        if not pending:
+            return _sweep_frame(rows, cache)
+
+    if max_workers is None:
+        max_workers = max(1, (os.cpu_count() or 1) // solver_threads)
+    max_workers = max(1, min(max_workers, len(pending)))
+
+    options = {'filename': filename, 'number_timesteps': number_timesteps,
+               'solver': solver, 'solver_threads': solver_threads,
+               'cache': cache}
+    if warmstart:
+        chains = [[pending[j] for j in chain] for chain in _warmstart_chains(
+            [parameter_sets[i] for i in pending], max_workers)]
+        tasks = [(chain, [parameter_sets[i] for i in chain], options)
+                 for chain in chains]
+        solve = _solve_parameter_chain
+    else:
+        tasks = [(i, parameter_sets[i], options) for i in pending]
+        solve = _solve_parameter_set
+
+    logging.info('Sweep over {0} parameter sets with {1} worker(s)'.format(
+        len(pending), max_workers))
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(solve, task) for task in tasks]
+        for future in as_completed(futures):
+            finished = future.result()
+            if isinstance(finished, dict):
+                finished = [finished]
+            for row in finished:
+                logging.info('Scenario {0} finished'.format(row['scenario']))
+            rows.extend(finished)
+
+    return _sweep_frame(rows, cache)
+
+
+def _sweep_frame(rows, cache=None):
+
+    # returns the rows of a sweep as pandas.DataFrame in the order of the
+    # parameter sets; with a cache, the solved rows are marked as not cached;
+
+    frame = pd.DataFrame(rows).sort_values('scenario').set_index('scenario')
+    if cache is not None:
+        if 'cached' in frame:
+            frame['cached'] = frame['cached'].fillna(False).astype(bool)
+        else:
+            frame['cached'] = False
+    return frame
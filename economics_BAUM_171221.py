@@ -46,3 +46,66 @@ def epc(capex, n, u, wacc, cost_decrease = 0, oc = 0):
     # in case of repeated investments at fixed intervals u with decreasing costs;
 
    
+
+
+def epc_array(capex, n, u, wacc, cost_decrease = 0, oc = 0):
+
+    """
+    vectorised version of epc for the bulk evaluation of economic scenarios
+
+    parameters
+    ----------
+    capex, n, u, wacc, cost_decrease, oc : float or array_like
+        same meaning as in epc; scalars, numpy arrays and pandas Series are
+        accepted and broadcast against each other following the numpy
+        broadcasting rules
+
+    returns
+    -------
+    numpy.ndarray
+        equivalent periodical costs with the broadcast shape of the inputs
+
+    notes
+    -----
+    in contrast to epc, the limiting values of the closed form are used where
+    it evaluates to 0/0, i.e. an annuity factor of 1/n for wacc = 0 and a
+    repetition factor of n/u for (1-cost_decrease)/(1+wacc) = 1 or n = u
+
+    """
+
+    import numpy as np
+
+    capex, n, u, wacc, cost_decrease, oc = np.broadcast_arrays(
+        *[np.asarray(x, dtype=float) 
+          for x in (capex, n, u, wacc, cost_decrease, oc)])
+
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+
+        log_interest = np.log1p(wacc)
+        
+        # (1+wacc)**n - 1 is evaluated as expm1(n*log1p(wacc)) which keeps
+        # full precision for small values of wacc;
+        
+        annuity_factor = np.where(
+            wacc == 0, 1 / n, 
+            wacc / -np.expm1(-n * log_interest))
+
+        # for wacc = 0 the annuity is simply the investment divided by the 
+        # number of years;
+
+        q = (1 - cost_decrease) / (1 + wacc)
+        log_q = np.log1p(-cost_decrease) - log_interest
+        
+        # q is the ratio of the discounted costs of two subsequent investments;
+
+        repetition_factor = np.where(
+            q > 0, np.expm1(n * log_q) / np.expm1(u * log_q),
+            (1 - q**n) / (1 - q**u))
+        repetition_factor = np.where(log_q == 0, n / u, repetition_factor)
+        repetition_factor = np.where(n == u, 1., repetition_factor)
+
+        # (1-q**n)/(1-q**u) tends to n/u for q -> 1 and equals 1 for n = u;
+        # non-positive values of q (cost decrease of 100% or more) are 
+        # evaluated with the closed form;
+
+    return annuity_factor * capex * repetition_factor + oc
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of GridCon_sparse against the oemof model solved by cbc.
+
+The in-memory LP of GridCon_sparse has to reach the objective of the oemof
+model of GridCon_storage for the same profile and parameters. The profiles
+are short synthetic ones of GridCon_benchmark, so that cbc solves them in
+seconds. Run with "python -m pytest test_GridCon_sparse.py" or
+"python -m unittest test_GridCon_sparse".
+"""
+
+##################################################################################
+# IMPORTS
+##################################################################################
+
+import unittest
+
+import GridCon_storage_171221d as gridcon
+from GridCon_benchmark import TIMESTEPS_PER_DAY, available_solvers, \
+    synthetic_profile
+import GridCon_sparse
+
+##################################################################################
+# TESTS
+##################################################################################
+
+# parameter sets of the comparison: the defaults, a cheaper storage, the
+# storage without primary control reserve and a lossy storage with a wide
+# range of the state of charge;
+
+PARAMETER_SETS = [
+    {},
+    {'invest_el_lv_1_storage': 350, 'invest_grid': 800},
+    {'prl_on': 0},
+    {'icf': 0.9, 'ocf': 0.9, 'capacity_min': 0.05, 'capacity_max': 0.95,
+     'capacity_loss': 0.0001},
+    ]
+
+DAYS = 7
+
+
+def oemof_objective(data, parameters, number_timesteps):
+
+    # returns the objective of the oemof model solved by cbc;
+
+    energysystem = gridcon.create_energysystem(
+        data, parameters, number_timesteps, collapse_fixed_flows=True)
+    om = gridcon.create_model(energysystem)
+    gridcon.solve_model(om, solver='cbc', debug=False, tee_switch=False)
+    return energysystem.results.objective
+
+
+@unittest.skipUnless(available_solvers(['cbc']), 'cbc is not available')
+class TestSparseObjective(unittest.TestCase):
+
+    def setUp(self):
+        self.data = synthetic_profile(DAYS)
+        self.number_timesteps = DAYS * TIMESTEPS_PER_DAY
+
+    def test_objective_equals_oemof(self):
+        for parameters in PARAMETER_SETS:
+            with self.subTest(parameters=parameters):
+                p = gridcon.merge_parameters(parameters)
+                expected = oemof_objective(self.data, p,
+                                           self.number_timesteps)
+                objective = GridCon_sparse.optimise_sparse(
+                    self.data, p, self.number_timesteps).objective
+                self.assertAlmostEqual(objective / expected, 1, places=6)
+
+
+if __name__ == '__main__':
+    unittest.main()